@@ -0,0 +1,128 @@
+"""
+build_zipapp
+------------
+Empaqueta la aplicación en un único zipapp ejecutable (dist/nfs-app-aso.pyz)
+para instalarla en el montaje NFS.
+
+El archivo incluye los fuentes .py, sus .pyc precompilados con hash sin
+comprobar (zipimport los usa directamente, sin mirar fechas de los fuentes)
+y las imágenes. Arrancar la aplicación pasa a ser la lectura de un único
+archivo en lugar de decenas de stat/open de archivos pequeños en el servidor.
+
+Uso:
+    python3 build_zipapp.py [-o dist/nfs-app-aso.pyz] [--python "/usr/bin/env python3"]
+
+Los .pyc solo valen para la versión de Python con la que se construye; con
+otra versión zipimport usa los .py incluidos.
+"""
+
+import argparse
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(ROOT, "dist", "nfs-app-aso.pyz")
+PACKAGES = ["util", "forms"]
+ASSET_DIRS = ["imagenes"]
+ENTRY_POINT = "main.py"
+DEFAULT_INTERPRETER = "/usr/bin/env python3"
+
+# Fecha fija para que dos builds del mismo código den el mismo archivo
+_ZIP_DATE = (2020, 1, 1, 0, 0, 0)
+
+
+def _sources():
+    """(ruta en disco, ruta dentro del zip) de todos los módulos"""
+    yield os.path.join(ROOT, ENTRY_POINT), "__main__.py"
+    for package in PACKAGES:
+        package_dir = os.path.join(ROOT, package)
+        names = sorted(os.listdir(package_dir))
+        if "__init__.py" not in names:
+            # Los paquetes del proyecto son de espacio de nombres; dentro de
+            # un zip hace falta el __init__ para que zipimport los encuentre
+            yield None, f"{package}/__init__.py"
+        for name in names:
+            if name.endswith(".py"):
+                yield os.path.join(package_dir, name), f"{package}/{name}"
+
+
+def _assets():
+    for asset_dir in ASSET_DIRS:
+        for dirpath, _, filenames in sorted(os.walk(os.path.join(ROOT, asset_dir))):
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                yield path, os.path.relpath(path, ROOT).replace(os.sep, "/")
+
+
+def _add(zf: zipfile.ZipFile, arcname: str, data: bytes, compress: bool = True) -> None:
+    info = zipfile.ZipInfo(arcname, date_time=_ZIP_DATE)
+    info.external_attr = 0o644 << 16
+    info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    zf.writestr(info, data)
+
+
+def build(output: str = DEFAULT_OUTPUT, interpreter: str = DEFAULT_INTERPRETER) -> str:
+    """Construye el zipapp y devuelve su ruta"""
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="nfs_zipapp_")
+    tmp_output = output + ".tmp"
+    try:
+        with open(tmp_output, "wb") as f:
+            f.write(b"#!" + interpreter.encode("utf-8") + b"\n")
+            with zipfile.ZipFile(f, "w") as zf:
+                for path, arcname in _sources():
+                    source = b""
+                    if path is not None:
+                        with open(path, "rb") as src:
+                            source = src.read()
+                    _add(zf, arcname, source)
+
+                    # .pyc junto al .py (ubicación que busca zipimport)
+                    src_copy = os.path.join(tmp_dir, arcname)
+                    os.makedirs(os.path.dirname(src_copy), exist_ok=True)
+                    with open(src_copy, "wb") as tmp:
+                        tmp.write(source)
+                    pyc = py_compile.compile(
+                        src_copy, cfile=src_copy + "c", dfile=arcname, doraise=True,
+                        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+                    with open(pyc, "rb") as compiled:
+                        _add(zf, arcname + "c", compiled.read())
+
+                for path, arcname in _assets():
+                    with open(path, "rb") as asset:
+                        # Las imágenes ya van comprimidas
+                        _add(zf, arcname, asset.read(), compress=False)
+
+        os.chmod(tmp_output, 0o755)
+        os.replace(tmp_output, output)
+        return output
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Construye el zipapp de nfs-app-aso")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--python", default=DEFAULT_INTERPRETER,
+                        help="intérprete de la línea shebang")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    output = build(args.output, args.python)
+    with zipfile.ZipFile(output) as zf:
+        count = len(zf.namelist())
+    print(f"{output}: {count} archivos, {os.path.getsize(output)} bytes, "
+          f"Python {sys.version_info[0]}.{sys.version_info[1]}, "
+          f"{time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
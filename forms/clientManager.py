@@ -1,10 +1,18 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
 from tkinter.font import BOLD
 import util.generic as utl
 from util.service_manager import ServiceManager, ServiceError
 from util.backup_manager import BackupManager, BackupError
 from util.mount_manager import MountManager, MountError
+from util.mount_health import MountHealth
+from util.exports_manager import ExportsError
+from util.exports_diff import ExportsDiff
+from util.config_snapshot import ConfigSnapshot
+from util.instrumentation import Instrumentation
+from util.log import get_logger
+
+log = get_logger(__name__)
 
 class ClientManagerPanel:
     """Panel de gestión de clientes NFS y servicios"""
@@ -238,6 +246,10 @@ class ClientManagerPanel:
                  bg="#FF9800", fg="white", width=12,
                  command=self.add_to_fstab).pack(side="left", padx=5)
 
+        tk.Button(buttons_frame, text="Automount", font=("Times New Roman", 9),
+                 bg="#9C27B0", fg="white", width=12,
+                 command=self.add_automount).pack(side="left", padx=5)
+
         tk.Button(buttons_frame, text="Refresh", font=("Times New Roman", 9),
                  bg="#2196F3", fg="white", width=12,
                  command=self.refresh_mounts).pack(side="left", padx=5)
@@ -245,7 +257,7 @@ class ClientManagerPanel:
         # Treeview de montajes
         self.mounts_tree = ttk.Treeview(
             mount_frame,
-            columns=("Server", "Remote Path", "Mount Point", "Type", "Options"),
+            columns=("Server", "Remote Path", "Mount Point", "Type", "Options", "Health"),
             show="headings",
             height=5
         )
@@ -259,6 +271,10 @@ class ClientManagerPanel:
         self.mounts_tree.column("Mount Point", width=150)
         self.mounts_tree.column("Type", width=60)
         self.mounts_tree.column("Options", width=200)
+        self.mounts_tree.heading("Health", text="Health")
+        self.mounts_tree.column("Health", width=80)
+        self.mounts_tree.tag_configure("slow", foreground="orange")
+        self.mounts_tree.tag_configure("stale", foreground="red")
         self.mounts_tree.pack(fill="both", expand=True, padx=10, pady=(0, 10))
 
     def setup_backup_section(self, parent):
@@ -288,6 +304,10 @@ class ClientManagerPanel:
                  bg="#FF9800", fg="white", width=15,
                  command=self.restore_backup).pack(side="left", padx=5)
 
+        tk.Button(buttons_frame, text="Preview", font=("Times New Roman", 9),
+                 bg="#3F51B5", fg="white", width=15,
+                 command=self.preview_backup).pack(side="left", padx=5)
+
         tk.Button(buttons_frame, text="Delete Backup", font=("Times New Roman", 9),
                  bg="#f44336", fg="white", width=15,
                  command=self.delete_backup).pack(side="left", padx=5)
@@ -296,6 +316,26 @@ class ClientManagerPanel:
                  bg="#2196F3", fg="white", width=15,
                  command=self.refresh_backups).pack(side="left", padx=5)
 
+        tk.Button(buttons_frame, text="Rebuild Index", font=("Times New Roman", 9),
+                 bg="#607D8B", fg="white", width=15,
+                 command=self.rebuild_backup_index).pack(side="left", padx=5)
+
+        tk.Button(buttons_frame, text="Prune Old", font=("Times New Roman", 9),
+                 bg="#795548", fg="white", width=15,
+                 command=self.prune_backups).pack(side="left", padx=5)
+
+        # Snapshots de toda la configuración NFS (exports, fstab, nfs.conf...)
+        config_buttons = tk.Frame(backup_frame, bg="#ffffff")
+        config_buttons.pack(fill="x", padx=10, pady=(0, 10))
+
+        tk.Button(config_buttons, text="Snapshot Config", font=("Times New Roman", 9),
+                 bg="#009688", fg="white", width=15,
+                 command=self.snapshot_config).pack(side="left", padx=5)
+
+        tk.Button(config_buttons, text="Restore Config", font=("Times New Roman", 9),
+                 bg="#FF5722", fg="white", width=15,
+                 command=self.restore_config).pack(side="left", padx=5)
+
         # Treeview de backups
         self.backups_tree = ttk.Treeview(
             backup_frame,
@@ -312,6 +352,7 @@ class ClientManagerPanel:
         self.backups_tree.column("Size", width=80)
         self.backups_tree.column("Description", width=250)
         self.backups_tree.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        self.backups_tree.bind("<Double-1>", lambda e: self.preview_backup())
 
     def setup_bottom_buttons(self, parent):
         """Botones inferiores"""
@@ -326,6 +367,82 @@ class ClientManagerPanel:
                  bg="#f44336", fg="white", width=15, height=1,
                  command=self.ventana.destroy).pack(side="right", padx=5)
 
+        tk.Button(button_frame, text="Diagnostics", font=("Times New Roman", 11, BOLD),
+                 bg="#607D8B", fg="white", width=15, height=1,
+                 command=self.show_diagnostics).pack(side="left", padx=5)
+
+    # ========== DIAGNÓSTICO ==========
+
+    def show_diagnostics(self):
+        """Muestra los tiempos medidos de comandos externos y E/S de archivos"""
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Diagnostics")
+        dialog.geometry("900x450")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 900, 450)
+
+        status_label = tk.Label(dialog, font=("Times New Roman", 10), bg="#dce2ec")
+        status_label.pack(padx=10, pady=(10, 0), anchor="w")
+
+        columns = ("Operation", "Count", "Errors", "Avg", "p50", "p95", "Max", "Total", "Bytes")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=14)
+        for col in columns:
+            tree.heading(col, text=col if col in ("Operation", "Count", "Errors", "Bytes")
+                         else f"{col} (ms)")
+            tree.column(col, width=260 if col == "Operation" else 75, anchor="w" if col == "Operation" else "e")
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def refresh():
+            for item in tree.get_children():
+                tree.delete(item)
+            for stat in Instrumentation.summary():
+                tree.insert("", "end", values=(
+                    f"{stat['kind']}: {stat['op']}", stat["count"], stat["errors"],
+                    f"{stat['avg_ms']:.1f}", f"{stat['p50_ms']:.0f}", f"{stat['p95_ms']:.0f}",
+                    f"{stat['max_ms']:.1f}", f"{stat['total_ms']:.0f}", stat["bytes"]))
+            status_label.config(text="Medición activa" if Instrumentation.enabled
+                                else "Medición desactivada (activar o lanzar con NFS_MANAGER_TRACE=1)")
+            toggle_button.config(text="Disable" if Instrumentation.enabled else "Enable")
+
+        def toggle():
+            if Instrumentation.enabled:
+                Instrumentation.disable()
+            else:
+                Instrumentation.enable()
+            refresh()
+
+        def reset():
+            Instrumentation.reset()
+            refresh()
+
+        def export_json():
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=".json",
+                                                initialfile="nfs-manager-trace.json",
+                                                filetypes=[("JSON", "*.json")])
+            if not path:
+                return
+            try:
+                Instrumentation.dump(path)
+                messagebox.showinfo("Éxito", f"Mediciones guardadas en\n{path}", parent=dialog)
+            except OSError as e:
+                messagebox.showerror("Error", f"No se pudo guardar:\n{e}", parent=dialog)
+
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=10)
+
+        toggle_button = tk.Button(button_frame, font=("Times New Roman", 10),
+                                  bg="#4CAF50", fg="white", width=12, command=toggle)
+        toggle_button.pack(side="left", padx=5)
+
+        for text, color, command in (("Refresh", "#2196F3", refresh),
+                                     ("Reset", "#FF9800", reset),
+                                     ("Export JSON", "#795548", export_json),
+                                     ("Close", "#9E9E9E", dialog.destroy)):
+            tk.Button(button_frame, text=text, font=("Times New Roman", 10),
+                     bg=color, fg="white", width=12, command=command).pack(side="left", padx=5)
+
+        refresh()
+
     # ========== MÉTODOS DE SERVICIO ==========
 
     def service_start(self):
@@ -397,7 +514,7 @@ class ClientManagerPanel:
         except Exception as e:
             self.status_label.config(text="Error", fg="red")
             self.enabled_label.config(text="Error", fg="red")
-            print(f"[ERROR] refresh_service_status: {e}")
+            log.error("refresh_service_status: %s", e)
 
     # ========== MÉTODOS DE EXPORTACIONES ==========
 
@@ -452,7 +569,7 @@ class ClientManagerPanel:
                 ))
 
         except Exception as e:
-            print(f"[ERROR] refresh_clients: {e}")
+            log.error("refresh_clients: %s", e)
 
     # ========== MÉTODOS DE MONTAJE ==========
 
@@ -602,7 +719,7 @@ class ClientManagerPanel:
                     options = presets.get(preset_name, "rw,sync")
 
                 # Montar directamente sin test previo
-                print(f"[INFO] Intentando montar {server}:{remote} en {mount_point}")
+                log.info("Intentando montar %s:%s en %s", server, remote, mount_point)
                 MountManager.mount_nfs(server, remote, mount_point, options)
                 dialog.destroy()
                 messagebox.showinfo("Éxito", f"Montado exitosamente en:\n{mount_point}\n\nPuede acceder a los archivos en esa ruta.")
@@ -610,8 +727,8 @@ class ClientManagerPanel:
 
             except MountError as e:
                 error_msg = str(e)
+                log.error("Fallo al montar %s:%s en %s: %s", server, remote, mount_point, error_msg)
                 messagebox.showerror("Error de Montaje", f"No se pudo montar:\n\n{error_msg}\n\nVerifique:\n- Servicio NFS corriendo en servidor\n- Ruta exportada correctamente\n- Permisos de red y firewall", parent=dialog)
-                print(f"[ERROR] {error_msg}")
 
         button_frame = tk.Frame(dialog, bg="#dce2ec")
         button_frame.pack(pady=10)
@@ -642,17 +759,85 @@ class ClientManagerPanel:
                 messagebox.showinfo("Éxito", "Desmontado correctamente")
                 self.refresh_mounts()
             except MountError as e:
-                # Intentar forzar desmontaje
-                retry = messagebox.askyesno("Error",
-                                           f"No se pudo desmontar:\n{e}\n\n"
-                                           f"¿Intentar forzar desmontaje?")
-                if retry:
-                    try:
-                        MountManager.unmount_nfs(mount_point, force=True)
-                        messagebox.showinfo("Éxito", "Desmontado forzosamente")
-                        self.refresh_mounts()
-                    except MountError as e2:
-                        messagebox.showerror("Error", f"No se pudo desmontar:\n{e2}")
+                # Mostrar qué procesos lo mantienen ocupado antes de ofrecer
+                # un desmontaje diferido o forzado
+                self.show_mount_users(mount_point, str(e))
+
+    def show_mount_users(self, mount_point, error_msg):
+        """Lista los procesos que usan el montaje y ofrece desmontaje lazy o forzado"""
+        try:
+            result = MountManager.find_mount_users(mount_point)
+        except MountError as e:
+            result = {"processes": [], "scanned": 0, "denied": 0, "error": str(e)}
+
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Montaje ocupado")
+        dialog.geometry("700x400")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 700, 400)
+
+        tk.Label(dialog, text=f"No se pudo desmontar {mount_point}:\n{error_msg}",
+                font=("Times New Roman", 10, BOLD), bg="#dce2ec",
+                wraplength=650, justify="left").pack(padx=10, pady=10)
+
+        processes = result.get("processes", [])
+        summary = f"{len(processes)} proceso(s) usando el montaje"
+        if result.get("denied"):
+            summary += f" ({result['denied']} procesos no se pudieron inspeccionar)"
+        if result.get("error"):
+            summary = f"No se pudieron listar los procesos: {result['error']}"
+        tk.Label(dialog, text=summary, font=("Times New Roman", 10),
+                bg="#dce2ec").pack(padx=10, anchor="w")
+
+        tree = ttk.Treeview(dialog, columns=("PID", "User", "Command", "Uses"),
+                            show="headings", height=8)
+        tree.heading("PID", text="PID")
+        tree.heading("User", text="User")
+        tree.heading("Command", text="Command")
+        tree.heading("Uses", text="Uses")
+        tree.column("PID", width=70)
+        tree.column("User", width=100)
+        tree.column("Command", width=330)
+        tree.column("Uses", width=150)
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+        for proc in processes:
+            tree.insert("", "end", values=(
+                proc.get("pid", ""),
+                proc.get("user", ""),
+                proc.get("cmdline") or proc.get("command", ""),
+                ", ".join(proc.get("uses", []))
+            ))
+
+        def do_unmount(lazy=False, force=False):
+            try:
+                MountManager.unmount_nfs(mount_point, force=force, lazy=lazy)
+                dialog.destroy()
+                messagebox.showinfo("Éxito", "Desmontaje diferido solicitado" if lazy
+                                    else "Desmontado forzosamente")
+                self.refresh_mounts()
+            except MountError as e2:
+                messagebox.showerror("Error", f"No se pudo desmontar:\n{e2}", parent=dialog)
+
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=10)
+
+        tk.Button(button_frame, text="Lazy Unmount", font=("Times New Roman", 10),
+                 bg="#FF9800", fg="white", width=14,
+                 command=lambda: do_unmount(lazy=True)).pack(side="left", padx=5)
+
+        def confirm_force():
+            if messagebox.askyesno("Confirmar",
+                                   "Forzar el desmontaje puede corromper el trabajo en curso "
+                                   "de los procesos listados.\n¿Continuar?", parent=dialog):
+                do_unmount(force=True)
+
+        tk.Button(button_frame, text="Force Unmount", font=("Times New Roman", 10),
+                 bg="#f44336", fg="white", width=14,
+                 command=confirm_force).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Cancel", font=("Times New Roman", 10),
+                 bg="#9E9E9E", fg="white", width=14,
+                 command=dialog.destroy).pack(side="left", padx=5)
 
     def add_to_fstab(self):
         """Añade un montaje seleccionado a /etc/fstab"""
@@ -704,6 +889,87 @@ class ClientManagerPanel:
                  bg="#f44336", fg="white", width=12,
                  command=dialog.destroy).pack(side="left", padx=5)
 
+    def add_automount(self):
+        """Convierte el montaje seleccionado en un automontaje systemd bajo demanda"""
+        selection = self.mounts_tree.selection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Seleccione un montaje para automontar")
+            return
+
+        item = self.mounts_tree.item(selection[0])
+        server = item["values"][0]
+        remote_path = item["values"][1]
+        mount_point = item["values"][2]
+
+        # Las opciones de la tabla son las efectivas del kernel (addr=,
+        # clientaddr=, vers=...): se parte de las de fstab o de las por defecto
+        options = MountManager.get_mount_options_presets()["Default"]
+        try:
+            entry = MountManager.load_fstab().get(mount_point)
+            if entry is not None:
+                options = entry.options
+        except MountError as e:
+            log.warning("No se pudo leer fstab: %s", e)
+
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Automount (systemd)")
+        dialog.geometry("450x290")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 450, 290)
+
+        tk.Label(dialog, text=f"Montar {server}:{remote_path}\nen {mount_point} bajo demanda",
+                font=("Times New Roman", 10, BOLD), bg="#dce2ec").pack(pady=10)
+
+        fields_frame = tk.Frame(dialog, bg="#dce2ec")
+        fields_frame.pack(pady=5)
+
+        tk.Label(fields_frame, text="Desmontar tras inactividad (s):",
+                font=("Times New Roman", 10), bg="#dce2ec").grid(row=0, column=0, sticky="w", pady=3)
+        idle_entry = ttk.Entry(fields_frame, font=("Times New Roman", 10), width=8)
+        idle_entry.grid(row=0, column=1, padx=5)
+        idle_entry.insert(0, "600")
+
+        tk.Label(fields_frame, text="Timeout de montaje (s):",
+                font=("Times New Roman", 10), bg="#dce2ec").grid(row=1, column=0, sticky="w", pady=3)
+        timeout_entry = ttk.Entry(fields_frame, font=("Times New Roman", 10), width=8)
+        timeout_entry.grid(row=1, column=1, padx=5)
+        timeout_entry.insert(0, "30")
+
+        tk.Label(fields_frame, text="Opciones:",
+                font=("Times New Roman", 10), bg="#dce2ec").grid(row=2, column=0, sticky="w", pady=3)
+        options_entry = ttk.Entry(fields_frame, font=("Times New Roman", 10), width=25)
+        options_entry.grid(row=2, column=1, padx=5)
+        options_entry.insert(0, options)
+
+        tk.Label(dialog, text="El montaje actual se desmontará para activar el automontaje",
+                font=("Times New Roman", 9), bg="#dce2ec", fg="green").pack(pady=5)
+
+        def do_add():
+            idle = idle_entry.get().strip()
+            timeout = timeout_entry.get().strip()
+            if not idle.isdigit() or not timeout.isdigit():
+                messagebox.showerror("Error", "Los tiempos deben ser valores numéricos", parent=dialog)
+                return
+            try:
+                unit = MountManager.add_automount(server, remote_path, mount_point,
+                                                  options_entry.get().strip(),
+                                                  idle_timeout=int(idle), mount_timeout=int(timeout))
+                dialog.destroy()
+                messagebox.showinfo("Éxito", f"Automontaje activado:\n{unit}")
+            except MountError as e:
+                messagebox.showerror("Error", f"No se pudo crear el automontaje:\n{e}", parent=dialog)
+
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=10)
+
+        tk.Button(button_frame, text="Create", font=("Times New Roman", 10),
+                 bg="#4CAF50", fg="white", width=12,
+                 command=do_add).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Cancel", font=("Times New Roman", 10),
+                 bg="#f44336", fg="white", width=12,
+                 command=dialog.destroy).pack(side="left", padx=5)
+
     def refresh_mounts(self):
         """Actualiza la lista de montajes NFS"""
         try:
@@ -715,22 +981,53 @@ class ClientManagerPanel:
             mounts = MountManager.get_mounted_nfs()
 
             # Llenar treeview
+            rows = {}
             for mount in mounts:
-                self.mounts_tree.insert("", "end", values=(
+                rows[mount.get("mount_point", "")] = self.mounts_tree.insert("", "end", values=(
                     mount.get("server", ""),
                     mount.get("remote_path", ""),
                     mount.get("mount_point", ""),
                     mount.get("type", ""),
-                    mount.get("options", "")
+                    mount.get("options", ""),
+                    "checking..."
                 ))
 
             if not mounts:
                 self.mounts_tree.insert("", "end", values=(
-                    "No hay montajes NFS activos", "", "", "", ""
+                    "No hay montajes NFS activos", "", "", "", "", ""
                 ))
+                return
+
+            # Sondear la salud en segundo plano: un montaje colgado no debe
+            # bloquear la ventana
+            import threading
+            results = {}
+
+            def probe():
+                results.update(MountHealth.probe(list(rows)))
+
+            worker = threading.Thread(target=probe, daemon=True)
+            worker.start()
+            self.ventana.after(100, self._apply_mount_health, worker, rows, results)
 
         except Exception as e:
-            print(f"[ERROR] refresh_mounts: {e}")
+            log.error("refresh_mounts: %s", e)
+
+    def _apply_mount_health(self, worker, rows, results):
+        """Vuelca en el treeview el resultado de las sondas cuando terminan"""
+        if worker.is_alive():
+            self.ventana.after(100, self._apply_mount_health, worker, rows, results)
+            return
+        for mount_point, item in rows.items():
+            if not self.mounts_tree.exists(item):
+                continue
+            info = results.get(mount_point, {})
+            status = info.get("status", "unknown")
+            label = status
+            if info.get("latency") is not None:
+                label = f"{status} ({info['latency'] * 1000:.0f} ms)"
+            self.mounts_tree.set(item, "Health", label)
+            self.mounts_tree.item(item, tags=(status,))
 
     # ========== MÉTODOS DE BACKUP ==========
 
@@ -756,6 +1053,8 @@ class ClientManagerPanel:
                 dialog.destroy()
                 messagebox.showinfo("Éxito", f"Backup creado:\n{filename}")
                 self.refresh_backups()
+                # Aplicar la retención en segundo plano
+                self.prune_backups(silent=True)
             except BackupError as e:
                 messagebox.showerror("Error", f"No se pudo crear el backup:\n{e}")
 
@@ -780,11 +1079,39 @@ class ClientManagerPanel:
         item = self.backups_tree.item(selection[0])
         filename = item["values"][0]
 
-        confirm = messagebox.askyesno("Confirmar Restauración",
-                                     f"¿Está seguro de restaurar el backup?\n\n"
-                                     f"Archivo: {filename}\n\n"
-                                     f"Se creará un backup automático del estado actual.")
-        if confirm:
+        try:
+            changes = ExportsDiff.compare("current", f"backup:{filename}")
+            preview = ExportsDiff.format(changes)
+            if not preview:
+                preview = ["El backup es idéntico a la configuración actual."]
+        except ExportsError as e:
+            preview = [f"No se pudo calcular la vista previa: {e}"]
+
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Confirmar Restauración")
+        dialog.geometry("700x450")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 700, 450)
+
+        tk.Label(dialog, text=f"Archivo: {filename}\n"
+                              f"Cambios que se aplicarán a /etc/exports "
+                              f"(se creará un backup automático del estado actual):",
+                font=("Times New Roman", 10, BOLD), bg="#dce2ec",
+                justify="left").pack(padx=10, pady=10, anchor="w")
+
+        text = scrolledtext.ScrolledText(dialog, font=("Courier New", 9), height=18)
+        text.pack(fill="both", expand=True, padx=10, pady=5)
+        text.tag_config("added", foreground="#2e7d32")
+        text.tag_config("removed", foreground="#c62828")
+        text.tag_config("changed", foreground="#1565c0")
+        for line in preview:
+            marker = line.lstrip()[:1]
+            tag = {"+": "added", "-": "removed", "~": "changed"}.get(marker, "")
+            text.insert("end", line + "\n", tag)
+        text.config(state="disabled")
+
+        def do_restore():
+            dialog.destroy()
             try:
                 BackupManager.restore_backup(filename)
                 messagebox.showinfo("Éxito", "Backup restaurado correctamente")
@@ -792,6 +1119,71 @@ class ClientManagerPanel:
             except BackupError as e:
                 messagebox.showerror("Error", f"No se pudo restaurar el backup:\n{e}")
 
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=10)
+
+        tk.Button(button_frame, text="Restore", font=("Times New Roman", 10),
+                 bg="#2196F3", fg="white", width=14,
+                 command=do_restore).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Cancel", font=("Times New Roman", 10),
+                 bg="#9E9E9E", fg="white", width=14,
+                 command=dialog.destroy).pack(side="left", padx=5)
+
+    def preview_backup(self):
+        """Muestra los metadatos de un backup y carga su contenido por partes"""
+        selection = self.backups_tree.selection()
+        if not selection:
+            messagebox.showwarning("Advertencia", "Seleccione un backup para ver")
+            return
+
+        filename = self.backups_tree.item(selection[0])["values"][0]
+        try:
+            info = BackupManager.get_backup_info(filename)
+        except BackupError as e:
+            messagebox.showerror("Error", f"No se pudo leer el backup:\n{e}")
+            return
+        if info is None:
+            messagebox.showwarning("Advertencia", f"El backup no existe: {filename}")
+            return
+
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title(f"Backup {filename}")
+        dialog.geometry("700x500")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 700, 500)
+
+        details = (f"Fecha: {info['date']}    Entradas: {info['exports_count']}    "
+                   f"Tamaño: {info['size']} B (almacenado: {info['stored_size']} B)\n"
+                   f"SHA-256: {info['sha256']}\n"
+                   f"Descripción: {info['description'] or '-'}")
+        tk.Label(dialog, text=details, font=("Times New Roman", 10), bg="#dce2ec",
+                justify="left").pack(padx=10, pady=10, anchor="w")
+
+        text = scrolledtext.ScrolledText(dialog, font=("Courier New", 9))
+        text.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        # Un fragmento por ciclo del bucle de eventos: la ventana responde
+        # aunque el backup sea muy grande
+        chunks = BackupManager.iter_backup_content(filename)
+
+        def load_next():
+            if not dialog.winfo_exists():
+                chunks.close()
+                return
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                text.config(state="disabled")
+                return
+            except BackupError as e:
+                text.insert("end", f"\n[Error leyendo el backup: {e}]")
+                return
+            text.insert("end", chunk)
+            dialog.after(1, load_next)
+
+        dialog.after(1, load_next)
+
     def delete_backup(self):
         """Elimina un backup seleccionado"""
         selection = self.backups_tree.selection()
@@ -812,6 +1204,165 @@ class ClientManagerPanel:
             except BackupError as e:
                 messagebox.showerror("Error", f"No se pudo eliminar el backup:\n{e}")
 
+    def prune_backups(self, silent=False):
+        """Aplica la política de retención en segundo plano sin bloquear la ventana"""
+        outcome = {}
+
+        def done(result, error):
+            outcome["result"] = result
+            outcome["error"] = error
+
+        worker = BackupManager.prune_async(callback=done)
+
+        def check():
+            if worker.is_alive():
+                self.ventana.after(200, check)
+                return
+            if outcome.get("error"):
+                if not silent:
+                    messagebox.showerror("Error", f"No se pudo aplicar la retención:\n{outcome['error']}")
+                return
+            result = outcome.get("result") or {}
+            if result.get("removed"):
+                self.refresh_backups()
+            if not silent:
+                messagebox.showinfo("Retención",
+                                    f"Backups conservados: {result.get('kept', 0)}\n"
+                                    f"Backups eliminados: {len(result.get('removed', []))}")
+
+        self.ventana.after(200, check)
+
+    def snapshot_config(self):
+        """Guarda un snapshot de toda la configuración NFS"""
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Snapshot Config")
+        dialog.geometry("400x150")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 400, 150)
+
+        tk.Label(dialog, text="Snapshot Description (optional):",
+                font=("Times New Roman", 10), bg="#dce2ec").pack(pady=10)
+
+        desc_entry = ttk.Entry(dialog, font=("Times New Roman", 10), width=40)
+        desc_entry.pack(pady=5)
+
+        def do_snapshot():
+            try:
+                name = ConfigSnapshot.create(desc_entry.get().strip())
+                dialog.destroy()
+                members = ConfigSnapshot.get(name)["members"]
+                messagebox.showinfo("Éxito", f"Snapshot creado:\n{name}\n\n"
+                                    + "\n".join(sorted(members)))
+            except BackupError as e:
+                messagebox.showerror("Error", f"No se pudo crear el snapshot:\n{e}")
+
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=15)
+
+        tk.Button(button_frame, text="Create", font=("Times New Roman", 10),
+                 bg="#4CAF50", fg="white", width=10,
+                 command=do_snapshot).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Cancel", font=("Times New Roman", 10),
+                 bg="#f44336", fg="white", width=10,
+                 command=dialog.destroy).pack(side="left", padx=5)
+
+    def restore_config(self):
+        """Restaura un snapshot de configuración completo o solo algunos archivos"""
+        snapshots = ConfigSnapshot.list()
+        if not snapshots:
+            messagebox.showwarning("Advertencia", "No hay snapshots de configuración")
+            return
+
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Restore Config")
+        dialog.geometry("650x450")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 650, 450)
+
+        tk.Label(dialog, text="Snapshot:", font=("Times New Roman", 10),
+                bg="#dce2ec").pack(padx=10, pady=(10, 0), anchor="w")
+        labels = [f"{s['name']}  {s.get('description', '')}" for s in snapshots]
+        snapshot_combo = ttk.Combobox(dialog, values=labels, state="readonly", width=80)
+        snapshot_combo.current(0)
+        snapshot_combo.pack(padx=10, pady=5, anchor="w")
+
+        tk.Label(dialog, text="Archivos a restaurar (Ctrl+clic para elegir varios):",
+                font=("Times New Roman", 10), bg="#dce2ec").pack(padx=10, anchor="w")
+        members_tree = ttk.Treeview(dialog, columns=("File", "Status"),
+                                    show="headings", height=10)
+        members_tree.heading("File", text="File")
+        members_tree.heading("Status", text="Status")
+        members_tree.column("File", width=450)
+        members_tree.column("Status", width=150)
+        members_tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def load_members(event=None):
+            for item in members_tree.get_children():
+                members_tree.delete(item)
+            name = snapshots[snapshot_combo.current()]["name"]
+            try:
+                status = ConfigSnapshot.compare(name)
+            except BackupError as e:
+                messagebox.showerror("Error", f"No se pudo comparar el snapshot:\n{e}", parent=dialog)
+                return
+            for path in sorted(status):
+                members_tree.insert("", "end", iid=path, values=(path, status[path]))
+            # Por defecto solo lo que ha cambiado
+            changed = [p for p, st in status.items() if st in ("modified", "missing")]
+            members_tree.selection_set(changed)
+
+        snapshot_combo.bind("<<ComboboxSelected>>", load_members)
+        load_members()
+
+        def do_restore(selected_only):
+            name = snapshots[snapshot_combo.current()]["name"]
+            members = None
+            if selected_only:
+                members = [p for p in members_tree.selection()
+                           if members_tree.set(p, "Status") != "new"]
+                if not members:
+                    messagebox.showwarning("Advertencia", "Seleccione archivos del snapshot",
+                                           parent=dialog)
+                    return
+            try:
+                result = ConfigSnapshot.restore(name, members)
+                dialog.destroy()
+                lines = [f"Restaurados: {len(result['restored'])}"]
+                if result["removed"]:
+                    lines.append(f"Eliminados: {', '.join(result['removed'])}")
+                if result["backup"]:
+                    lines.append(f"Estado anterior guardado en {result['backup']}")
+                messagebox.showinfo("Éxito", "\n".join(lines))
+                self.refresh_all()
+            except BackupError as e:
+                messagebox.showerror("Error", f"No se pudo restaurar la configuración:\n{e}",
+                                     parent=dialog)
+
+        button_frame = tk.Frame(dialog, bg="#dce2ec")
+        button_frame.pack(pady=10)
+
+        tk.Button(button_frame, text="Restore Selected", font=("Times New Roman", 10),
+                 bg="#FF9800", fg="white", width=15,
+                 command=lambda: do_restore(True)).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Restore All", font=("Times New Roman", 10),
+                 bg="#f44336", fg="white", width=15,
+                 command=lambda: do_restore(False)).pack(side="left", padx=5)
+
+        tk.Button(button_frame, text="Cancel", font=("Times New Roman", 10),
+                 bg="#9E9E9E", fg="white", width=15,
+                 command=dialog.destroy).pack(side="left", padx=5)
+
+    def rebuild_backup_index(self):
+        """Regenera el manifiesto de backups a partir de los archivos en disco"""
+        try:
+            records = BackupManager.rebuild_manifest()
+            messagebox.showinfo("Éxito", f"Índice regenerado: {len(records)} backups")
+            self.refresh_backups()
+        except BackupError as e:
+            messagebox.showerror("Error", f"No se pudo regenerar el índice:\n{e}")
+
     def refresh_backups(self):
         """Actualiza la lista de backups"""
         try:
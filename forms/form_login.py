@@ -2,22 +2,35 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.font import BOLD
 import util.generic as utl
-from forms.form_master import MasterPanel
+from util import startup
 import getpass
 import subprocess
+from util.log import get_logger
+
+log = get_logger(__name__)
 
 class App:
+    @staticmethod
+    def abrir_panel():
+        """
+        El panel principal (y con él ExportsManager y el resto de gestores)
+        solo se importa tras el login, para que la ventana de login aparezca
+        cuanto antes
+        """
+        from forms.form_master import MasterPanel
+        MasterPanel()
+
     def validar_login(self):
         usuario = self.usuario.get()
         contrasena = self.contrasena.get()
 
         # Login normal demo
         if usuario == "admin" and contrasena == "1234":
-            print("[INFO] Login demo exitoso")
+            log.info("Login demo exitoso")
             self.root_user = None  # No se usarán credenciales de root
             self.root_pass = None
             self.ventana.destroy()
-            MasterPanel()
+            self.abrir_panel()
             return
         # Login superusuario real
         try:
@@ -30,14 +43,14 @@ class App:
                 stderr=subprocess.PIPE
             )
             if proc.returncode == 0:
-                print(f"[OK] Usuario root válido: {usuario}")
+                log.info("Usuario root válido: %s", usuario)
                 self.root_user = usuario
                 self.root_pass = contrasena
                 self.ventana.destroy()
                 #MasterPanel(root_user=usuario, root_pass=contrasena)
-                MasterPanel()
+                self.abrir_panel()
             else:
-                print("[ERROR] Credenciales root incorrectas")
+                log.warning("Credenciales root incorrectas")
                 tk.messagebox.showerror("Error de login", "Usuario o contraseña root incorrectos.")
         except Exception as e:
             tk.messagebox.showerror("Error de login", f"No se pudo verificar root:\n{e}")
@@ -49,6 +62,7 @@ class App:
         self.ventana.config(bg="#fcfcfc")
         self.ventana.resizable(width=0, height=0)
         utl.centrar_ventana(self.ventana, 800, 500)
+        startup.mark("login_window")
 
         logo = utl.leer_imagen("imagenes/nfs.png", (200, 200))
 
@@ -88,7 +102,9 @@ class App:
         boton_login = tk.Button(frame_form_fill, text="Iniciar sesión", font=("Times New Roman", 15,BOLD),bg="#649af8", command=self.validar_login)
         boton_login.pack(fill=tk.X, padx=20, pady=20)
         boton_login.bind("<Return>", lambda event: self.validar_login())
+        startup.mark("login_widgets")
 
+        self.ventana.after_idle(startup.first_window)
         self.ventana.mainloop()
 
 if __name__ == "__main__":
@@ -3,36 +3,26 @@ from tkinter import ttk, messagebox
 from tkinter.font import BOLD
 import util.generic as utl
 import os
+import threading
+import time
 # Asegúrate de tener util.exports_manager y util.generic disponibles
-from util.exports_manager import ExportsManager, ExportsError
+from util.exports_manager import ExportsManager, ExportsError, ExportsConflictError
+from util.exports_access import AccessIndex
+from util.add_directory import Add, ProvisionError
+from util.export_capacity import (ExportCapacity, CACHE_TTL as CAPACITY_TTL, CRITICAL, MISSING,
+                                  UNAVAILABLE, WARNING, format_bytes, thresholds)
+from util.log import get_logger
 
-# ====================================================================
-# === 1. CLASE ADD CORREGIDA (Crea directorios si no existen) ========
-# ====================================================================
-class Add:
-    """Clase para manejar verificaciones y creación de directorios."""
-    @staticmethod
-    def check_directory(ruta):
-        """Verifica si la ruta existe y la crea si es necesario."""
-        # 1. Verificar si la ruta está vacía
-        if not ruta.strip():
-            raise ExportsError("La ruta del directorio no puede estar vacía.")
-
-        # 2. Verificar si el directorio existe
-        if not os.path.isdir(ruta):
-            print(f"[INFO] El directorio '{ruta}' no existe. Intentando crearlo...")
-            try:
-                # 3. Crear el directorio si no existe (Requiere permisos de root/sudo)
-                os.makedirs(ruta, mode=0o755, exist_ok=True)
-                print(f"[INFO] Directorio '{ruta}' creado exitosamente.")
-            except OSError as e:
-                # Capturar errores de permiso si no se ejecuta como root
-                raise ExportsError(f"Fallo al crear el directorio '{ruta}': {e}. ⚠️ Debe ejecutar la aplicación con 'sudo'.")
+log = get_logger(__name__)
 
-        print(f"[INFO] El directorio '{ruta}' es válido y existe.")
+# Fondo de las filas con cambios pendientes de aplicar
+PENDING_BG = "#fff2b3"
+# Texto de las exportaciones cerca de llenarse (umbrales de ExportCapacity)
+WARNING_FG = "#b36b00"
+CRITICAL_FG = "#c62828"
 
 # ====================================================================
-# === 2. CLASE MASTERPANEL (Lógica Principal) ========================
+# === CLASE MASTERPANEL (Lógica Principal) ========================
 # ====================================================================
 class MasterPanel:
         # NUEVO MÉTODO: Abrir Client Manager
@@ -91,7 +81,7 @@ class MasterPanel:
 
         # 4. Lógica de guardado/edición
         try:
-            entries = ExportsManager.list_parsed()
+            entries = self.leer_entradas()
             current_entry = next((e for e in entries if e["path"] == path_seleccionado), None)
 
             if current_entry is None:
@@ -129,11 +119,13 @@ class MasterPanel:
 
             new_hosts_expr = ' '.join(new_hosts)
 
-            # Aplicar cambios
-            ExportsManager.edit_entry(path_seleccionado, new_hosts_expr)
-
-            messagebox.showinfo("Éxito", f"Host '{host_ip}' en directorio '{path_seleccionado}' actualizado con opciones: {opciones_raw}.")
+            # Aplicar cambios (rechazado si otro modificó este directorio
+            # desde que se mostró)
+            if self.aplicar_cambios([{"op": "edit", "path": path_seleccionado, "hosts": new_hosts_expr}]):
+                messagebox.showinfo("Éxito", f"Host '{host_ip}' en directorio '{path_seleccionado}' actualizado con opciones: {opciones_raw}.")
             self.actualizar_hosts(None)
+        except ExportsConflictError as err:
+            self.conflicto(err)
         except ExportsError as err:
             messagebox.showerror("Error de NFS", f"Fallo al guardar Host:\n{err}")
         except Exception as e:
@@ -246,7 +238,7 @@ class MasterPanel:
 
         if messagebox.askyesno("Confirmar", f"¿Está seguro de eliminar el Host '{host_seleccionado}' del directorio:\n{path_seleccionado}?"):
             try:
-                entries = ExportsManager.list_parsed()
+                entries = self.leer_entradas()
                 current_entry = next((e for e in entries if e["path"] == path_seleccionado), None)
 
                 if current_entry is None: return
@@ -260,10 +252,11 @@ class MasterPanel:
                 new_hosts_expr = ' '.join(new_hosts)
 
                 # Aplicar el cambio: editar la entrada con la nueva lista de hosts
-                ExportsManager.edit_entry(path_seleccionado, new_hosts_expr)
-
-                messagebox.showinfo("Éxito", f"Host '{host_seleccionado}' eliminado y aplicado correctamente.")
+                if self.aplicar_cambios([{"op": "edit", "path": path_seleccionado, "hosts": new_hosts_expr}]):
+                    messagebox.showinfo("Éxito", f"Host '{host_seleccionado}' eliminado y aplicado correctamente.")
                 self.actualizar_hosts(None)
+            except ExportsConflictError as err:
+                self.conflicto(err)
             except ExportsError as err:
                 messagebox.showerror("Error de NFS", f"Fallo al eliminar Host:\n{err}")
             except Exception as e:
@@ -285,10 +278,10 @@ class MasterPanel:
             item = self.treeview.item(item_id)
             path_seleccionado = item["values"][0]
             antigua_ruta = path_seleccionado
-            print(f"[INFO] Editando directorio: {antigua_ruta}")
+            log.info("Editando directorio: %s", antigua_ruta)
 
             # 2️⃣ Buscar y recopilar TODAS las expresiones de hosts
-            entries = ExportsManager.list_parsed()
+            entries = self.leer_entradas()
             host_info_list = []
             host_line = ""
             current_entry = next((e for e in entries if e["path"] == path_seleccionado), None)
@@ -347,24 +340,27 @@ class MasterPanel:
                     # Mantener mismo host y opciones
                     hosts_expr = host_line
 
-                    # 🔑 LÓGICA DE RENOMBRE: Eliminar la antigua, Añadir la nueva
-
-                    # 1. Eliminar la antigua
-                    ExportsManager.remove_entry(antigua_ruta)
-
-                    # 2. Añadir la nueva entrada
-                    ExportsManager.add_entry(ruta_nueva, hosts_expr)
-
-                    messagebox.showinfo("Éxito", f"Directorio editado:\nDe: {antigua_ruta}\nA: {ruta_nueva}",parent=self.new_window )
+                    # 🔑 LÓGICA DE RENOMBRE: Eliminar la antigua y añadir la
+                    # nueva en una sola escritura
+                    if self.aplicar_cambios([
+                        {"op": "remove", "path": antigua_ruta},
+                        {"op": "add", "path": ruta_nueva, "hosts": hosts_expr},
+                    ]):
+                        messagebox.showinfo("Éxito", f"Directorio editado:\nDe: {antigua_ruta}\nA: {ruta_nueva}",parent=self.new_window )
                     self.new_window.destroy()
 
                     # Refrescar vista
                     self.actualizar_hosts(None)
                     self.refrescar_treeview()
 
+                except ExportsConflictError as err:
+                    self.new_window.destroy()
+                    self.conflicto(err)
                 except ExportsError as err:
                     # Captura errores específicos de NFS/filesystem
                     messagebox.showerror("Error de NFS", f"No se pudo editar el directorio:\n{err}")
+                except ProvisionError as err:
+                    messagebox.showerror("Error de directorio", f"No se pudo editar el directorio:\n{err}")
                 except Exception as err:
                     messagebox.showerror("Error", f"No se pudo editar el directorio:\n{err}")
 
@@ -394,16 +390,150 @@ class MasterPanel:
     def refrescar_treeview(self):
         """Limpia y recarga el Treeview de directorios con las entradas actuales de /etc/exports."""
         try:
+            seleccion = self.treeview.selection()
+            seleccionado = self.treeview.item(seleccion[0])["values"][0] if seleccion else None
+
             # Limpiar Treeview
             for item in self.treeview.get_children():
                 self.treeview.delete(item)
 
-            # Cargar entradas actualizadas
-            entries = ExportsManager.list_parsed()
+            # Cargar entradas actualizadas (con los cambios pendientes, si hay)
+            entries = self.leer_entradas()
             for e in entries:
-                self.treeview.insert("", "end", values=(e["path"],))
+                item = self.treeview.insert("", "end", values=self.valores(e["path"]),
+                                            tags=self.etiquetas(e["path"]))
+                # Mantener la selección para poder seguir editando el mismo directorio
+                if e["path"] == seleccionado:
+                    self.treeview.selection_set(item)
+            self.actualizar_capacidad()
         except Exception as err:
-            print(f"[ERROR] No se pudo leer /etc/exports: {err}")
+            log.error("No se pudo leer /etc/exports: %s", err)
+
+    def conflicto(self, err):
+        """Otro escritor cambió /etc/exports: avisar y recargar la vista"""
+        messagebox.showwarning("Conflicto", f"{err}\n\nSe recargarán los datos actuales.")
+        self.refrescar_treeview()
+        self.actualizar_hosts(None)
+
+    # ------------------------------------------------------------------
+    # --- MODO DIFERIDO (cambios pendientes) ---
+    # ------------------------------------------------------------------
+
+    def leer_entradas(self):
+        """Entradas que muestra el panel: /etc/exports más los cambios pendientes."""
+        if self.pending_changes:
+            return ExportsManager.parse_text(self.staged_text)
+        entries, self.exports_hash = ExportsManager.list_parsed_versioned()
+        return entries
+
+    def aplicar_cambios(self, changes):
+        """
+        Aplica changes (formato de ExportsManager.apply_changes). En modo
+        diferido solo se añaden a los pendientes. Devuelve True si se
+        aplicaron ya, para que el llamador muestre su mensaje de éxito.
+        """
+        if not self.staged_var.get():
+            ExportsManager.apply_changes(changes, base_hash=self.exports_hash)
+            return True
+        if not self.pending_changes:
+            self.staged_text, self.staged_hash = ExportsManager.read_versioned()
+        # Se aplican ya sobre el texto pendiente: los errores (ruta repetida,
+        # entrada inexistente...) aparecen al editar y no al pulsar Finish
+        self.staged_text, _ = ExportsManager.apply_changes_to_text(self.staged_text, changes)
+        self.pending_changes.extend(changes)
+        self.pending_paths.update(c["path"] for c in changes)
+        self.actualizar_pendientes()
+        self.programar_aplicacion()
+        return False
+
+    def actualizar_pendientes(self):
+        """Marca los directorios con cambios pendientes y actualiza el contador."""
+        for item in self.treeview.get_children():
+            path = self.treeview.item(item)["values"][0]
+            self.treeview.item(item, tags=self.etiquetas(path))
+        if self.pending_changes:
+            self.pending_label.config(
+                text=f"● {len(self.pending_changes)} pending change(s) in "
+                     f"{len(self.pending_paths)} export(s): Finish to apply")
+        else:
+            self.pending_label.config(text="")
+
+    def programar_aplicacion(self):
+        """Reinicia la cuenta atrás de la aplicación automática."""
+        if self.auto_apply_id is not None:
+            self.ventana.after_cancel(self.auto_apply_id)
+            self.auto_apply_id = None
+        try:
+            segundos = float(self.auto_apply_var.get() or 0)
+        except ValueError:
+            segundos = 0
+        if segundos > 0 and self.pending_changes:
+            self.auto_apply_id = self.ventana.after(int(segundos * 1000), self.aplicar_pendientes, True)
+
+    def aplicar_pendientes(self, automatico=False):
+        """Aplica todos los cambios pendientes en una sola escritura de /etc/exports."""
+        if self.auto_apply_id is not None:
+            self.ventana.after_cancel(self.auto_apply_id)
+            self.auto_apply_id = None
+        if not self.pending_changes:
+            if not automatico:
+                messagebox.showinfo("Finish", "No hay cambios pendientes.")
+            return
+        total = len(self.pending_changes)
+        try:
+            ExportsManager.apply_changes(self.pending_changes, base_hash=self.staged_hash)
+        except ExportsConflictError as err:
+            rutas = ", ".join(sorted(self.pending_paths))
+            self.limpiar_pendientes()
+            self.conflicto(f"{err}\n\nSe descartan los cambios pendientes de: {rutas}")
+            return
+        except ExportsError as err:
+            # Los pendientes se conservan para poder corregirlos o descartarlos
+            messagebox.showerror("Error de NFS", f"No se pudieron aplicar los cambios pendientes:\n{err}")
+            return
+        self.limpiar_pendientes()
+        self.refrescar_treeview()
+        self.actualizar_hosts(None)
+        if automatico:
+            self.pending_label.config(text=f"✔ {total} change(s) applied")
+        else:
+            messagebox.showinfo("Éxito", f"{total} cambio(s) aplicados en /etc/exports.")
+
+    def limpiar_pendientes(self):
+        self.pending_changes = []
+        self.pending_paths = set()
+        self.staged_text = ""
+        self.staged_hash = None
+        self.actualizar_pendientes()
+
+    def descartar_pendientes(self):
+        """Olvida los cambios pendientes y vuelve a mostrar /etc/exports."""
+        if not self.pending_changes:
+            return
+        if messagebox.askyesno("Confirmar", f"¿Descartar {len(self.pending_changes)} cambio(s) pendientes?"):
+            if self.auto_apply_id is not None:
+                self.ventana.after_cancel(self.auto_apply_id)
+                self.auto_apply_id = None
+            self.limpiar_pendientes()
+            self.refrescar_treeview()
+            self.actualizar_hosts(None)
+
+    def cambiar_modo(self):
+        """Al salir del modo diferido se aplica lo que quedara pendiente."""
+        if not self.staged_var.get() and self.pending_changes:
+            self.aplicar_pendientes()
+            if self.pending_changes:
+                # No se pudo aplicar: seguir en modo diferido
+                self.staged_var.set(True)
+
+    def salir(self):
+        if self.pending_changes and not messagebox.askyesno(
+                "Cambios pendientes",
+                f"Hay {len(self.pending_changes)} cambio(s) sin aplicar. ¿Salir y descartarlos?"):
+            return
+        if self.capacity_id:
+            self.ventana.after_cancel(self.capacity_id)
+        self.ventana.destroy()
 
     def delete_directory(self):
         """Elimina el directorio seleccionado."""
@@ -416,12 +546,14 @@ class MasterPanel:
 
         if messagebox.askyesno("Confirmar", f"¿Está seguro de eliminar el directorio de exportación:\n{path_seleccionado}?"):
             try:
-                ExportsManager.remove_entry(path_seleccionado)
-                messagebox.showinfo("Éxito", f"Directorio '{path_seleccionado}' eliminado y aplicado correctamente.")
+                if self.aplicar_cambios([{"op": "remove", "path": path_seleccionado}]):
+                    messagebox.showinfo("Éxito", f"Directorio '{path_seleccionado}' eliminado y aplicado correctamente.")
                 self.refrescar_treeview()
                 # Limpiar la lista de hosts también
                 for row in self.host_treeview.get_children():
                     self.host_treeview.delete(row)
+            except ExportsConflictError as err:
+                self.conflicto(err)
             except ExportsError as err:
                 messagebox.showerror("Error de NFS", f"Fallo al eliminar directorio:\n{err}")
             except Exception as e:
@@ -452,19 +584,21 @@ class MasterPanel:
 
     def directorio_leido(self, ruta):
         try:
-            # 🔑 Usa la clase Add corregida para crear el directorio
+            # 🔑 Crea el directorio (elevando privilegios solo si hace falta)
             Add.check_directory(ruta)
             self.host = "*"
             # Opción default para nueva entrada
             self.opciones = "rw,sync,no_root_squash"
             self.hosts_expr = f"{self.host}({self.opciones})"
 
-            ExportsManager.add_entry(ruta, self.hosts_expr)
-            messagebox.showinfo("Éxito", f"Directorio '{ruta}' añadido con opciones por defecto: {self.hosts_expr}", parent=self.new_window)
+            if self.aplicar_cambios([{"op": "add", "path": ruta, "hosts": self.hosts_expr}]):
+                messagebox.showinfo("Éxito", f"Directorio '{ruta}' añadido con opciones por defecto: {self.hosts_expr}", parent=self.new_window)
             self.new_window.destroy()
             self.refrescar_treeview()
         except ExportsError as err:
             messagebox.showerror("Error de NFS", f"Fallo al añadir directorio:\n{err}")
+        except ProvisionError as err:
+            messagebox.showerror("Error de directorio", f"Fallo al añadir directorio:\n{err}")
         except Exception as e:
             messagebox.showerror("Error", f"Error inesperado: {str(e)}")
 
@@ -485,17 +619,202 @@ class MasterPanel:
 
         # Obtener los hosts correspondientes desde ExportsManager
         try:
-            entries = ExportsManager.list_parsed()
+            entries = self.leer_entradas()
+            tags = ("pending",) if path_seleccionado in self.pending_paths else ()
             for e in entries:
                 if e["path"] == path_seleccionado:
                     for host in e["hosts"]:
                         nombre_host = host.get("name", "")
                         opciones = host.get("options", "")
-                        self.host_treeview.insert("", "end", values=(nombre_host, opciones))
+                        self.host_treeview.insert("", "end", values=(nombre_host, opciones), tags=tags)
                     return # Salir una vez que se procesó la entrada
         except Exception as err:
             messagebox.showerror("Error", f"No se pudieron cargar los hosts:\n{err}")
 
+    # ------------------------------------------------------------------
+    # --- CAPACIDAD (espacio e inodos de cada exportación) ---
+    # ------------------------------------------------------------------
+
+    def etiquetas(self, path):
+        """Tags de una fila: cambios pendientes y nivel de alerta de capacidad"""
+        tags = ["pending"] if path in self.pending_paths else []
+        info = self.capacity.get(path)
+        if info:
+            level = ExportCapacity.level(info, *self.umbrales())
+            if level == WARNING:
+                tags.append(WARNING)
+            elif level in (CRITICAL, MISSING, UNAVAILABLE):
+                tags.append(CRITICAL)
+        return tuple(tags)
+
+    def valores(self, path):
+        """Columnas de una fila del Treeview de directorios"""
+        info = self.capacity.get(path)
+        if not info:
+            return (path, "", "", "", "", "")
+        if "used_pct" not in info:
+            text = "missing" if info["level"] == MISSING else "unavailable"
+            return (path, info.get("mount_point", ""), text, "", "", "")
+        filesystem = f"{info['mount_point']} ({info['fstype']})"
+        inodes = f"{info['inodes_pct']:.0f}%" if info["inodes"] else "-"
+        return (path, filesystem, format_bytes(info["size"]), format_bytes(info["free"]),
+                f"{info['used_pct']:.0f}%", inodes)
+
+    def umbrales(self):
+        """(aviso, crítico) de los Spinbox; si no son números, los del entorno"""
+        try:
+            return float(self.warn_var.get()), float(self.critical_var.get())
+        except (ValueError, tk.TclError):
+            return thresholds()
+
+    def actualizar_capacidad(self, periodico=False):
+        """
+        Consulta en segundo plano espacio e inodos de todas las exportaciones
+        (un statvfs por sistema de archivos) y reprograma la siguiente.
+        """
+        if periodico:
+            self.capacity_id = self.ventana.after(int(CAPACITY_TTL * 1000), self.actualizar_capacidad, True)
+        if self.capacity_worker is not None and self.capacity_worker.is_alive():
+            return
+        paths = [self.treeview.item(item)["values"][0] for item in self.treeview.get_children()]
+        result = {}
+        # Tras una edición basta la caché; la consulta periódica es siempre nueva
+        max_age = 0 if periodico else CAPACITY_TTL
+
+        def work():
+            try:
+                result["capacity"] = ExportCapacity.collect(paths, max_age=max_age)
+            except Exception as e:
+                result["error"] = e
+
+        self.capacity_worker = threading.Thread(target=work, daemon=True)
+        self.capacity_worker.start()
+        self.ventana.after(100, self.mostrar_capacidad, self.capacity_worker, result)
+
+    def mostrar_capacidad(self, worker, result):
+        if worker.is_alive():
+            self.ventana.after(100, self.mostrar_capacidad, worker, result)
+            return
+        if "error" in result:
+            log.error("No se pudo consultar la capacidad: %s", result["error"])
+            return
+        self.capacity.update(result["capacity"])
+        for item in self.treeview.get_children():
+            path = self.treeview.item(item)["values"][0]
+            self.treeview.item(item, values=self.valores(path), tags=self.etiquetas(path))
+        self.aplicar_umbrales()
+
+    def aplicar_umbrales(self):
+        """Recalcula las alertas con los umbrales actuales, sin volver a consultar"""
+        warn, critical = self.umbrales()
+        levels = {}
+        devices = set()
+        for item in self.treeview.get_children():
+            path = self.treeview.item(item)["values"][0]
+            self.treeview.item(item, tags=self.etiquetas(path))
+            info = self.capacity.get(path)
+            if info:
+                levels[path] = ExportCapacity.level(info, warn, critical)
+                devices.add(info.get("device"))
+        alerts = [p for p, level in levels.items() if level in (WARNING, CRITICAL, MISSING, UNAVAILABLE)]
+        text = f"{len(levels)} export(s) on {len(devices - {None})} filesystem(s)"
+        if alerts:
+            critical_count = sum(1 for p in alerts if levels[p] == CRITICAL)
+            text += f" — {len(alerts)} need attention ({critical_count} critical)"
+        self.capacity_label.config(text=text, fg=CRITICAL_FG if alerts else "black")
+
+    def access_query(self):
+        """Busca qué exportaciones puede montar uno o varios clientes"""
+        dialog = tk.Toplevel(self.ventana)
+        dialog.title("Access Query")
+        dialog.geometry("760x480")
+        dialog.config(bg="#dce2ec")
+        utl.centrar_ventana(dialog, 760, 480)
+
+        form = tk.Frame(dialog, bg="#dce2ec")
+        form.pack(fill="x", padx=10, pady=10)
+        tk.Label(form, text="Clients (IP or hostname, several separated by spaces or lines)",
+                 font=("Times New Roman", 10), bg="#dce2ec").grid(row=0, column=0, columnspan=2, sticky="w")
+        clients_text = tk.Text(form, font=("Times New Roman", 10), height=3, width=80)
+        clients_text.grid(row=1, column=0, columnspan=2, sticky="we", pady=(0, 5))
+        tk.Label(form, text="Netgroups", font=("Times New Roman", 10), bg="#dce2ec").grid(row=2, column=0, sticky="w")
+        netgroups_entry = ttk.Entry(form, font=("Times New Roman", 10), width=40)
+        netgroups_entry.grid(row=2, column=1, sticky="w")
+        resolve_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form, text="Resolve DNS", variable=resolve_var, font=("Times New Roman", 10),
+                       bg="#dce2ec").grid(row=3, column=0, sticky="w")
+
+        columns = ("Client", "Path", "Rule", "Kind", "Access", "Options")
+        tree = ttk.Treeview(dialog, columns=columns, show="headings", height=12)
+        for col, width in zip(columns, (140, 180, 140, 80, 60, 160)):
+            tree.heading(col, text=col)
+            tree.column(col, width=width, anchor="w")
+        tree.pack(fill="both", expand=True, padx=10)
+
+        status = tk.Label(dialog, text="", font=("Times New Roman", 10), bg="#dce2ec", anchor="w")
+        status.pack(fill="x", padx=10)
+
+        # El índice se construye una sola vez por diálogo y en segundo plano:
+        # con tablas grandes tarda algo, las consultas después son inmediatas
+        state = {"index": None}
+
+        def search():
+            clients = clients_text.get("1.0", "end").replace(",", " ").split()
+            if not clients:
+                messagebox.showwarning("Advertencia", "Introduzca al menos un cliente", parent=dialog)
+                return
+            netgroups = netgroups_entry.get().replace(",", " ").split()
+            resolve = resolve_var.get()
+            result = {}
+
+            def work():
+                try:
+                    if state["index"] is None:
+                        state["index"] = AccessIndex.load()
+                    start = time.perf_counter()
+                    result["rows"] = state["index"].query_many(clients, netgroups, resolve)
+                    result["elapsed"] = time.perf_counter() - start
+                except Exception as e:
+                    result["error"] = e
+
+            worker = threading.Thread(target=work, daemon=True)
+            worker.start()
+            boton_search.config(state="disabled")
+            status.config(text="Buscando...")
+            dialog.after(50, show, worker, result)
+
+        def show(worker, result):
+            if not dialog.winfo_exists():
+                return
+            if worker.is_alive():
+                dialog.after(50, show, worker, result)
+                return
+            boton_search.config(state="normal")
+            tree.delete(*tree.get_children())
+            if "error" in result:
+                status.config(text="")
+                messagebox.showerror("Error", f"No se pudo consultar el acceso:\n{result['error']}", parent=dialog)
+                return
+            total = 0
+            for client, rows in result["rows"].items():
+                if not rows:
+                    tree.insert("", "end", values=(client, "-", "sin acceso", "", "", ""))
+                for row in rows:
+                    tree.insert("", "end", values=(client, row["path"], row["rule"], row["kind"],
+                                                   row["access"], row["options"]))
+                total += len(rows)
+            status.config(text=f"{len(result['rows'])} cliente(s), {total} acceso(s) en "
+                               f"{result['elapsed'] * 1000:.2f} ms "
+                               f"({state['index'].rule_count} reglas indexadas)")
+
+        boton_frame = tk.Frame(dialog, bg="#dce2ec")
+        boton_frame.pack(pady=10)
+        boton_search = tk.Button(boton_frame, text="Search", font=("Times New Roman", 10), bg="#b6c6e7",
+                                 width=10, height=1, command=search)
+        boton_search.pack(side="left", padx=5)
+        tk.Button(boton_frame, text="Close", font=("Times New Roman", 10), bg="#ccc5c4",
+                  width=10, height=1, command=dialog.destroy).pack(side="left", padx=5)
+
     # ------------------------------------------------------------------
     # --- INICIALIZACIÓN DE LA VENTANA ---
     # ------------------------------------------------------------------
@@ -509,6 +828,26 @@ class MasterPanel:
         self.ventana.config(bg="#fcfcfc")
         self.ventana.resizable(True, True)
         utl.centrar_ventana(self.ventana, 900, 600)
+
+        # Modo diferido: las ediciones se acumulan como cambios pendientes y
+        # se aplican juntas con Finish o tras unos segundos sin editar
+        self.pending_changes = []
+        self.pending_paths = set()
+        self.staged_text = ""
+        self.staged_hash = None
+        self.auto_apply_id = None
+        self.staged_var = tk.BooleanVar(value=os.environ.get("NFS_MANAGER_STAGED") == "1")
+        self.auto_apply_var = tk.StringVar(value=os.environ.get("NFS_MANAGER_AUTO_APPLY", "0"))
+
+        # Capacidad de cada exportación (ruta -> datos de ExportCapacity) y
+        # umbrales de alerta en %, configurables desde el entorno y la ventana
+        self.capacity = {}
+        self.capacity_worker = None
+        self.capacity_id = None
+        warn, critical = thresholds()
+        self.warn_var = tk.StringVar(value=f"{warn:g}")
+        self.critical_var = tk.StringVar(value=f"{critical:g}")
+
         label = tk.Label(self.ventana, bg="#dce2ec")
         label.place(x=0, y=0, relheight=1,relwidth=1)
 
@@ -531,17 +870,43 @@ class MasterPanel:
         directorio_label.pack(fill="x", padx=10, pady=(0, 0))
 
 
-        self.treeview = ttk.Treeview(main_frame, columns=("Directorio",), show="", height=8)
-        self.treeview.pack(fill="both", padx=10, pady=(0, 10))
-        self.treeview.column("Directorio", width=300,anchor="w")
-
-        # Cargar datos reales de /etc/exports
+        columns = ("Directorio", "Filesystem", "Size", "Free", "Use", "Inodes")
+        self.treeview = ttk.Treeview(main_frame, columns=columns, show="headings", height=8)
+        self.treeview.pack(fill="both", padx=10, pady=(0, 0))
+        for col, text, width, anchor in zip(columns,
+                                            ("Directory", "Filesystem", "Size", "Free", "Use %", "Inodes %"),
+                                            (300, 200, 70, 70, 60, 60),
+                                            ("w", "w", "e", "e", "e", "e")):
+            self.treeview.heading(col, text=text)
+            self.treeview.column(col, width=width, anchor=anchor, stretch=(col == "Directorio"))
+        self.treeview.tag_configure("pending", background=PENDING_BG)
+        self.treeview.tag_configure(WARNING, foreground=WARNING_FG)
+        self.treeview.tag_configure(CRITICAL, foreground=CRITICAL_FG)
+
+        # Resumen de capacidad y umbrales de alerta
+        capacity_frame = tk.Frame(main_frame, bg="#dce2ec")
+        capacity_frame.pack(fill="x", padx=10, pady=(0, 10))
+        self.capacity_label = tk.Label(capacity_frame, text="", font=("Times New Roman", 10), bg="#dce2ec", anchor="w")
+        self.capacity_label.pack(side="left")
+        for text, var in (("Critical at (%):", self.critical_var), ("Warn at (%):", self.warn_var)):
+            spin = tk.Spinbox(capacity_frame, from_=1, to=100, width=4, textvariable=var,
+                              font=("Times New Roman", 10), command=self.aplicar_umbrales)
+            spin.pack(side="right")
+            spin.bind("<KeyRelease>", lambda event: self.aplicar_umbrales())
+            tk.Label(capacity_frame, text=text, font=("Times New Roman", 10), bg="#dce2ec").pack(side="right", padx=(15, 2))
+
+        # Cargar datos reales de /etc/exports. exports_hash es la versión
+        # mostrada: los cambios se basan en ella y se rechazan si otro usuario
+        # o proceso modificó esas mismas entradas mientras tanto
+        self.exports_hash = None
         try:
-            entries = ExportsManager.list_parsed()
+            entries, self.exports_hash = ExportsManager.list_parsed_versioned()
             for e in entries:
-                self.treeview.insert("", "end", values=(e["path"],))
+                self.treeview.insert("", "end", values=self.valores(e["path"]))
         except Exception as err:
             messagebox.showerror("Error", f"No se pudo leer /etc/exports:\n{err}")
+        # Espacio e inodos en segundo plano, y de nuevo cada CAPACITY_TTL segundos
+        self.actualizar_capacidad(periodico=True)
 
         # Cada vez que se selecciona un path, actualizar hosts
         self.treeview.bind("<<TreeviewSelect>>", self.actualizar_hosts)
@@ -557,7 +922,6 @@ class MasterPanel:
 
         # Enlace del botón Delete Directory
         boton_delete = tk.Button(button_frame, text="Delete", font=("Times New Roman", 10), bg="#dce2ec",width=12, height=1, command=self.delete_directory)
-        boton_delete = tk.Button(button_frame, text="Delete", font=("Times New Roman", 10), bg="#dce2ec",width=12, height=1, command=lambda: self.delete_directory(self.treeview.item(self.treeview.selection())["values"][0]) )
         boton_delete.pack(side="left", padx=5)
 
         # OPCIONES DE HOST
@@ -571,6 +935,7 @@ class MasterPanel:
         self.host_treeview.column("Options", width=300, anchor="w")
         self.host_treeview.pack(fill="both", padx=10, pady=(0,  10))
         self.host_treeview.pack(fill="both", padx=10, pady=(0, 10))
+        self.host_treeview.tag_configure("pending", background=PENDING_BG)
 
         # Botones Host
         host_button_frame = tk.Frame(main_frame, bg="#dce2ec")
@@ -595,11 +960,27 @@ class MasterPanel:
         # NUEVO BOTÓN: Client Manager
         boton_client_manager = tk.Button(action_button_frame, text="Client Manager", font=("Times New Roman", 11, BOLD), bg="#9C27B0", fg="white", width=15, height=1, command=self.open_client_manager)
         boton_client_manager.pack(side="left", padx=5)
+        boton_access = tk.Button(action_button_frame, text="Access Query", font=("Times New Roman", 11, BOLD), bg="#009688", fg="white", width=15, height=1, command=self.access_query)
+        boton_access.pack(side="left", padx=5)
 
-        boton_finish = tk.Button(action_button_frame, text="Finish", font=("Times New Roman", 11, BOLD), bg="#3a7ff6", width=12, height=1)
+        boton_finish = tk.Button(action_button_frame, text="Finish", font=("Times New Roman", 11, BOLD), bg="#3a7ff6", width=12, height=1, command=self.aplicar_pendientes)
         boton_finish.pack(side="right", padx=5)
-        boton_cancel = tk.Button(action_button_frame, text="Cancel", font=("Times New Roman", 11, BOLD), bg="#f44336", width=12, height=1, command=self.ventana.destroy)
+        boton_cancel = tk.Button(action_button_frame, text="Cancel", font=("Times New Roman", 11, BOLD), bg="#f44336", width=12, height=1, command=self.salir)
         boton_cancel.pack(side="right", padx=5)
+        boton_discard = tk.Button(action_button_frame, text="Discard", font=("Times New Roman", 11, BOLD), bg="#ccc5c4", width=12, height=1, command=self.descartar_pendientes)
+        boton_discard.pack(side="right", padx=5)
+        self.ventana.protocol("WM_DELETE_WINDOW", self.salir)
+
+        # Modo diferido y aplicación automática (0 = solo con Finish)
+        staged_frame = tk.Frame(main_frame, bg="#dce2ec")
+        staged_frame.pack(side="bottom", fill="x", padx=10)
+        tk.Checkbutton(staged_frame, text="Staged changes", variable=self.staged_var, font=("Times New Roman", 10),
+                       bg="#dce2ec", command=self.cambiar_modo).pack(side="left")
+        tk.Label(staged_frame, text="Auto-apply after (s):", font=("Times New Roman", 10), bg="#dce2ec").pack(side="left", padx=(15, 2))
+        tk.Spinbox(staged_frame, from_=0, to=600, width=4, textvariable=self.auto_apply_var,
+                   font=("Times New Roman", 10)).pack(side="left")
+        self.pending_label = tk.Label(staged_frame, text="", font=("Times New Roman", 10, BOLD), bg="#dce2ec", fg="#8a6d00")
+        self.pending_label.pack(side="left", padx=15)
 
 
         self.ventana.mainloop()
@@ -1,4 +1,10 @@
+import time
+_t0 = time.perf_counter()
+
+from util import startup
+startup.begin(_t0)
+
 from forms.form_login import App
+startup.mark("imports")
 
 App()
-
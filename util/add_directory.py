@@ -1,14 +1,28 @@
 import os
 import subprocess
 import shutil
+from typing import Callable, Dict, List, Optional
+
+from util import normalize_tree, provision
+from util.mount_health import MountHealth, MountHealthError
+from util.instrumentation import Instrumentation
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+class ProvisionError(Exception):
+    pass
 
 class Add:
     @staticmethod
     def _get_privilege_command():
         """
         Detecta qué comando usar para obtener privilegios.
-        Retorna 'pkexec' si está disponible, sino 'sudo'.
+        Retorna 'pkexec' si está disponible, sino 'sudo' (None si ya se es root).
         """
+        if os.geteuid() == 0:
+            # Ya somos root (p. ej. el servicio RPC): sin pkexec/sudo
+            return None
         if shutil.which("pkexec"):
             return "pkexec"
         elif shutil.which("sudo"):
@@ -17,30 +31,162 @@ class Add:
             raise RuntimeError("No se encontró pkexec ni sudo en el sistema")
 
     @staticmethod
-    def check_directory(path: str):
+    def _run_privileged(cmd: List[str], input: Optional[str] = None,
+                        timeout: int = 600) -> subprocess.CompletedProcess:
+        """Ejecuta comando con privilegios"""
+        try:
+            priv_cmd = Add._get_privilege_command()
+        except RuntimeError as e:
+            raise ProvisionError(str(e))
+        return Instrumentation.run(
+            ([priv_cmd] if priv_cmd else []) + cmd,
+            input=input,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=timeout
+        )
+
+    @staticmethod
+    def provision(directories: List, templates: Optional[Dict[str, Dict]] = None,
+                  dry_run: bool = False, workers: int = provision.DEFAULT_WORKERS) -> Dict:
         """
-        Verifica si el directorio existe.
-        Si no existe, lo crea con permisos 755 usando pkexec o sudo.
-        Si ya existe, solo aplica los permisos 755 nuevamente.
+        Crea o ajusta en lote directorios con modo, propietario, grupo y ACL
+        (formato en util/provision.py).
+
+        Primero se comprueba todo sin privilegios; solo los directorios que no
+        coinciden con lo pedido se envían a un único proceso privilegiado, que
+        los procesa en paralelo. Si ya está todo como se pide no se eleva nada.
+
+        Returns:
+            {"results": [{"path", "status", "actions", "error"}] (en el orden
+             de directories), "created", "updated", "unchanged", "errors"}
         """
-        if not path:
-            print("[ERROR] No se especificó una ruta válida.")
-            return
+        # No tocar nada bajo un montaje NFS colgado: una comprobación por montaje
+        mounts = set()
+        for item in directories:
+            path = item.get("path") if isinstance(item, dict) else item
+            if isinstance(path, str) and path.startswith("/"):
+                mounts.add(MountHealth.covering_mount(path))
+        try:
+            for mp in sorted(filter(None, mounts)):
+                MountHealth.guard(mp)
+        except MountHealthError as e:
+            raise ProvisionError(str(e))
 
+        if os.geteuid() == 0:
+            return provision.provision(directories, templates, dry_run, workers)
+
+        summary = provision.provision(directories, templates, True, workers)
+        pending = [n for n, r in enumerate(summary["results"]) if r["status"] != "unchanged"]
+        if dry_run or not pending:
+            return summary
+
+        import inspect
+        import json
+        import sys
+        request = {"directories": [directories[n] for n in pending], "templates": templates,
+                   "workers": workers}
+        res = Add._run_privileged([sys.executable, "-c", inspect.getsource(provision)],
+                                  input=json.dumps(request))
+        if res.returncode != 0:
+            raise ProvisionError(f"No se pudieron crear los directorios: {res.stderr.strip()}")
+        try:
+            applied = json.loads(res.stdout)["results"]
+        except (ValueError, KeyError):
+            raise ProvisionError("Respuesta inválida al crear los directorios")
+
+        for n, result in zip(pending, applied):
+            summary["results"][n] = result
+        for key in ("created", "updated", "unchanged", "errors"):
+            summary[key] = 0
+        for r in summary["results"]:
+            summary["errors" if r["status"] == "error" else r["status"]] += 1
+        log.info("Directorios: %d creados, %d ajustados, %d sin cambios, %d con error",
+                 summary["created"], summary["updated"], summary["unchanged"], summary["errors"])
+        return summary
+
+    @staticmethod
+    def normalize_tree(root: str, policy: Dict, dry_run: bool = False,
+                       workers: int = normalize_tree.DEFAULT_WORKERS, one_file_system: bool = True,
+                       progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Ajusta propietario, grupo y permisos de todo un árbol exportado según
+        policy (formato en util/normalize_tree.py), en un único proceso
+        privilegiado que recorre el árbol en paralelo.
+
+        Args:
+            dry_run: solo contar los inodos que cambiarían
+            progress: llamada periódicamente con los contadores parciales
+
+        Returns:
+            {"root", "scanned", "directories", "changed", "chown", "chmod",
+             "errors", "error_samples", "skipped_mounts", "elapsed", "dry_run"}
+        """
+        try:
+            MountHealth.guard(root)
+            normalize_tree.resolve_policy(policy)
+            if os.geteuid() == 0:
+                return normalize_tree.normalize(root, policy, dry_run, workers,
+                                                one_file_system, progress)
+        except (MountHealthError, normalize_tree.NormalizeError) as e:
+            raise ProvisionError(str(e))
+
+        import inspect
+        import json
+        import sys
         try:
             priv_cmd = Add._get_privilege_command()
-            print(f"[INFO] Usando '{priv_cmd}' para operaciones privilegiadas")
-
-            if not os.path.exists(path):
-                print(f"[INFO] El directorio '{path}' no existe. Creando con permisos 755...")
-                subprocess.run([priv_cmd, "mkdir", "-p", path], check=True)
-                subprocess.run([priv_cmd, "chmod", "755", path], check=True)
-                print(f"[OK] Directorio '{path}' creado con permisos 755.")
-            else:
-                print(f"[INFO] El directorio '{path}' ya existe. Aplicando permisos 755...")
-                subprocess.run([priv_cmd, "chmod", "755", path], check=True)
-                print(f"[OK] Permisos 755 aplicados correctamente al directorio '{path}'.")
-        except subprocess.CalledProcessError as e:
-            print(f"[ERROR] No se pudo crear o modificar el directorio: {e}")
         except RuntimeError as e:
-            print(f"[ERROR] {e}")
+            raise ProvisionError(str(e))
+        request = {"root": root, "policy": policy, "dry_run": dry_run, "workers": workers,
+                   "one_file_system": one_file_system}
+        result = error = None
+        # Popen en lugar de Instrumentation.run para ir leyendo el progreso
+        with Instrumentation.timed("privileged", "normalize", root):
+            proc = subprocess.Popen(
+                ([priv_cmd] if priv_cmd else []) + [sys.executable, "-c", inspect.getsource(normalize_tree)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+            try:
+                proc.stdin.write(json.dumps(request))
+                proc.stdin.close()
+                for line in proc.stdout:
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "progress" in message and progress:
+                        progress(message["progress"])
+                    result = message.get("result", result)
+                    error = message.get("error", error)
+            finally:
+                proc.stdout.close()
+                stderr = proc.stderr.read()
+                proc.stderr.close()
+                proc.wait()
+        if error:
+            raise ProvisionError(error["message"])
+        if proc.returncode != 0 or result is None:
+            raise ProvisionError(f"No se pudo normalizar {root}: {stderr.strip() or 'sin respuesta'}")
+        log.info("Normalizado %s: %d inodos revisados, %d cambiados, %d errores",
+                 root, result["scanned"], result["changed"], result["errors"])
+        return result
+
+    @staticmethod
+    def check_directory(path: str, mode: int = 0o755):
+        """
+        Verifica si el directorio existe.
+        Si no existe, lo crea con permisos 755 usando pkexec o sudo.
+        Si ya existe, solo ajusta los permisos si no son 755.
+
+        Raises:
+            ProvisionError: si la ruta no es válida o no se pudo crear
+        """
+        if not path or not path.strip():
+            raise ProvisionError("La ruta del directorio no puede estar vacía.")
+
+        result = Add.provision([{"path": path.strip(), "mode": mode}])["results"][0]
+        if result["status"] == "error":
+            raise ProvisionError(f"Fallo al crear el directorio '{path}': {result['error']}")
+        log.info("Directorio '%s': %s", path, ", ".join(result["actions"]) or "sin cambios")
@@ -0,0 +1,182 @@
+"""
+BackupHistory
+-------------
+Formato de historial compacto para el almacén de backups y políticas de
+retención.
+
+Los objetos se guardan comprimidos con zlib. Cada cierto número de versiones
+se escribe un snapshot completo; el resto son deltas por líneas contra la
+versión anterior, de modo que reconstruir cualquier versión cuesta como mucho
+FULL_EVERY lecturas pequeñas.
+
+Formato de un objeto (después de la cabecera mágica):
+    zlib(b"F\\n" + contenido)                 snapshot completo
+    zlib(b"D <sha256 base>\\n" + json(ops))  delta contra el objeto base
+donde ops es una lista de ["=", i1, i2] (copiar líneas base[i1:i2]) o
+["+", [líneas nuevas]].
+"""
+
+import difflib
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+MAGIC = b"NFSO1\n"
+FULL_EVERY = 16
+COMPRESS_LEVEL = 9
+
+
+class HistoryError(Exception):
+    pass
+
+
+def encode_full(content: str) -> bytes:
+    return MAGIC + zlib.compress(b"F\n" + content.encode("utf-8"), COMPRESS_LEVEL)
+
+
+def encode_delta(base_digest: str, base: str, content: str) -> bytes:
+    """Delta por líneas de base a content, comprimido."""
+    a = base.splitlines(keepends=True)
+    b = content.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["+", b[j1:j2]])
+        # 'delete': basta con no copiar esas líneas
+    header = f"D {base_digest}\n".encode("ascii")
+    payload = json.dumps(ops, separators=(",", ":")).encode("utf-8")
+    return MAGIC + zlib.compress(header + payload, COMPRESS_LEVEL)
+
+
+def encode(content: str, base_digest: Optional[str] = None,
+           base: Optional[str] = None) -> Tuple[bytes, bool]:
+    """
+    Codifica content como delta contra base si resulta más pequeño que el
+    snapshot completo. Devuelve (bytes, es_delta).
+    """
+    full = encode_full(content)
+    if base_digest is None or base is None:
+        return full, False
+    delta = encode_delta(base_digest, base, content)
+    if len(delta) < len(full):
+        return delta, True
+    return full, False
+
+
+def object_base(data: bytes) -> Optional[str]:
+    """sha256 del objeto base de un delta (None si es completo o antiguo)."""
+    if not data.startswith(MAGIC):
+        return None
+    head = zlib.decompressobj().decompress(data[len(MAGIC):], 80)
+    if head.startswith(b"D "):
+        return head[2:head.index(b"\n")].decode("ascii")
+    return None
+
+
+def decode(data: bytes, load_base) -> str:
+    """
+    Reconstruye el contenido de un objeto. load_base(digest) debe devolver el
+    contenido ya reconstruido del objeto base.
+    Los objetos sin cabecera (anteriores a este formato) son texto plano.
+    """
+    if not data.startswith(MAGIC):
+        return data.decode("utf-8")
+    raw = zlib.decompress(data[len(MAGIC):])
+    if raw.startswith(b"F\n"):
+        return raw[2:].decode("utf-8")
+    if not raw.startswith(b"D "):
+        raise HistoryError("Objeto de backup con formato desconocido")
+    newline = raw.index(b"\n")
+    base_digest = raw[2:newline].decode("ascii")
+    ops = json.loads(raw[newline + 1:].decode("utf-8"))
+    base_lines = load_base(base_digest).splitlines(keepends=True)
+    out = []
+    for op in ops:
+        if op[0] == "=":
+            out.extend(base_lines[op[1]:op[2]])
+        else:
+            out.extend(op[1])
+    return "".join(out)
+
+
+def record_key(record: Dict) -> Tuple[str, int]:
+    """
+    Clave de orden cronológico de un snapshot: timestamp y, para los creados
+    en el mismo segundo, el sufijo numérico del nombre (..._2.bak < ..._10.bak).
+    """
+    stem = record.get("filename", "")
+    if stem.endswith(".bak"):
+        stem = stem[:-len(".bak")]
+    parts = stem.split("_")
+    suffix = int(parts[4]) if len(parts) > 4 and parts[4].isdigit() else 0
+    return record.get("timestamp", ""), suffix
+
+
+class RetentionPolicy:
+    """
+    Política de retención al estilo "abuelo-padre-hijo": se conservan los
+    últimos keep_last snapshots y, además, el más reciente de cada una de las
+    últimas `hourly` horas, `daily` días, `weekly` semanas y `monthly` meses
+    en los que hubo backups. Los backups con descripción (creados a mano)
+    se conservan siempre si keep_described es True.
+    """
+
+    def __init__(self, keep_last: int = 10, hourly: int = 24, daily: int = 30,
+                 weekly: int = 0, monthly: int = 0, keep_described: bool = True):
+        self.keep_last = keep_last
+        self.hourly = hourly
+        self.daily = daily
+        self.weekly = weekly
+        self.monthly = monthly
+        self.keep_described = keep_described
+
+    @staticmethod
+    def _when(record: Dict) -> datetime:
+        try:
+            return datetime.strptime(record["timestamp"][:15], "%Y%m%d_%H%M%S")
+        except (KeyError, ValueError):
+            return datetime.min
+
+    def select(self, records: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Divide records en (conservar, eliminar)."""
+        ordered = sorted(records, key=record_key, reverse=True)
+        keep = set()
+
+        for record in ordered[:self.keep_last]:
+            keep.add(record["filename"])
+
+        buckets = (
+            (self.hourly, "%Y%m%d%H"),
+            (self.daily, "%Y%m%d"),
+            (self.weekly, "%G%V"),
+            (self.monthly, "%Y%m"),
+        )
+        for count, fmt in buckets:
+            if count <= 0:
+                continue
+            seen = set()
+            for record in ordered:
+                key = self._when(record).strftime(fmt)
+                if key in seen:
+                    continue
+                seen.add(key)
+                keep.add(record["filename"])
+                if len(seen) >= count:
+                    break
+
+        if self.keep_described:
+            for record in ordered:
+                desc = record.get("description", "")
+                if desc and not desc.startswith("Auto-backup"):
+                    keep.add(record["filename"])
+
+        kept = [r for r in ordered if r["filename"] in keep]
+        removed = [r for r in ordered if r["filename"] not in keep]
+        return kept, removed
+
+
+DEFAULT_RETENTION = RetentionPolicy()
@@ -4,15 +4,57 @@ BackupManager
 Módulo para gestionar backups de la configuración de NFS
 """
 
+import hashlib
+import io
+import json
 import os
 import shutil
 import subprocess
+import tarfile
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional
+
+from util.backup_history import (DEFAULT_RETENTION, FULL_EVERY, RetentionPolicy,
+                                 decode as decode_object, encode as encode_object,
+                                 object_base, record_key)
+from util.exports_lock import ExportsLock
+from util.instrumentation import Instrumentation
 
 EXPORTS_PATH = "/etc/exports"
 BACKUP_DIR = "/var/backups/nfs-manager"
+MANIFEST_NAME = "manifest.jsonl"
+MANIFEST_PATH = os.path.join(BACKUP_DIR, MANIFEST_NAME)
+# Almacén direccionado por contenido: objects/<2 primeros hex>/<resto del sha256>
+OBJECTS_DIR = "objects"
+# Cada snapshot es una referencia ligera: refs/<nombre>.json con sus metadatos
+REFS_DIR = "refs"
+
+# Instala archivos en BACKUP_DIR (temporal + rename atómico por archivo) y
+# elimina los indicados tras "--rm", todo en una única llamada privilegiada.
+# Los archivos se pasan por pares "origen destino"; el manifiesto va el último.
+_COMMIT_SCRIPT = (
+    'set -e\n'
+    'mkdir -p "$1"\n'
+    'chmod 755 "$1"\n'
+    'shift\n'
+    'while [ $# -gt 0 ] && [ "$1" != "--rm" ]; do\n'
+    '  mkdir -p "$(dirname "$2")"\n'
+    '  cp "$1" "$2.tmp"; chmod 644 "$2.tmp"; mv -f "$2.tmp" "$2"; shift 2\n'
+    'done\n'
+    'if [ "$1" = "--rm" ]; then shift; rm -f "$@"; fi\n'
+)
+
+# Metadatos de un archivo en una sola llamada: tamaño, mtime, sha256 y
+# número de líneas que no son comentarios ni están vacías
+_STAT_SCRIPT = (
+    'set -e\n'
+    'stat -c "%s %Y" "$1"\n'
+    'sha256sum "$1" | cut -d" " -f1\n'
+    'grep -cv -e "^[[:space:]]*#" -e "^[[:space:]]*$" "$1" || true\n'
+)
 
 class BackupError(Exception):
     pass
@@ -20,9 +62,41 @@ class BackupError(Exception):
 class BackupManager:
     """Gestiona backups de la configuración NFS"""
 
+    # Contenido ya reconstruido de objetos del almacén (sha256 -> texto)
+    _object_cache: Dict[str, str] = {}
+    _OBJECT_CACHE_MAX = 64
+    # prune_async y la GUI usan la caché desde otros hilos
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def _manifest_lock():
+        """
+        Cerrojo entre procesos e hilos para leer, modificar y reescribir el
+        manifiesto y el almacén (snapshot, prune, delete_backup,
+        rebuild_manifest). Se toma sobre el directorio que contiene
+        BACKUP_DIR, que existe aunque BACKUP_DIR todavía no.
+        """
+        return ExportsLock.hold(BACKUP_DIR)
+
+    @staticmethod
+    def _cache_put(digest: str, content: str) -> None:
+        with BackupManager._cache_lock:
+            if len(BackupManager._object_cache) >= BackupManager._OBJECT_CACHE_MAX:
+                BackupManager._object_cache.pop(next(iter(BackupManager._object_cache)))
+            BackupManager._object_cache[digest] = content
+
+    @staticmethod
+    def _cache_drop(digests) -> None:
+        with BackupManager._cache_lock:
+            for digest in digests:
+                BackupManager._object_cache.pop(digest, None)
+
     @staticmethod
     def _get_privilege_command():
         """Detecta qué comando usar para privilegios"""
+        if os.geteuid() == 0:
+            # Ya somos root (p. ej. el servicio RPC): sin pkexec/sudo
+            return None
         if shutil.which("pkexec"):
             return "pkexec"
         elif shutil.which("sudo"):
@@ -31,112 +105,504 @@ class BackupManager:
             raise BackupError("No se encontró pkexec ni sudo")
 
     @staticmethod
-    def _run_privileged(cmd: List[str]) -> subprocess.CompletedProcess:
-        """Ejecuta comando con privilegios"""
+    def _run_privileged(cmd: List[str], text: bool = True, timeout: int = 10) -> subprocess.CompletedProcess:
+        """Ejecuta comando con privilegios (text=False devuelve bytes)"""
         priv_cmd = BackupManager._get_privilege_command()
-        return subprocess.run(
-            [priv_cmd] + cmd,
+        return Instrumentation.run(
+            ([priv_cmd] if priv_cmd else []) + cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            universal_newlines=True,
-            timeout=10
+            universal_newlines=text,
+            timeout=timeout
         )
 
     @staticmethod
-    def create_backup(description: str = "") -> str:
+    def _read_file(path: str) -> str:
+        """Lee un archivo directamente o, si no hay permisos, con 'cat' privilegiado"""
+        try:
+            with Instrumentation.timed("file", "read", path) as t, \
+                    open(path, "r", encoding="utf-8") as f:
+                data = f.read()
+                t.bytes = len(data)
+                return data
+        except PermissionError:
+            res = BackupManager._run_privileged(["cat", path])
+            if res.returncode != 0:
+                raise BackupError(f"No se pudo leer {path}: {res.stderr.strip()}")
+            return res.stdout
+
+    @staticmethod
+    def _read_bytes(path: str) -> bytes:
+        """Como _read_file pero en binario"""
+        try:
+            with Instrumentation.timed("file", "read", path) as t, open(path, "rb") as f:
+                data = f.read()
+                t.bytes = len(data)
+                return data
+        except PermissionError:
+            res = BackupManager._run_privileged(["cat", path], text=False)
+            if res.returncode != 0:
+                raise BackupError(f"No se pudo leer {path}: "
+                                  f"{res.stderr.decode('utf-8', 'replace').strip()}")
+            return res.stdout
+
+    @staticmethod
+    def _count_entries(content: str) -> int:
+        """Cuenta las líneas de exportación (sin comentarios ni vacías)"""
+        count = 0
+        for line in content.split('\n'):
+            if line.strip() and not line.strip().startswith('#'):
+                count += 1
+        return count
+
+    @staticmethod
+    def _make_record(filename: str, content: str, description: str = "",
+                     timestamp: Optional[str] = None) -> Dict:
+        """Construye la entrada del manifiesto para un backup"""
+        data = content.encode("utf-8")
+        return {
+            "filename": filename,
+            "timestamp": timestamp or datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "description": description,
+            "entries": BackupManager._count_entries(content),
+        }
+
+    @staticmethod
+    def _object_name(digest: str) -> str:
+        """Ruta relativa a BACKUP_DIR del objeto con ese sha256"""
+        return os.path.join(OBJECTS_DIR, digest[:2], digest[2:])
+
+    @staticmethod
+    def _ref_name(filename: str) -> str:
+        return os.path.join(REFS_DIR, filename + ".json")
+
+    @staticmethod
+    def _has_object(digest: str) -> bool:
+        return os.path.exists(os.path.join(BACKUP_DIR, BackupManager._object_name(digest)))
+
+    @staticmethod
+    def _find_record(backup_filename: str, records: Optional[List[Dict]] = None) -> Dict:
+        if records is None:
+            records = BackupManager.read_manifest()
+        for record in records:
+            if record["filename"] == backup_filename:
+                return record
+        raise BackupError(f"El backup no existe: {backup_filename}")
+
+    @staticmethod
+    def _load_object(digest: str) -> str:
+        """Reconstruye el contenido de un objeto siguiendo su cadena de deltas"""
+        with BackupManager._cache_lock:
+            cached = BackupManager._object_cache.get(digest)
+        if cached is not None:
+            return cached
+        data = BackupManager._read_bytes(
+            os.path.join(BACKUP_DIR, BackupManager._object_name(digest)))
+        content = decode_object(data, BackupManager._load_object)
+        BackupManager._cache_put(digest, content)
+        return content
+
+    @staticmethod
+    def read_backup_content(backup_filename: str) -> str:
+        """Contenido de un backup, tanto de snapshots del almacén como de .bak antiguos"""
+        record = BackupManager._find_record(backup_filename)
+        if record.get("object"):
+            return BackupManager._load_object(record["object"])
+        return BackupManager._read_file(os.path.join(BACKUP_DIR, backup_filename))
+
+    # ------------------------------------------------------------------
+    # Manifiesto (índice de backups)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def read_manifest() -> List[Dict]:
         """
-        Crea un backup del archivo /etc/exports
-        Retorna el nombre del archivo de backup creado
+        Lee el manifiesto de backups (una entrada JSON por línea).
+        Devuelve [] si todavía no existe.
         """
+        path = os.path.join(BACKUP_DIR, MANIFEST_NAME)
         try:
-            # Crear directorio de backups si no existe
-            res = BackupManager._run_privileged(["mkdir", "-p", BACKUP_DIR])
-            if res.returncode != 0:
-                raise BackupError(f"No se pudo crear directorio de backups: {res.stderr}")
+            content = BackupManager._read_file(path)
+        except FileNotFoundError:
+            return []
+        except BackupError:
+            # Sin permisos de lectura y 'cat' falló. Solo equivale a un
+            # manifiesto vacío si no existe: con cualquier otro fallo (pkexec
+            # cancelado...) quien lo reescribiera borraría el historial
+            try:
+                os.stat(path)
+            except FileNotFoundError:
+                return []
+            except OSError:
+                pass
+            raise
+
+        records = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
 
-            # Generar nombre del backup con timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_filename = f"exports_backup_{timestamp}.bak"
-            backup_path = os.path.join(BACKUP_DIR, backup_filename)
+    @staticmethod
+    def _commit(files: Dict[str, object], records: Optional[List[Dict]] = None,
+                remove: Optional[List[str]] = None) -> None:
+        """
+        Escribe archivos nuevos en BACKUP_DIR, reescribe el manifiesto y borra
+        archivos, todo en una sola llamada privilegiada
 
-            # Copiar archivo exports
-            res = BackupManager._run_privileged(["cp", EXPORTS_PATH, backup_path])
+        Args:
+            files: {nombre_en_BACKUP_DIR: contenido (str o bytes)}
+            records: manifiesto completo a escribir (None = no tocarlo)
+            remove: nombres a eliminar de BACKUP_DIR
+        """
+        tmp_dir = tempfile.mkdtemp(prefix="nfs_backup_")
+        try:
+            args = [BACKUP_DIR]
+            pending = dict(files)
+            if records is not None:
+                pending[MANIFEST_NAME] = "".join(
+                    json.dumps(r, sort_keys=True) + "\n" for r in records)
+            for i, (name, content) in enumerate(pending.items()):
+                tmp_path = os.path.join(tmp_dir, str(i))
+                if isinstance(content, str):
+                    content = content.encode("utf-8")
+                with Instrumentation.timed("file", "write", tmp_path) as t, \
+                        open(tmp_path, "wb") as f:
+                    t.bytes = f.write(content)
+                args += [tmp_path, os.path.join(BACKUP_DIR, name)]
+            if remove:
+                args += ["--rm"] + [os.path.join(BACKUP_DIR, n) for n in remove]
+
+            res = BackupManager._run_privileged(["sh", "-c", _COMMIT_SCRIPT, "sh"] + args)
             if res.returncode != 0:
-                raise BackupError(f"No se pudo crear backup: {res.stderr}")
-
-            # Guardar descripción si se proporcionó
-            if description:
-                info_path = backup_path + ".info"
-                info_content = f"Timestamp: {timestamp}\nDescription: {description}\n"
-
-                # Crear archivo temporal con la info
-                import tempfile
-                fd, tmp_path = tempfile.mkstemp(text=True)
-                os.close(fd)
-                with open(tmp_path, 'w') as f:
-                    f.write(info_content)
-
-                # Mover a ubicación final
-                res = BackupManager._run_privileged(["mv", tmp_path, info_path])
+                raise BackupError(f"No se pudo actualizar {BACKUP_DIR}: {res.stderr.strip()}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def rebuild_manifest() -> List[Dict]:
+        """
+        Regenera el manifiesto a partir de las referencias de snapshots y de
+        los .bak antiguos (con sus .info). Lee todo con un único 'tar'
+        privilegiado en lugar de un 'cat' por archivo; los objetos no se leen.
+        """
+        try:
+            with BackupManager._manifest_lock():
+                res = BackupManager._run_privileged(
+                    ["tar", "-cf", "-", "-C", BACKUP_DIR, f"--exclude=./{OBJECTS_DIR}", "."],
+                    text=False, timeout=60)
                 if res.returncode != 0:
-                    os.remove(tmp_path)
+                    raise BackupError(res.stderr.decode("utf-8", "replace").strip())
+
+                contents = {}
+                refs = []
+                with tarfile.open(fileobj=io.BytesIO(res.stdout), mode="r:") as tar:
+                    for member in tar.getmembers():
+                        if not member.isfile():
+                            continue
+                        name = os.path.basename(member.name)
+                        data = tar.extractfile(member).read().decode("utf-8", "replace")
+                        if os.path.basename(os.path.dirname(member.name)) == REFS_DIR:
+                            try:
+                                refs.append(json.loads(data))
+                            except ValueError:
+                                continue
+                        elif name.endswith(".bak") or name.endswith(".bak.info"):
+                            contents[name] = (data, member.mtime)
+
+                records = list(refs)
+                for name, (content, mtime) in contents.items():
+                    if not name.endswith(".bak"):
+                        continue
+                    description = ""
+                    info = contents.get(name + ".info")
+                    if info:
+                        for info_line in info[0].split('\n'):
+                            if info_line.startswith("Description:"):
+                                description = info_line.replace("Description:", "").strip()
+                    try:
+                        timestamp = name.split('_')[2] + "_" + name.split('_')[3].replace('.bak', '')
+                    except IndexError:
+                        timestamp = datetime.fromtimestamp(mtime).strftime("%Y%m%d_%H%M%S")
+                    records.append(BackupManager._make_record(name, content, description, timestamp))
+
+                records.sort(key=record_key)
+                BackupManager._commit({}, records)
+                return records
+
+        except BackupError:
+            raise
+        except Exception as e:
+            raise BackupError(f"Error regenerando el manifiesto: {e}")
 
+    @staticmethod
+    def snapshot(content: str, description: str = "", reuse_latest: bool = True) -> str:
+        """
+        Guarda content como snapshot en el almacén direccionado por contenido.
+
+        Si el objeto con ese hash ya existe no se vuelve a escribir: el
+        snapshot es solo una referencia con metadatos. Con reuse_latest, si
+        coincide con el último snapshot no se crea nada y se devuelve ese.
+
+        Returns:
+            Nombre del snapshot
+        """
+        with BackupManager._manifest_lock():
+            records = BackupManager.read_manifest()
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+            latest = max(records, key=record_key, default=None)
+            if reuse_latest and latest and latest.get("sha256") == digest:
+                return latest["filename"]
+
+            existing = {r["filename"] for r in records}
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_filename = f"exports_backup_{timestamp}.bak"
+            n = 1
+            while backup_filename in existing:
+                backup_filename = f"exports_backup_{timestamp}_{n}.bak"
+                n += 1
+
+            record = BackupManager._make_record(backup_filename, content, description, timestamp)
+            record["object"] = digest
+
+            files = {}
+            same = next((r for r in records if r.get("object") == digest), None)
+            if same is not None and BackupManager._has_object(digest):
+                record["depth"] = same.get("depth", 0)
+                if "base" in same:
+                    record["base"] = same["base"]
+            else:
+                # Delta contra el último snapshot salvo que toque uno completo
+                base = latest if latest and latest.get("object") else None
+                depth = base.get("depth", 0) + 1 if base else 0
+                if base is None or depth >= FULL_EVERY:
+                    data, _ = encode_object(content)
+                    depth = 0
+                else:
+                    data, is_delta = encode_object(content, base["object"],
+                                                   BackupManager._load_object(base["object"]))
+                    if not is_delta:
+                        depth = 0
+                record["depth"] = depth
+                # Base del delta (None si el objeto es completo), para calcular
+                # qué objetos siguen haciendo falta sin leer el almacén
+                record["base"] = base["object"] if depth else None
+                record["stored_size"] = len(data)
+                files[BackupManager._object_name(digest)] = data
+                BackupManager._cache_put(digest, content)
+            files[BackupManager._ref_name(backup_filename)] = json.dumps(record, sort_keys=True) + "\n"
+            BackupManager._commit(files, records + [record])
             return backup_filename
 
+    @staticmethod
+    def _referenced_objects(records: List[Dict], known: List[Dict]) -> set:
+        """
+        Objetos necesarios para reconstruir records, incluidas las bases de
+        los deltas. Las bases salen del campo "base" de los registros de
+        known (todo el manifiesto); solo los objetos de registros anteriores
+        a ese campo se leen del almacén para averiguarla.
+        """
+        bases = {}
+        for record in known:
+            if record.get("object") and "base" in record:
+                bases[record["object"]] = record["base"]
+        referenced = set()
+        for record in records:
+            digest = record.get("object")
+            while digest and digest not in referenced:
+                referenced.add(digest)
+                if digest in bases:
+                    digest = bases[digest]
+                    continue
+                try:
+                    digest = object_base(BackupManager._read_bytes(
+                        os.path.join(BACKUP_DIR, BackupManager._object_name(digest))))
+                except (OSError, BackupError):
+                    digest = None
+        return referenced
+
+    @staticmethod
+    def _stored_objects() -> set:
+        """sha256 de todos los objetos presentes en el almacén"""
+        stored = set()
+        root = os.path.join(BACKUP_DIR, OBJECTS_DIR)
+        for prefix in (os.listdir(root) if os.path.isdir(root) else []):
+            try:
+                for rest in os.listdir(os.path.join(root, prefix)):
+                    if not rest.endswith(".tmp"):
+                        stored.add(prefix + rest)
+            except OSError:
+                continue
+        return stored
+
+    @staticmethod
+    def prune(policy: Optional[RetentionPolicy] = None, dry_run: bool = False) -> Dict:
+        """
+        Aplica una política de retención: elimina los snapshots que no
+        conserva y los objetos que ya nadie necesita, en una sola escritura
+
+        Returns:
+            {"kept": N, "removed": [nombres], "objects_removed": N}
+        """
+        try:
+            with BackupManager._manifest_lock():
+                policy = policy or DEFAULT_RETENTION
+                records = BackupManager.read_manifest()
+                kept, removed = policy.select(records)
+                result = {"kept": len(kept), "removed": [r["filename"] for r in removed],
+                          "objects_removed": 0}
+                if not removed:
+                    return result
+
+                garbage = (BackupManager._stored_objects()
+                           - BackupManager._referenced_objects(kept, records))
+                result["objects_removed"] = len(garbage)
+                if dry_run:
+                    return result
+
+                remove = []
+                for record in removed:
+                    name = record["filename"]
+                    remove += [BackupManager._ref_name(name), name, name + ".info"]
+                remove += [BackupManager._object_name(d) for d in garbage]
+                kept.sort(key=record_key)
+                BackupManager._commit({}, kept, remove=remove)
+                BackupManager._cache_drop(garbage)
+                return result
+
+        except BackupError:
+            raise
+        except Exception as e:
+            raise BackupError(f"Error aplicando la retención de backups: {e}")
+
+    @staticmethod
+    def prune_async(policy: Optional[RetentionPolicy] = None,
+                    callback: Optional[Callable] = None) -> threading.Thread:
+        """
+        Ejecuta prune en un hilo en segundo plano. callback(resultado, error)
+        se llama al terminar (desde ese hilo).
+        """
+        def worker():
+            try:
+                result = BackupManager.prune(policy)
+                error = None
+            except BackupError as e:
+                result, error = None, e
+            if callback:
+                callback(result, error)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def verify_integrity() -> List[Dict]:
+        """
+        Comprueba que cada objeto del almacén sigue teniendo el hash de su nombre
+        y que todos los snapshots apuntan a objetos existentes.
+
+        Returns:
+            Lista de problemas [{"filename"/"object", "problem"}]; vacía si todo está bien
+        """
+        problems = []
+        checked = {}
+        for record in BackupManager.read_manifest():
+            digest = record.get("object")
+            key = digest or record["filename"]
+            if key not in checked:
+                try:
+                    if digest:
+                        BackupManager._cache_drop([digest])
+                        data = BackupManager._load_object(digest).encode("utf-8")
+                    else:
+                        data = BackupManager._read_bytes(os.path.join(BACKUP_DIR, key))
+                    checked[key] = hashlib.sha256(data).hexdigest() == (digest or record.get("sha256"))
+                except Exception:
+                    checked[key] = None
+            if checked[key] is None:
+                problems.append({"filename": record["filename"], "object": digest,
+                                 "problem": "missing"})
+            elif not checked[key]:
+                problems.append({"filename": record["filename"], "object": digest,
+                                 "problem": "hash mismatch"})
+        return problems
+
+    @staticmethod
+    def create_backup(description: str = "") -> str:
+        """
+        Crea un backup del archivo /etc/exports
+        Retorna el nombre del backup creado
+        """
+        try:
+            content = BackupManager._read_file(EXPORTS_PATH)
+            # Un backup con descripción siempre deja su propia referencia
+            return BackupManager.snapshot(content, description, reuse_latest=not description)
+
         except Exception as e:
             raise BackupError(f"Error creando backup: {e}")
 
+    @staticmethod
+    def _record_date(record: Dict) -> str:
+        try:
+            date = datetime.strptime(record["timestamp"][:15], "%Y%m%d_%H%M%S")
+            return date.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return record["timestamp"]
+
+    @staticmethod
+    def _record_path(record: Dict) -> str:
+        return os.path.join(BACKUP_DIR, BackupManager._object_name(record["object"])
+                            if record.get("object") else record["filename"])
+
+    @staticmethod
+    def listing_entry(record: Dict) -> Dict:
+        """Entrada de list_backups para un registro del manifiesto"""
+        backup = dict(record)
+        backup["date"] = BackupManager._record_date(record)
+        backup["full_path"] = BackupManager._record_path(record)
+        return backup
+
+    @staticmethod
+    def info_entry(record: Dict) -> Dict:
+        """Resultado de get_backup_info (sin contenido) para un registro"""
+        return {
+            "filename": record["filename"],
+            "full_path": BackupManager._record_path(record),
+            "timestamp": record.get("timestamp", ""),
+            "date": BackupManager._record_date(record),
+            "size": record.get("size"),
+            "stored_size": record.get("stored_size", record.get("size")),
+            "sha256": record.get("sha256", ""),
+            "description": record.get("description", ""),
+            "exports_count": record.get("entries"),
+        }
+
     @staticmethod
     def list_backups() -> List[Dict]:
         """
-        Lista todos los backups disponibles
+        Lista todos los backups disponibles (más reciente primero)
         Retorna lista de diccionarios con información de cada backup
         """
         try:
-            # Verificar si el directorio existe
-            res = BackupManager._run_privileged(["test", "-d", BACKUP_DIR])
-            if res.returncode != 0:
+            if not os.path.isdir(BACKUP_DIR):
                 return []
 
-            # Listar archivos de backup
-            res = BackupManager._run_privileged(["ls", "-lt", BACKUP_DIR])
-            if res.returncode != 0:
-                return []
-
-            backups = []
-            for line in res.stdout.split('\n'):
-                if '.bak' in line:
-                    parts = line.split()
-                    if len(parts) >= 9:
-                        filename = parts[-1]
-                        size = parts[4]
-                        date = " ".join(parts[5:8])
-
-                        # Extraer timestamp del nombre
-                        try:
-                            timestamp = filename.split('_')[2] + "_" + filename.split('_')[3].replace('.bak', '')
-                        except:
-                            timestamp = "unknown"
-
-                        # Leer descripción si existe
-                        description = ""
-                        info_file = os.path.join(BACKUP_DIR, filename + ".info")
-                        res_info = BackupManager._run_privileged(["cat", info_file])
-                        if res_info.returncode == 0:
-                            for info_line in res_info.stdout.split('\n'):
-                                if info_line.startswith("Description:"):
-                                    description = info_line.replace("Description:", "").strip()
-
-                        backup = {
-                            "filename": filename,
-                            "timestamp": timestamp,
-                            "size": size,
-                            "date": date,
-                            "description": description,
-                            "full_path": os.path.join(BACKUP_DIR, filename)
-                        }
-                        backups.append(backup)
+            if os.path.exists(os.path.join(BACKUP_DIR, MANIFEST_NAME)):
+                records = BackupManager.read_manifest()
+            else:
+                # Directorio de una versión anterior sin manifiesto
+                records = BackupManager.rebuild_manifest()
 
+            backups = [BackupManager.listing_entry(record) for record in records]
+            backups.sort(key=record_key, reverse=True)
             return backups
 
         except Exception as e:
@@ -148,25 +614,32 @@ class BackupManager:
         Restaura un backup específico
         """
         try:
-            backup_path = os.path.join(BACKUP_DIR, backup_filename)
-
-            # Verificar que el backup existe
-            res = BackupManager._run_privileged(["test", "-f", backup_path])
-            if res.returncode != 0:
-                raise BackupError(f"El backup no existe: {backup_filename}")
-
-            # Crear backup del estado actual antes de restaurar
-            BackupManager.create_backup("Auto-backup antes de restaurar")
-
-            # Restaurar el backup
-            res = BackupManager._run_privileged(["cp", backup_path, EXPORTS_PATH])
-            if res.returncode != 0:
-                raise BackupError(f"No se pudo restaurar backup: {res.stderr}")
+            # Verificar que el backup existe y obtener su contenido
+            content = BackupManager.read_backup_content(backup_filename)
+
+            # Con el cerrojo de /etc/exports, para no pisar a otro escritor
+            with ExportsLock.hold(EXPORTS_PATH):
+                # Crear backup del estado actual antes de restaurar (no ocupa
+                # espacio si ya hay un snapshot idéntico); dentro del cerrojo
+                # para que ningún cambio quede entre el backup y la restauración
+                BackupManager.create_backup("Auto-backup antes de restaurar")
+
+                # Restaurar el backup
+                fd, tmp_path = tempfile.mkstemp(prefix="exports_restore_", text=True)
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        f.write(content)
+                    res = BackupManager._run_privileged(["cp", tmp_path, EXPORTS_PATH])
+                finally:
+                    try: os.remove(tmp_path)
+                    except Exception: pass
+                if res.returncode != 0:
+                    raise BackupError(f"No se pudo restaurar backup: {res.stderr}")
 
-            # Recargar exportfs
-            res = BackupManager._run_privileged(["exportfs", "-ra"])
-            if res.returncode != 0:
-                raise BackupError(f"Backup restaurado pero error al recargar exportfs: {res.stderr}")
+                # Recargar exportfs
+                res = BackupManager._run_privileged(["exportfs", "-ra"])
+                if res.returncode != 0:
+                    raise BackupError(f"Backup restaurado pero error al recargar exportfs: {res.stderr}")
 
             return True
 
@@ -177,54 +650,128 @@ class BackupManager:
     def delete_backup(backup_filename: str) -> bool:
         """Elimina un backup específico"""
         try:
-            backup_path = os.path.join(BACKUP_DIR, backup_filename)
-            info_path = backup_path + ".info"
+            with BackupManager._manifest_lock():
+                records = BackupManager.read_manifest()
+                record = BackupManager._find_record(backup_filename, records)
+                remaining = [r for r in records if r["filename"] != backup_filename]
 
-            # Eliminar archivo de backup
-            res = BackupManager._run_privileged(["rm", "-f", backup_path])
-            if res.returncode != 0:
-                raise BackupError(f"No se pudo eliminar backup: {res.stderr}")
+                remove = [BackupManager._ref_name(backup_filename),
+                          backup_filename, backup_filename + ".info"]
+                # El objeto solo se borra si ningún snapshot lo necesita, ni
+                # directamente ni como base de un delta
+                digest = record.get("object")
+                if digest and digest not in BackupManager._referenced_objects(remaining, records):
+                    remove.append(BackupManager._object_name(digest))
+                    BackupManager._cache_drop([digest])
 
-            # Eliminar archivo de info si existe
-            BackupManager._run_privileged(["rm", "-f", info_path])
+                # Eliminar referencia, archivos y entrada del manifiesto de una vez
+                BackupManager._commit({}, remaining, remove=remove)
 
-            return True
+                return True
 
         except Exception as e:
             raise BackupError(f"Error eliminando backup: {e}")
 
     @staticmethod
-    def get_backup_info(backup_filename: str) -> Optional[Dict]:
-        """Obtiene información detallada de un backup"""
-        try:
-            backup_path = os.path.join(BACKUP_DIR, backup_filename)
-
-            # Verificar que existe
-            res = BackupManager._run_privileged(["test", "-f", backup_path])
-            if res.returncode != 0:
-                return None
-
-            # Obtener información del archivo
-            res = BackupManager._run_privileged(["stat", backup_path])
-            if res.returncode != 0:
-                return None
-
-            # Leer contenido del backup
-            res_content = BackupManager._run_privileged(["cat", backup_path])
-            content = res_content.stdout if res_content.returncode == 0 else ""
+    def _stat_unindexed(path: str) -> Optional[Dict]:
+        """
+        Metadatos de un .bak que no está en el manifiesto con una sola llamada
+        privilegiada (tamaño, mtime, sha256 y número de entradas)
+        """
+        res = BackupManager._run_privileged(["sh", "-c", _STAT_SCRIPT, "sh", path])
+        lines = res.stdout.split()
+        if res.returncode != 0 or len(lines) < 4:
+            return None
+        return {
+            "size": int(lines[0]),
+            "timestamp": datetime.fromtimestamp(int(lines[1])).strftime("%Y%m%d_%H%M%S"),
+            "sha256": lines[2],
+            "entries": int(lines[3]),
+            "description": "",
+        }
 
-            # Contar líneas de exportación
-            export_count = 0
-            for line in content.split('\n'):
-                if line.strip() and not line.strip().startswith('#'):
-                    export_count += 1
+    @staticmethod
+    def get_backup_info(backup_filename: str, include_content: bool = False) -> Optional[Dict]:
+        """
+        Obtiene información detallada de un backup
 
-            return {
-                "filename": backup_filename,
-                "full_path": backup_path,
-                "exports_count": export_count,
-                "content": content
-            }
+        Los metadatos salen del manifiesto sin leer el backup (o de una única
+        llamada si el archivo no está indexado). El contenido solo se carga
+        con include_content=True; para mostrarlo por partes usar
+        iter_backup_content.
+        """
+        try:
+            try:
+                record = BackupManager._find_record(backup_filename)
+            except BackupError:
+                path = os.path.join(BACKUP_DIR, os.path.basename(backup_filename))
+                record = BackupManager._stat_unindexed(path)
+                if record is None:
+                    return None
+                record["filename"] = backup_filename
+
+            info = BackupManager.info_entry(record)
+            if include_content:
+                info["content"] = BackupManager.read_backup_content(backup_filename)
+            return info
 
         except Exception as e:
             raise BackupError(f"Error obteniendo información del backup: {e}")
+
+    @staticmethod
+    def iter_backup_content(backup_filename: str, chunk_size: int = 64 * 1024) -> Iterator[str]:
+        """
+        Devuelve el contenido de un backup por fragmentos de chunk_size
+        caracteres, para mostrarlo sin bloquear la interfaz. Los .bak antiguos
+        se leen del disco a medida que se consumen los fragmentos.
+        """
+        try:
+            record = BackupManager._find_record(backup_filename)
+        except BackupError:
+            record = {}  # .bak antiguo todavía sin indexar
+        path = os.path.join(BACKUP_DIR, backup_filename)
+        try:
+            if record.get("object"):
+                # Los objetos están comprimidos: se reconstruyen enteros (y
+                # quedan en caché) y se entregan por partes
+                content = BackupManager._load_object(record["object"])
+                for i in range(0, len(content), chunk_size):
+                    yield content[i:i + chunk_size]
+                return
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    while True:
+                        chunk = f.read(chunk_size)
+                        if not chunk:
+                            return
+                        yield chunk
+            except PermissionError:
+                pass
+        except (OSError, ValueError) as e:
+            raise BackupError(f"No se pudo leer el backup {backup_filename}: {e}")
+
+        priv_cmd = BackupManager._get_privilege_command()
+        try:
+            proc = subprocess.Popen(([priv_cmd] if priv_cmd else []) + ["cat", path],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+        except OSError as e:
+            raise BackupError(f"No se pudo leer {path}: {e}")
+        try:
+            while True:
+                try:
+                    chunk = proc.stdout.read(chunk_size)
+                except ValueError as e:
+                    raise BackupError(f"No se pudo leer el backup {backup_filename}: {e}")
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            # Sin kill(): el hijo es de root (pkexec) y no se le pueden mandar
+            # señales; al cerrar la tubería 'cat' termina por sí solo
+            proc.stdout.close()
+            error = proc.stderr.read().strip()
+            proc.stderr.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise BackupError(f"No se pudo leer {path}: {error or f'código {proc.returncode}'}")
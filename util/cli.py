@@ -0,0 +1,698 @@
+"""
+cli
+---
+Interfaz de línea de comandos sin GUI:
+
+    python -m util.cli list
+    python -m util.cli add /srv/nfs "192.168.1.0/24(rw,sync)"
+    python -m util.cli remove /srv/nfs
+    python -m util.cli edit /srv/nfs "10.0.0.0/8(ro)"
+    python -m util.cli apply cambios.json        (o .yaml, o '-' para stdin)
+    python -m util.cli lint [archivo]            (por defecto /etc/exports)
+    python -m util.cli provision DIRECTORIOS [--dry-run] [--workers N]   (JSON/YAML)
+    python -m util.cli normalize RUTA [--owner U] [--group G] [--dir-mode M] [--file-mode M] [--dry-run]
+    python -m util.cli reconcile ESTADO [--dry-run] [--no-prune]   (ESTADO: JSON/YAML/exports)
+    python -m util.cli access CLIENTE... [--clients-file F] [--netgroup G] [--resolve]
+    python -m util.cli mount list|add|remove ...
+    python -m util.cli status
+    python -m util.cli capacity [--warn PCT] [--critical PCT]
+    python -m util.cli backup list|create|restore|delete|prune ...
+    python -m util.cli fleet [-i INVENTARIO] [--limit PATRÓN] status|list|apply|service|backup ...
+
+La salida es JSON en stdout (--format text para una salida legible). Los
+errores se escriben como {"error": ...} en stderr con código de salida 1.
+
+Un archivo de 'apply' es una lista de cambios o un objeto con la clave
+"changes" (y opcionalmente "mounts" y "unmounts"):
+
+    {"changes": [
+        {"op": "set", "path": "/srv/a", "hosts": "10.0.0.0/8(rw,sync)"},
+        {"op": "remove", "path": "/srv/old"},
+        {"op": "add", "path": "/srv/b",
+         "hosts": [{"name": "*", "options": ["ro", "sync"]}]}
+    ]}
+
+Cada montaje es {"server", "remote_path", "mount_point", "options"} y cada
+desmontaje una ruta o {"mount_point", "force", "lazy"}; todos se validan
+antes de modificar nada.
+
+Todos los cambios de exports se aplican como una única modificación de
+/etc/exports (un backup, una escritura y un 'exportfs -ra'). YAML requiere
+PyYAML instalado.
+
+Un archivo de 'provision' es una lista de directorios o un objeto con
+"directories" y, opcionalmente, plantillas reutilizables (formato completo
+en util/provision.py). Los directorios con "export" se exportan después, en
+una única modificación de /etc/exports:
+
+    {"templates": {"home": {"mode": "0700", "owner": "{name}", "group": "users",
+                            "acl": ["u:backup:rx", "d:u:backup:rx"]}},
+     "directories": [
+        {"path": "/srv/home/alice", "template": "home"},
+        {"path": "/srv/proyectos", "mode": "2775", "group": "proyectos",
+         "export": "10.0.0.0/8(rw,sync)"}
+    ]}
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from util.exports_manager import ExportsManager, ExportsError
+from util.exports_lint import ExportsLint
+from util.exports_access import AccessIndex
+from util.exports_reconcile import DEFAULT_INTERVAL, DesiredState, ExportsReconcile
+from util.add_directory import Add, ProvisionError
+from util.provision import DEFAULT_WORKERS as PROVISION_WORKERS
+from util.normalize_tree import DEFAULT_WORKERS as NORMALIZE_WORKERS
+from util.exports_diff import effective_options
+from util.export_capacity import CRITICAL, ExportCapacity, MISSING, OK, UNAVAILABLE, format_bytes
+from util.backup_manager import BackupManager, BackupError
+from util.mount_manager import MountManager, MountError
+from util.service_manager import ServiceManager, ServiceError
+from util.fleet import DEFAULT_WORKERS, Fleet, FleetError, Inventory, TRANSPORTS, format_table
+
+
+class CliError(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# Entrada
+# ----------------------------------------------------------------------
+
+def parse_spec(text: str, fmt: Optional[str] = None) -> Any:
+    """
+    Parsea un documento JSON o YAML. Sin fmt se prueba JSON y, si falla,
+    YAML (si PyYAML está disponible).
+    """
+    if fmt in (None, "json"):
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            if fmt == "json":
+                raise CliError(f"JSON inválido: {e}")
+    try:
+        import yaml
+    except ImportError:
+        raise CliError("La entrada no es JSON válido y PyYAML no está instalado para leer YAML")
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise CliError(f"YAML inválido: {e}")
+
+
+def read_text(source: str) -> str:
+    """Contenido de un archivo ('-' = stdin)"""
+    if source == "-":
+        return sys.stdin.read()
+    try:
+        with open(source, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError as e:
+        raise CliError(f"No se pudo leer {source}: {e}")
+
+
+def read_spec(source: str, fmt: Optional[str] = None) -> Any:
+    """Lee un archivo de cambios ('-' = stdin); el formato sale de la extensión"""
+    text = read_text(source)
+    if source != "-" and fmt is None:
+        ext = os.path.splitext(source)[1].lower()
+        fmt = {".json": "json", ".yaml": "yaml", ".yml": "yaml"}.get(ext)
+    return parse_spec(text, fmt)
+
+
+def split_spec(spec: Any) -> Dict[str, List]:
+    """Separa un documento en cambios de exports, montajes y desmontajes"""
+    if spec is None:
+        spec = []
+    if isinstance(spec, list):
+        spec = {"changes": spec}
+    if not isinstance(spec, dict):
+        raise CliError("El documento debe ser una lista de cambios o un objeto con 'changes'")
+    unknown = set(spec) - {"changes", "mounts", "unmounts"}
+    if unknown:
+        raise CliError(f"Claves desconocidas en el documento: {', '.join(sorted(unknown))}")
+    parts = {key: spec.get(key) or [] for key in ("changes", "mounts", "unmounts")}
+    for key, value in parts.items():
+        if not isinstance(value, list):
+            raise CliError(f"'{key}' debe ser una lista")
+    # Montajes y desmontajes se validan aquí, antes de tocar /etc/exports
+    parts["mounts"] = [_mount_item(item, n) for n, item in enumerate(parts["mounts"], start=1)]
+    parts["unmounts"] = [_unmount_item(item, n) for n, item in enumerate(parts["unmounts"], start=1)]
+    return parts
+
+
+def _mount_item(item: Any, n: int) -> Dict:
+    if not isinstance(item, dict):
+        raise CliError(f"Montaje {n} inválido: {item!r}")
+    for key in ("server", "remote_path", "mount_point"):
+        if not isinstance(item.get(key), str) or not item[key].strip():
+            raise CliError(f"Montaje {n}: falta '{key}'")
+    if not item["mount_point"].startswith("/"):
+        raise CliError(f"Montaje {n}: el punto de montaje debe ser absoluto: {item['mount_point']}")
+    if not isinstance(item.get("options", ""), str):
+        raise CliError(f"Montaje {n}: 'options' debe ser una cadena")
+    unknown = set(item) - {"server", "remote_path", "mount_point", "options"}
+    if unknown:
+        raise CliError(f"Montaje {n}: claves desconocidas: {', '.join(sorted(unknown))}")
+    return {"server": item["server"], "remote_path": item["remote_path"],
+            "mount_point": item["mount_point"], "options": item.get("options", "")}
+
+
+def _unmount_item(item: Any, n: int) -> Dict:
+    if isinstance(item, str):
+        item = {"mount_point": item}
+    if not isinstance(item, dict):
+        raise CliError(f"Desmontaje {n} inválido: {item!r}")
+    mount_point = item.get("mount_point")
+    if not isinstance(mount_point, str) or not mount_point.startswith("/"):
+        raise CliError(f"Desmontaje {n}: falta 'mount_point' absoluto")
+    unknown = set(item) - {"mount_point", "force", "lazy"}
+    if unknown:
+        raise CliError(f"Desmontaje {n}: claves desconocidas: {', '.join(sorted(unknown))}")
+    return {"mount_point": mount_point, "force": bool(item.get("force")),
+            "lazy": bool(item.get("lazy"))}
+
+
+# ----------------------------------------------------------------------
+# Salida
+# ----------------------------------------------------------------------
+
+def _text(value: Any, indent: int = 0) -> str:
+    pad = "  " * indent
+    if isinstance(value, dict):
+        lines = []
+        for k, v in value.items():
+            if isinstance(v, (dict, list)) and v:
+                lines.append(f"{pad}{k}:")
+                lines.append(_text(v, indent + 1))
+            else:
+                lines.append(f"{pad}{k}: {v}")
+        return "\n".join(lines)
+    if isinstance(value, list):
+        if value and all(isinstance(v, dict) for v in value):
+            return "\n\n".join(_text(v, indent) for v in value)
+        return "\n".join(_text(v, indent) if isinstance(v, (dict, list))
+                         else f"{pad}- {v}" for v in value) or f"{pad}(vacío)"
+    return f"{pad}{value}"
+
+
+def emit(value: Any, fmt: str = "json") -> None:
+    if fmt == "text":
+        print(_text(value))
+    else:
+        print(json.dumps(value, indent=2, ensure_ascii=False, default=str))
+
+
+# ----------------------------------------------------------------------
+# Subcomandos
+# ----------------------------------------------------------------------
+
+def cmd_list(args) -> Any:
+    entries = ExportsManager.list_parsed()
+    if not args.raw:
+        for entry in entries:
+            entry.pop("raw", None)
+    return entries
+
+
+def cmd_change(args) -> Any:
+    change = {"op": args.command, "path": args.path}
+    if args.command != "remove":
+        change["hosts"] = " ".join(args.hosts)
+    return ExportsManager.apply_changes([change], dry_run=args.dry_run, base_hash=args.base_hash)
+
+
+def cmd_lint(args) -> Any:
+    if args.file is None:
+        text = "\n".join(ExportsManager.list_raw()) + "\n"
+    else:
+        text = read_text(args.file)
+    issues = ExportsLint.check_text(text)
+    if ExportsLint.errors(issues):
+        args.exit_code = 2
+    if args.format == "text":
+        return ExportsLint.format(issues) or "Sin problemas"
+    return issues
+
+
+def cmd_access(args) -> Any:
+    clients = list(args.clients)
+    if args.clients_file:
+        clients += read_text(args.clients_file).replace(",", " ").split()
+    if not clients:
+        raise CliError("Indique al menos un cliente (IP o nombre de host)")
+    if args.exports:
+        index = AccessIndex.from_text(read_text(args.exports))
+    else:
+        index = AccessIndex.load()
+    results = index.query_many(clients, netgroups=args.netgroup, resolve=args.resolve)
+    if args.format == "text":
+        lines = []
+        for client, rows in results.items():
+            if not rows:
+                lines.append(f"{client}: sin acceso")
+            for row in rows:
+                lines.append(f"{client}  {row['path']}  {row['rule']} ({row['kind']})  "
+                             f"{row['access']}  {row['options'] or '()'}")
+        return "\n".join(lines)
+    if len(clients) == 1 and not args.clients_file:
+        return results[clients[0]]
+    return results
+
+
+def cmd_reconcile(args) -> Any:
+    if args.print_units:
+        command = f"{sys.executable} -m util.cli reconcile {os.path.abspath(args.file)}"
+        if args.no_prune:
+            command += " --no-prune"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        units = ExportsReconcile.render_units(command, args.interval, working_directory=root)
+        return "\n".join(f"# {name}\n{text}" for name, text in units.items())
+
+    text = read_text(args.file)
+    fmt = args.input_format
+    if fmt is None and args.file != "-":
+        ext = os.path.splitext(args.file)[1].lower()
+        fmt = {".json": "json", ".yaml": "yaml", ".yml": "yaml"}.get(ext, "exports")
+    if fmt is None:
+        fmt = "json" if text.lstrip()[:1] in ("{", "[") else "exports"
+
+    def load() -> DesiredState:
+        if fmt == "exports":
+            return DesiredState.from_exports_text(text, prune=not args.no_prune)
+        desired = DesiredState.from_document(parse_spec(text, fmt))
+        if args.no_prune:
+            desired.prune = False
+        return desired
+
+    key = ExportsReconcile.source_key(text, fmt, args.no_prune)
+    result = ExportsReconcile.reconcile(load, key, dry_run=args.dry_run, force=args.force,
+                                        targeted=not args.full_reload)
+    if args.format == "text":
+        if not result["drift"]:
+            return f"Sin deriva ({result['elapsed'] * 1000:.1f} ms)"
+        lines = [f"{c['op']} {c['path']} {c.get('hosts', '')}".rstrip() for c in result["changes"]]
+        verb = "pendientes (dry-run)" if args.dry_run else "aplicados"
+        return "\n".join(lines + [f"{len(lines)} cambio(s) {verb}"])
+    return result
+
+
+def cmd_provision(args) -> Any:
+    spec = read_spec(args.file, args.input_format)
+    if isinstance(spec, list):
+        spec = {"directories": spec}
+    if not isinstance(spec, dict) or not isinstance(spec.get("directories"), list):
+        raise CliError("El documento debe ser una lista de directorios o un objeto con 'directories'")
+    unknown = set(spec) - {"directories", "templates"}
+    if unknown:
+        raise CliError(f"Claves desconocidas en el documento: {', '.join(sorted(unknown))}")
+    templates = spec.get("templates") or {}
+    directories = spec["directories"]
+
+    result = Add.provision(directories, templates, dry_run=args.dry_run, workers=args.workers)
+    changes = []
+    for item, status in zip(directories, result["results"]):
+        if not isinstance(item, dict) or status["status"] == "error":
+            continue
+        export = item.get("export", templates.get(item.get("template"), {}).get("export"))
+        if export:
+            changes.append({"op": "set", "path": status["path"], "hosts": export})
+    if changes:
+        result["exports"] = ExportsManager.apply_changes(changes, dry_run=args.dry_run)
+    if result["errors"]:
+        args.exit_code = 2
+    if args.format == "text":
+        lines = [f"{r['status']:9}  {r['path']}  {r.get('error') or ', '.join(r['actions'])}".rstrip()
+                 for r in result["results"] if r["status"] != "unchanged" or args.verbose]
+        lines.append(f"{result['created']} creados, {result['updated']} ajustados, "
+                     f"{result['unchanged']} sin cambios, {result['errors']} con error"
+                     + (" (dry-run)" if args.dry_run else ""))
+        if changes:
+            lines.append(f"{len(changes)} exportación(es) " + ("pendientes" if args.dry_run else "aplicadas"))
+        return "\n".join(lines)
+    return result
+
+
+def cmd_normalize(args) -> Any:
+    policy = {"owner": args.owner, "group": args.group, "dir_mode": args.dir_mode,
+              "file_mode": args.file_mode, "exec_mode": args.exec_mode}
+    if args.from_export:
+        # Propietario y grupo = anonuid/anongid de la primera regla de la exportación
+        entries = [e for e in ExportsManager.list_parsed() if e["path"] == args.root]
+        hosts = [h for e in entries for h in e["hosts"] if not h["name"].startswith("-")]
+        if not hosts:
+            raise CliError(f"{args.root} no está exportado")
+        options = effective_options(hosts[0].get("options", ""))
+        policy["owner"] = policy["owner"] or options.get("anonuid")
+        policy["group"] = policy["group"] or options.get("anongid")
+
+    shown = []
+
+    def progress(counts: Dict) -> None:
+        shown.append(True)
+        sys.stderr.write(f"\r{counts['scanned']} revisados, {counts['changed']} por cambiar, "
+                         f"{counts['errors']} errores ({counts['elapsed']} s)")
+        sys.stderr.flush()
+
+    result = Add.normalize_tree(args.root, policy, dry_run=args.dry_run, workers=args.workers,
+                                one_file_system=not args.cross_mounts,
+                                progress=None if args.quiet else progress)
+    if shown:
+        sys.stderr.write("\n")
+    if result["errors"]:
+        args.exit_code = 2
+    if args.format == "text":
+        verb = "a cambiar (dry-run)" if args.dry_run else "cambiados"
+        lines = [f"{result['scanned']} inodos revisados en {result['elapsed']} s, "
+                 f"{result['changed']} {verb} ({result['chown']} chown, {result['chmod']} chmod), "
+                 f"{result['errors']} errores"]
+        if result["skipped_mounts"]:
+            lines.append(f"{result['skipped_mounts']} puntos de montaje no recorridos")
+        return "\n".join(lines + result["error_samples"])
+    return result
+
+
+def cmd_apply(args) -> Any:
+    parts = split_spec(read_spec(args.file, args.input_format))
+    result = {}
+    if parts["changes"]:
+        result["exports"] = ExportsManager.apply_changes(parts["changes"], dry_run=args.dry_run,
+                                                         base_hash=args.base_hash)
+    if parts["unmounts"]:
+        result["unmounted"] = []
+        for item in parts["unmounts"]:
+            if not args.dry_run:
+                MountManager.unmount_nfs(item["mount_point"], force=item["force"], lazy=item["lazy"])
+            result["unmounted"].append(item["mount_point"])
+    if parts["mounts"]:
+        result["mounted"] = []
+        for item in parts["mounts"]:
+            if not args.dry_run:
+                MountManager.mount_nfs(item["server"], item["remote_path"],
+                                       item["mount_point"], item["options"])
+            result["mounted"].append(item["mount_point"])
+    result["dry_run"] = args.dry_run
+    return result
+
+
+def cmd_capacity(args) -> Any:
+    paths = [e["path"] for e in ExportsManager.list_parsed()]
+    capacity = ExportCapacity.collect(paths, warn=args.warn, critical=args.critical)
+    if any(info["level"] in (CRITICAL, MISSING, UNAVAILABLE) for info in capacity.values()):
+        args.exit_code = 2
+    if args.only_alerts:
+        capacity = {p: info for p, info in capacity.items() if info["level"] != OK}
+    if args.format == "text":
+        rows = []
+        for path, info in capacity.items():
+            if "used_pct" in info:
+                rows.append(f"{info['level']:11} {info['used_pct']:5.1f}% {info['inodes_pct']:5.1f}%i "
+                            f"{format_bytes(info['free']):>8} libres  {path}  "
+                            f"({info['mount_point']}, {info['fstype']})")
+            else:
+                rows.append(f"{info['level']:11} {'':23} {path}  ({info.get('error', '')})")
+        return "\n".join(rows) or "Sin alertas"
+    return capacity
+
+
+def cmd_mount(args) -> Any:
+    if args.action == "list":
+        mounts = MountManager.get_mounted_nfs()
+        if args.health:
+            mounts = MountManager.check_health(mounts)
+        return mounts
+    if args.action == "add":
+        if ":" not in args.source:
+            raise CliError("El origen debe tener la forma servidor:/ruta")
+        server, remote = args.source.split(":", 1)
+        MountManager.mount_nfs(server, remote, args.mount_point, args.options or "")
+        if args.fstab:
+            MountManager.add_to_fstab(server, remote, args.mount_point,
+                                      args.options or "defaults,_netdev")
+        return {"mounted": args.mount_point, "fstab": args.fstab}
+    if args.action == "remove":
+        MountManager.unmount_nfs(args.mount_point, force=args.force, lazy=args.lazy)
+        if args.fstab:
+            MountManager.remove_from_fstab(args.mount_point)
+        return {"unmounted": args.mount_point, "fstab": args.fstab}
+    raise CliError(f"Acción desconocida: {args.action}")
+
+
+def cmd_status(args) -> Any:
+    status = ServiceManager.status()
+    if not args.verbose:
+        status.pop("status_output", None)
+    result = {"service": status}
+    try:
+        result["exports_active"] = ServiceManager.get_exports_active()
+    except ServiceError as e:
+        result["exports_active_error"] = str(e)
+    result["clients"] = ServiceManager.get_connected_clients()
+    result["mounts"] = MountManager.check_health()
+    return result
+
+
+def cmd_backup(args) -> Any:
+    if args.action == "list":
+        return BackupManager.list_backups()
+    if args.action == "create":
+        return {"created": BackupManager.create_backup(args.description or "")}
+    if args.action == "restore":
+        BackupManager.restore_backup(args.name)
+        return {"restored": args.name}
+    if args.action == "delete":
+        BackupManager.delete_backup(args.name)
+        return {"deleted": args.name}
+    if args.action == "show":
+        info = BackupManager.get_backup_info(args.name, include_content=args.content)
+        if info is None:
+            raise CliError(f"El backup no existe: {args.name}")
+        return info
+    if args.action == "prune":
+        return BackupManager.prune(dry_run=args.dry_run)
+    raise CliError(f"Acción desconocida: {args.action}")
+
+
+def _fleet_progress(event: Dict) -> None:
+    """Una línea en stderr por host terminado"""
+    if event["state"] == "done":
+        detail = f" ({event['error'].splitlines()[0]})" if event["error"] else ""
+        sys.stderr.write(f"[{event['done']}/{event['total']}] {event['host']}: "
+                         f"{event['status']} {event['duration']:.2f}s{detail}\n")
+        sys.stderr.flush()
+
+
+def cmd_fleet(args) -> Any:
+    fleet = Fleet(Inventory.load(args.inventory), transport=args.transport,
+                  workers=args.workers, timeout=args.timeout)
+    params = {}
+    if args.action == "list":
+        operation = "exports.list"
+    elif args.action == "apply":
+        parts = split_spec(read_spec(args.file, args.input_format))
+        if parts["mounts"] or parts["unmounts"]:
+            raise CliError("En la flota solo se admiten cambios de exports ('changes')")
+        operation, params = "exports.apply", {"changes": parts["changes"],
+                                              "dry_run": args.dry_run}
+    elif args.action == "status":
+        operation = "service.status"
+    elif args.action == "service":
+        operation = f"service.{args.service_action}"
+    else:
+        operation = f"backup.{args.backup_action}"
+
+    progress = None if args.quiet else _fleet_progress
+    results = fleet.run(operation, hosts=args.limit, progress=progress, **params)
+    if any(r["status"] in ("failed", "unreachable") for r in results):
+        args.exit_code = 2
+    if args.format == "text":
+        return format_table(results)
+    return results
+
+
+BASE_HASH_HELP = ("hash de /etc/exports ('hash' de una ejecución anterior): falla si "
+                  "otro escritor cambió las mismas rutas desde entonces")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m util.cli",
+                                     description="Gestión de NFS sin interfaz gráfica")
+    parser.add_argument("--format", choices=("json", "text"), default="json",
+                        help="formato de salida (por defecto json)")
+    sub = parser.add_subparsers(dest="command", metavar="COMANDO")
+    sub.required = True
+
+    p = sub.add_parser("list", help="lista las entradas de /etc/exports")
+    p.add_argument("--raw", action="store_true", help="incluir la línea original")
+    p.set_defaults(func=cmd_list)
+
+    for name, help_text in (("add", "añade una exportación"),
+                            ("edit", "cambia los hosts de una exportación"),
+                            ("remove", "elimina una exportación")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("path")
+        if name != "remove":
+            p.add_argument("hosts", nargs="+", help='p. ej. "192.168.1.0/24(rw,sync)"')
+        p.add_argument("--dry-run", action="store_true")
+        p.add_argument("--base-hash", help=BASE_HASH_HELP)
+        p.set_defaults(func=cmd_change)
+
+    p = sub.add_parser("lint", help="valida /etc/exports o un archivo con su formato ('-' = stdin)")
+    p.add_argument("file", nargs="?")
+    p.set_defaults(func=cmd_lint)
+
+    p = sub.add_parser("access", help="exportaciones que puede montar cada cliente")
+    p.add_argument("clients", nargs="*", metavar="CLIENTE", help="IP o nombre de host")
+    p.add_argument("--clients-file", help="archivo con clientes separados por espacios, "
+                                          "comas o líneas ('-' = stdin)")
+    p.add_argument("--netgroup", action="append", default=[],
+                   help="netgroup al que pertenecen los clientes (repetible)")
+    p.add_argument("--resolve", action="store_true", help="completar IPs y nombres por DNS")
+    p.add_argument("--exports", help="consultar este archivo en lugar de /etc/exports")
+    p.set_defaults(func=cmd_access)
+
+    p = sub.add_parser("reconcile", help="converge /etc/exports a un estado deseado "
+                                         "(JSON/YAML o formato exports, '-' = stdin)")
+    p.add_argument("file")
+    p.add_argument("--input-format", choices=("json", "yaml", "exports"))
+    p.add_argument("--dry-run", action="store_true", help="mostrar los cambios sin aplicarlos")
+    p.add_argument("--no-prune", action="store_true",
+                   help="no eliminar las exportaciones que no estén en el estado deseado")
+    p.add_argument("--force", action="store_true", help="comparar aunque el hash indique que no hay deriva")
+    p.add_argument("--full-reload", action="store_true",
+                   help="recargar con 'exportfs -ra' en lugar de solo las reglas cambiadas")
+    p.add_argument("--print-units", action="store_true",
+                   help="mostrar un .service y un .timer de systemd que lo ejecutan periódicamente")
+    p.add_argument("--interval", default=DEFAULT_INTERVAL, help="intervalo del timer (por defecto 1min)")
+    p.set_defaults(func=cmd_reconcile)
+
+    p = sub.add_parser("provision", help="crea en lote directorios con modo, propietario y ACL "
+                                         "(JSON/YAML, '-' = stdin)")
+    p.add_argument("file", nargs="?", default="-")
+    p.add_argument("--input-format", choices=("json", "yaml"))
+    p.add_argument("--dry-run", action="store_true", help="mostrar qué cambiaría sin tocar nada")
+    p.add_argument("--workers", type=int, default=PROVISION_WORKERS,
+                   help="hilos para las llamadas al sistema de archivos")
+    p.add_argument("-v", "--verbose", action="store_true",
+                   help="listar también los directorios sin cambios (--format text)")
+    p.set_defaults(func=cmd_provision)
+
+    p = sub.add_parser("normalize", help="ajusta en paralelo propietario, grupo y permisos "
+                                         "de todo un árbol exportado")
+    p.add_argument("root", metavar="RUTA")
+    p.add_argument("--owner", help="usuario o uid")
+    p.add_argument("--group", help="grupo o gid")
+    p.add_argument("--dir-mode", help="modo octal de los directorios (p. ej. 2775)")
+    p.add_argument("--file-mode", help="modo octal de los archivos (p. ej. 0664)")
+    p.add_argument("--exec-mode", help="modo de los archivos que ya son ejecutables "
+                                       "(por defecto --file-mode)")
+    p.add_argument("--from-export", action="store_true",
+                   help="propietario y grupo = anonuid/anongid de la exportación RUTA")
+    p.add_argument("--dry-run", action="store_true", help="solo contar los inodos que cambiarían")
+    p.add_argument("--workers", type=int, default=NORMALIZE_WORKERS)
+    p.add_argument("--cross-mounts", action="store_true",
+                   help="entrar también en otros sistemas de archivos montados dentro")
+    p.add_argument("-q", "--quiet", action="store_true", help="sin progreso en stderr")
+    p.set_defaults(func=cmd_normalize)
+
+    p = sub.add_parser("apply", help="aplica en lote un archivo de cambios (JSON/YAML, '-' = stdin)")
+    p.add_argument("file", nargs="?", default="-")
+    p.add_argument("--input-format", choices=("json", "yaml"))
+    p.add_argument("--dry-run", action="store_true", help="mostrar el resultado sin aplicarlo")
+    p.add_argument("--base-hash", help=BASE_HASH_HELP)
+    p.set_defaults(func=cmd_apply)
+
+    p = sub.add_parser("mount", help="montajes NFS del cliente")
+    msub = p.add_subparsers(dest="action", metavar="ACCIÓN")
+    msub.required = True
+    m = msub.add_parser("list")
+    m.add_argument("--health", action="store_true", help="sondear el estado de cada montaje")
+    m = msub.add_parser("add")
+    m.add_argument("source", help="servidor:/ruta")
+    m.add_argument("mount_point")
+    m.add_argument("-o", "--options")
+    m.add_argument("--fstab", action="store_true", help="añadir también a /etc/fstab")
+    m = msub.add_parser("remove")
+    m.add_argument("mount_point")
+    m.add_argument("--force", action="store_true")
+    m.add_argument("--lazy", action="store_true")
+    m.add_argument("--fstab", action="store_true", help="quitar también de /etc/fstab")
+    p.set_defaults(func=cmd_mount)
+
+    p = sub.add_parser("status", help="estado del servicio, exportaciones y montajes")
+    p.add_argument("-v", "--verbose", action="store_true")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("capacity", help="espacio e inodos de cada exportación (un statvfs "
+                                        "por sistema de archivos)")
+    p.add_argument("--warn", type=float, help="%% de uso para avisar (NFS_MANAGER_CAPACITY_WARN, 85)")
+    p.add_argument("--critical", type=float,
+                   help="%% de uso crítico (NFS_MANAGER_CAPACITY_CRITICAL, 95)")
+    p.add_argument("--only-alerts", action="store_true", help="mostrar solo las exportaciones con alerta")
+    p.set_defaults(func=cmd_capacity)
+
+    p = sub.add_parser("backup", help="backups de /etc/exports")
+    bsub = p.add_subparsers(dest="action", metavar="ACCIÓN")
+    bsub.required = True
+    bsub.add_parser("list")
+    b = bsub.add_parser("create")
+    b.add_argument("-d", "--description")
+    for action in ("restore", "delete"):
+        b = bsub.add_parser(action)
+        b.add_argument("name")
+    b = bsub.add_parser("show")
+    b.add_argument("name")
+    b.add_argument("--content", action="store_true")
+    b = bsub.add_parser("prune")
+    b.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("fleet", help="opera sobre varios servidores NFS en paralelo")
+    p.add_argument("-i", "--inventory", help="inventario INI (Ansible) o JSON")
+    p.add_argument("--limit", action="append", metavar="PATRÓN",
+                   help="hosts o grupos (fnmatch, repetible)")
+    p.add_argument("--transport", choices=sorted(TRANSPORTS), default="ssh")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="hosts atendidos a la vez")
+    p.add_argument("--timeout", type=float, default=120, help="segundos por comando remoto")
+    p.add_argument("-q", "--quiet", action="store_true", help="sin progreso en stderr")
+    fsub = p.add_subparsers(dest="action", metavar="ACCIÓN")
+    fsub.required = True
+    fsub.add_parser("list", help="exports de cada servidor")
+    fsub.add_parser("status", help="estado de nfs-server en cada servidor")
+    f = fsub.add_parser("apply", help="aplica un archivo de cambios en todos los servidores")
+    f.add_argument("file", nargs="?", default="-")
+    f.add_argument("--input-format", choices=("json", "yaml"))
+    f.add_argument("--dry-run", action="store_true")
+    f = fsub.add_parser("service")
+    f.add_argument("service_action", choices=("start", "stop", "restart"))
+    f = fsub.add_parser("backup")
+    f.add_argument("backup_action", choices=("create", "list"))
+    p.set_defaults(func=cmd_fleet)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        result = args.func(args)
+        if isinstance(result, str):
+            print(result)
+        else:
+            emit(result, args.format)
+        return getattr(args, "exit_code", 0)
+    except (CliError, ExportsError, BackupError, MountError, ServiceError, FleetError,
+            ProvisionError, ValueError) as e:
+        sys.stderr.write(json.dumps({"error": str(e), "type": type(e).__name__},
+                                    ensure_ascii=False) + "\n")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
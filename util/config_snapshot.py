@@ -0,0 +1,408 @@
+"""
+ConfigSnapshot
+--------------
+Snapshots de toda la configuración NFS del sistema (/etc/exports,
+/etc/exports.d/*, /etc/fstab, /etc/nfs.conf, /etc/nfs.conf.d/* y
+/etc/idmapd.conf) como un único archivo tar.gz.
+
+La captura es una sola llamada privilegiada a 'tar' y la restauración otra
+sola llamada que prepara todos los archivos y después los instala con rename
+atómico, de modo que un cambio que afecta a varios archivos se guarda y se
+deshace de una vez; si algo falla a medias se reinstala el auto-backup. Cada miembro guarda su sha256 para verificarlo antes de restaurar y para
+poder restaurar solo los archivos que se elijan.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from util.backup_manager import BackupManager, BackupError, BACKUP_DIR
+from util.exports_lock import ExportsLock
+
+# Raíz del sistema de archivos sobre la que se capturan y restauran las rutas
+CONFIG_ROOT = "/"
+CONFIG_PATHS = [
+    "/etc/exports",
+    "/etc/exports.d",
+    "/etc/fstab",
+    "/etc/nfs.conf",
+    "/etc/nfs.conf.d",
+    "/etc/idmapd.conf",
+]
+# Subdirectorio de BACKUP_DIR: <nombre>.tar.gz + <nombre>.json (metadatos)
+CONFIG_DIR = "configs"
+
+# Instala archivos (origen destino modo uid:gid) con temporal + rename, borra
+# los indicados tras "--rm" y, si $1 es 1, recarga exportfs. Todo en una
+# única llamada privilegiada. Primero se preparan todos los temporales junto
+# a su destino y solo después se renombran, así que un fallo al copiar no
+# cambia nada (código 1). Si falla un rename o un borrado sale con 2 y si
+# falla exportfs con 3: en esos casos la configuración ya cambió.
+_RESTORE_SCRIPT = (
+    'stage() {\n'
+    '  while [ $# -gt 0 ] && [ "$1" != "--rm" ]; do\n'
+    '    mkdir -p "$(dirname "$2")" && cp "$1" "$2.nfsmgr.tmp" || return 1\n'
+    '    chown "$4" "$2.nfsmgr.tmp" 2>/dev/null\n'
+    '    chmod "$3" "$2.nfsmgr.tmp" || return 1\n'
+    '    shift 4\n'
+    '  done\n'
+    '}\n'
+    'unstage() {\n'
+    '  while [ $# -gt 0 ] && [ "$1" != "--rm" ]; do rm -f "$2.nfsmgr.tmp"; shift 4; done\n'
+    '}\n'
+    'install_all() {\n'
+    '  while [ $# -gt 0 ] && [ "$1" != "--rm" ]; do\n'
+    '    mv -f "$2.nfsmgr.tmp" "$2" || return 1\n'
+    '    shift 4\n'
+    '  done\n'
+    '  if [ "$1" = "--rm" ]; then shift; rm -f "$@" || return 1; fi\n'
+    '}\n'
+    'reload="$1"; shift\n'
+    'if ! stage "$@"; then unstage "$@"; exit 1; fi\n'
+    'if ! install_all "$@"; then unstage "$@"; exit 2; fi\n'
+    'if [ "$reload" = "1" ]; then exportfs -ra || exit 3; fi\n'
+)
+# Códigos de _RESTORE_SCRIPT con los que la configuración quedó modificada
+_PARTIAL_EXIT_CODES = (2, 3)
+
+
+class ConfigSnapshotError(BackupError):
+    pass
+
+
+class ConfigSnapshot:
+    """Captura y restaura el conjunto completo de archivos de configuración NFS"""
+
+    @staticmethod
+    def _relative(path: str) -> str:
+        return os.path.normpath(path).lstrip("/")
+
+    @staticmethod
+    def _absolute(member_name: str) -> str:
+        return "/" + os.path.normpath(member_name).lstrip("/")
+
+    @staticmethod
+    def _on_disk(path: str) -> str:
+        """Ruta real de un archivo de configuración bajo CONFIG_ROOT"""
+        return os.path.join(CONFIG_ROOT, ConfigSnapshot._relative(path))
+
+    @staticmethod
+    def collect(paths: Optional[Iterable[str]] = None) -> bytes:
+        """
+        Empaqueta los archivos de configuración actuales con un único 'tar'
+        privilegiado. Las rutas que no existen se omiten.
+        """
+        paths = list(paths or CONFIG_PATHS)
+        res = BackupManager._run_privileged(
+            ["tar", "-czf", "-", "--ignore-failed-read", "-C", CONFIG_ROOT]
+            + [ConfigSnapshot._relative(p) for p in paths],
+            text=False, timeout=60)
+        if res.returncode != 0:
+            raise ConfigSnapshotError(
+                f"No se pudo leer la configuración: {res.stderr.decode('utf-8', 'replace').strip()}")
+        return res.stdout
+
+    @staticmethod
+    def members(archive: bytes) -> Dict[str, Dict]:
+        """
+        Metadatos y sha256 de cada archivo regular de un tar.gz
+
+        Returns:
+            {"/etc/fstab": {"sha256", "size", "mode", "uid", "gid", "mtime"}}
+        """
+        members = {}
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+            for member in tar.getmembers():
+                if not member.isfile():
+                    continue
+                data = tar.extractfile(member).read()
+                members[ConfigSnapshot._absolute(member.name)] = {
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                    "size": member.size,
+                    "mode": member.mode & 0o7777,
+                    "uid": member.uid,
+                    "gid": member.gid,
+                    "mtime": int(member.mtime),
+                }
+        return members
+
+    @staticmethod
+    def _paths(name: str) -> Dict[str, str]:
+        base = os.path.join(CONFIG_DIR, name)
+        return {"archive": base + ".tar.gz", "meta": base + ".json"}
+
+    @staticmethod
+    def create(description: str = "") -> str:
+        """
+        Guarda un snapshot de toda la configuración NFS
+
+        Returns:
+            Nombre del snapshot
+        """
+        try:
+            archive = ConfigSnapshot.collect()
+            existing = {s["name"] for s in ConfigSnapshot.list()}
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            name = f"nfsconfig_{timestamp}"
+            n = 1
+            while name in existing:
+                name = f"nfsconfig_{timestamp}_{n}"
+                n += 1
+
+            record = {
+                "name": name,
+                "timestamp": timestamp,
+                "description": description,
+                "size": len(archive),
+                "sha256": hashlib.sha256(archive).hexdigest(),
+                "roots": list(CONFIG_PATHS),
+                "members": ConfigSnapshot.members(archive),
+            }
+            paths = ConfigSnapshot._paths(name)
+            BackupManager._commit({
+                paths["archive"]: archive,
+                paths["meta"]: json.dumps(record, sort_keys=True) + "\n",
+            })
+            return name
+
+        except BackupError:
+            raise
+        except Exception as e:
+            raise ConfigSnapshotError(f"Error creando snapshot de configuración: {e}")
+
+    @staticmethod
+    def list() -> List[Dict]:
+        """Snapshots de configuración disponibles (más reciente primero)"""
+        config_dir = os.path.join(BACKUP_DIR, CONFIG_DIR)
+        try:
+            names = os.listdir(config_dir)
+        except OSError:
+            return []
+
+        snapshots = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                snapshots.append(json.loads(BackupManager._read_file(os.path.join(config_dir, name))))
+            except (OSError, ValueError, BackupError):
+                continue
+        snapshots.sort(key=lambda s: (s.get("timestamp", ""), s.get("name", "")), reverse=True)
+        return snapshots
+
+    @staticmethod
+    def get(name: str) -> Dict:
+        try:
+            return json.loads(BackupManager._read_file(
+                os.path.join(BACKUP_DIR, ConfigSnapshot._paths(name)["meta"])))
+        except (OSError, ValueError, BackupError):
+            raise ConfigSnapshotError(f"El snapshot de configuración no existe: {name}")
+
+    @staticmethod
+    def read_archive(name: str, record: Optional[Dict] = None) -> bytes:
+        """Contenido del tar.gz de un snapshot, comprobando su sha256"""
+        record = record or ConfigSnapshot.get(name)
+        try:
+            archive = BackupManager._read_bytes(
+                os.path.join(BACKUP_DIR, ConfigSnapshot._paths(name)["archive"]))
+        except OSError as e:
+            raise ConfigSnapshotError(f"No se pudo leer el snapshot {name}: {e}")
+        if hashlib.sha256(archive).hexdigest() != record.get("sha256"):
+            raise ConfigSnapshotError(f"El snapshot {name} está dañado (sha256 no coincide)")
+        return archive
+
+    @staticmethod
+    def compare(name: str) -> Dict[str, str]:
+        """
+        Estado de cada archivo del snapshot frente a la configuración actual
+
+        Returns:
+            {ruta: "unchanged" | "modified" | "missing" (ya no existe) |
+                   "new" (existe ahora pero no en el snapshot)}
+        """
+        record = ConfigSnapshot.get(name)
+        current = ConfigSnapshot.members(ConfigSnapshot.collect(record.get("roots")))
+        status = {}
+        for path, info in record["members"].items():
+            now = current.get(path)
+            if now is None:
+                status[path] = "missing"
+            elif now["sha256"] == info["sha256"]:
+                status[path] = "unchanged"
+            else:
+                status[path] = "modified"
+        for path in current:
+            if path not in record["members"]:
+                status[path] = "new"
+        return status
+
+    @staticmethod
+    def _selected(path: str, members: Optional[Iterable[str]]) -> bool:
+        if members is None:
+            return True
+        for m in members:
+            m = os.path.normpath(m)
+            if path == m or path.startswith(m.rstrip("/") + "/"):
+                return True
+        return False
+
+    @staticmethod
+    def _prepare(name: str, record: Dict, archive: bytes, members: Optional[List[str]],
+                 tmp_dir: str) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Extrae a tmp_dir los archivos seleccionados de un snapshot
+
+        Returns:
+            (argumentos de _RESTORE_SCRIPT, rutas restauradas, rutas a eliminar)
+        """
+        args = []
+        restored = []
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as tar:
+            for member in tar.getmembers():
+                path = ConfigSnapshot._absolute(member.name)
+                if not member.isfile() or not ConfigSnapshot._selected(path, members):
+                    continue
+                data = tar.extractfile(member).read()
+                expected = record["members"].get(path, {}).get("sha256")
+                if hashlib.sha256(data).hexdigest() != expected:
+                    raise ConfigSnapshotError(f"{path} no coincide con su sha256 en {name}")
+                tmp_path = os.path.join(tmp_dir, str(len(restored)))
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                args += [tmp_path, ConfigSnapshot._on_disk(path),
+                         "%o" % (member.mode & 0o7777), f"{member.uid}:{member.gid}"]
+                restored.append(path)
+
+        # Archivos que no existían al hacer el snapshot dentro de los
+        # directorios que se restauran enteros
+        removed = []
+        for root in record.get("roots", []):
+            directory = ConfigSnapshot._on_disk(root)
+            if not os.path.isdir(directory):
+                continue
+            if members is not None and os.path.normpath(root) not in map(os.path.normpath, members):
+                continue
+            for entry in os.listdir(directory):
+                path = os.path.join(root, entry)
+                if path not in record["members"] and os.path.isfile(os.path.join(directory, entry)):
+                    removed.append(path)
+        return args, restored, removed
+
+    @staticmethod
+    def _install(args: List[str], restored: List[str], removed: List[str],
+                 reload_exports: bool):
+        """Una llamada privilegiada a _RESTORE_SCRIPT"""
+        touches_exports = any(p == "/etc/exports" or p.startswith("/etc/exports.d/")
+                              for p in restored + removed)
+        if removed:
+            args = args + ["--rm"] + [ConfigSnapshot._on_disk(p) for p in removed]
+        return BackupManager._run_privileged(
+            ["sh", "-c", _RESTORE_SCRIPT, "sh",
+             "1" if reload_exports and touches_exports else "0"] + args, timeout=60)
+
+    @staticmethod
+    def _rollback(backup: str, restored: List[str], reload_exports: bool) -> None:
+        """
+        Vuelve a instalar el snapshot backup entero y elimina los archivos que
+        la restauración fallida creó y que no existían en él
+        """
+        record = ConfigSnapshot.get(backup)
+        archive = ConfigSnapshot.read_archive(backup, record)
+        tmp_dir = tempfile.mkdtemp(prefix="nfs_config_")
+        try:
+            args, back, removed = ConfigSnapshot._prepare(backup, record, archive, None, tmp_dir)
+            removed += [p for p in restored if p not in record["members"] and p not in removed]
+            res = ConfigSnapshot._install(args, back, removed, reload_exports)
+            if res.returncode != 0:
+                raise ConfigSnapshotError(f"Tampoco se pudo volver a {backup}: {res.stderr.strip()}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def restore(name: str, members: Optional[Iterable[str]] = None,
+                snapshot_first: bool = True, reload_exports: bool = True) -> Dict:
+        """
+        Restaura un snapshot completo o solo algunos de sus archivos
+
+        Si falla la instalación o la recarga de exportfs después de haber
+        cambiado algún archivo, se vuelve a instalar el auto-backup tomado
+        justo antes (con snapshot_first).
+
+        Args:
+            members: rutas de archivos o directorios a restaurar (None = todo).
+                     Al restaurar un directorio completo se eliminan los
+                     archivos creados en él después del snapshot.
+            snapshot_first: guardar antes la configuración actual
+            reload_exports: ejecutar 'exportfs -ra' si cambia algo de exports
+
+        Returns:
+            {"restored": [rutas], "removed": [rutas], "backup": nombre o None}
+        """
+        members = list(members) if members is not None else None
+        record = ConfigSnapshot.get(name)
+        archive = ConfigSnapshot.read_archive(name, record)
+
+        tmp_dir = tempfile.mkdtemp(prefix="nfs_config_")
+        try:
+            args, restored, removed = ConfigSnapshot._prepare(name, record, archive, members, tmp_dir)
+            if not restored and not removed:
+                raise ConfigSnapshotError("No hay archivos que restaurar con esa selección")
+
+            # Con el cerrojo de /etc/exports, para no pisar a otro escritor ni
+            # perder sin backup un cambio que llegue entre el backup y la restauración
+            with ExportsLock.hold(ConfigSnapshot._on_disk("/etc/exports")):
+                backup = ConfigSnapshot.create(f"Auto-backup antes de restaurar {name}") \
+                    if snapshot_first else None
+
+                res = ConfigSnapshot._install(args, restored, removed, reload_exports)
+                if res.returncode != 0:
+                    error = res.stderr.strip()
+                    if res.returncode in _PARTIAL_EXIT_CODES and backup:
+                        try:
+                            ConfigSnapshot._rollback(backup, restored, reload_exports)
+                        except BackupError as e:
+                            raise ConfigSnapshotError(f"No se pudo restaurar la configuración: {error}\n{e}")
+                        raise ConfigSnapshotError(f"No se pudo restaurar la configuración: {error}\n"
+                                                  f"Se ha vuelto a instalar {backup}")
+                    raise ConfigSnapshotError(f"No se pudo restaurar la configuración: {error}")
+
+            return {"restored": restored, "removed": removed, "backup": backup}
+
+        except BackupError:
+            raise
+        except Exception as e:
+            raise ConfigSnapshotError(f"Error restaurando la configuración: {e}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def delete(name: str) -> bool:
+        ConfigSnapshot.get(name)
+        paths = ConfigSnapshot._paths(name)
+        BackupManager._commit({}, remove=[paths["archive"], paths["meta"]])
+        return True
+
+    @staticmethod
+    @contextmanager
+    def transaction(description: str = ""):
+        """
+        Agrupa cambios en varios archivos de configuración: guarda un snapshot
+        al entrar y, si el bloque lanza una excepción, lo restaura entero.
+
+            with ConfigSnapshot.transaction("Nuevo montaje"):
+                MountManager.add_to_fstab(...)
+                ExportsManager.add_entry(...)
+        """
+        name = ConfigSnapshot.create(description or "Auto-backup antes de un cambio múltiple")
+        try:
+            yield name
+        except Exception:
+            ConfigSnapshot.restore(name, snapshot_first=False)
+            raise
@@ -0,0 +1,191 @@
+"""
+ExportCapacity
+--------------
+Espacio e inodos libres de los sistemas de archivos que alojan cada
+exportación, para enterarse de que un export se llena antes de que los
+clientes empiecen a fallar al escribir.
+
+Las exportaciones se agrupan por dispositivo (st_dev): un sistema de
+archivos con cientos de exportaciones se consulta con un único statvfs, y el
+resultado se cachea CACHE_TTL segundos. El tipo, el origen y el punto de
+montaje salen de /proc/self/mountinfo. Las rutas dentro de un montaje NFS
+colgado no se tocan (MountHealth).
+
+Los umbrales de alerta se aplican al mayor de los dos porcentajes (espacio e
+inodos) y se configuran con NFS_MANAGER_CAPACITY_WARN y
+NFS_MANAGER_CAPACITY_CRITICAL (por defecto 85 y 95).
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from util.mount_health import MountHealth, NFS_TYPES, STALE
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+CACHE_TTL = 30.0
+DEFAULT_WARN = 85.0
+DEFAULT_CRITICAL = 95.0
+
+OK, WARNING, CRITICAL, MISSING, UNAVAILABLE = "ok", "warning", "critical", "missing", "unavailable"
+
+
+def thresholds() -> Tuple[float, float]:
+    """(aviso, crítico) en % de uso, de las variables de entorno"""
+    try:
+        warn = float(os.environ.get("NFS_MANAGER_CAPACITY_WARN", DEFAULT_WARN))
+        critical = float(os.environ.get("NFS_MANAGER_CAPACITY_CRITICAL", DEFAULT_CRITICAL))
+    except ValueError:
+        log.warning("Umbrales de capacidad inválidos; se usan %g/%g", DEFAULT_WARN, DEFAULT_CRITICAL)
+        return DEFAULT_WARN, DEFAULT_CRITICAL
+    return warn, critical
+
+
+def format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return ""
+    size = float(value)
+    for unit in ("B", "K", "M", "G", "T", "P"):
+        if size < 1024 or unit == "P":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return ""
+
+
+class ExportCapacity:
+    """Capacidad por exportación con una consulta por sistema de archivos"""
+
+    _lock = threading.Lock()
+    # st_dev -> (momento de la consulta, datos de statvfs)
+    _cache: Dict[int, Tuple[float, Dict]] = {}
+
+    @staticmethod
+    def mount_table() -> List[Dict]:
+        """Montajes de /proc/self/mountinfo: {"mount_point", "device", "fstype", "source"}"""
+        mounts = []
+        try:
+            with open("/proc/self/mountinfo", "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if " - " not in line or len(fields) < 5:
+                        continue
+                    tail = line.split(" - ", 1)[1].split()
+                    major, minor = fields[2].split(":")
+                    mounts.append({
+                        "mount_point": MountHealth._unescape(fields[4]),
+                        "device": os.makedev(int(major), int(minor)),
+                        "fstype": tail[0] if tail else "",
+                        "source": MountHealth._unescape(tail[1]) if len(tail) > 1 else "",
+                    })
+        except (OSError, ValueError) as e:
+            log.warning("No se pudo leer /proc/self/mountinfo: %s", e)
+        return mounts
+
+    @staticmethod
+    def _covering(path: str, mounts: List[Dict]) -> Optional[Dict]:
+        """Montaje más específico que contiene path (por texto, sin stat)"""
+        best = None
+        for m in mounts:
+            mp = m["mount_point"]
+            if path == mp or path.startswith(mp.rstrip("/") + "/"):
+                if best is None or len(mp) >= len(best["mount_point"]):
+                    best = m  # con montajes apilados gana el último
+        return best
+
+    @staticmethod
+    def _statvfs(device: int, path: str, max_age: float) -> Dict:
+        now = time.monotonic()
+        with ExportCapacity._lock:
+            cached = ExportCapacity._cache.get(device)
+        if cached and now - cached[0] < max_age:
+            return cached[1]
+        st = os.statvfs(path)
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        inodes_used = st.f_files - st.f_ffree
+        info = {
+            "size": st.f_blocks * st.f_frsize,
+            "used": used,
+            "free": avail,
+            # Como df: el espacio reservado a root no cuenta como disponible
+            "used_pct": round(100.0 * used / (used + avail), 1) if used + avail else 0.0,
+            "inodes": st.f_files,
+            "inodes_used": inodes_used,
+            "inodes_pct": round(100.0 * inodes_used / (inodes_used + st.f_favail), 1)
+                          if st.f_files and inodes_used + st.f_favail else 0.0,
+        }
+        with ExportCapacity._lock:
+            ExportCapacity._cache[device] = (now, info)
+        return info
+
+    @staticmethod
+    def level(info: Dict, warn: float, critical: float) -> str:
+        """Nivel de alerta de una exportación según los umbrales"""
+        if "used_pct" not in info:
+            return info.get("level", UNAVAILABLE)
+        usage = max(info["used_pct"], info["inodes_pct"])
+        if usage >= critical:
+            return CRITICAL
+        if usage >= warn:
+            return WARNING
+        return OK
+
+    @staticmethod
+    def collect(paths: Iterable[str], warn: Optional[float] = None,
+                critical: Optional[float] = None, max_age: float = CACHE_TTL) -> Dict[str, Dict]:
+        """
+        Capacidad de cada ruta:
+            {ruta: {"device", "mount_point", "fstype", "source", "size", "used",
+                    "free", "used_pct", "inodes", "inodes_used", "inodes_pct",
+                    "level": "ok"|"warning"|"critical"|"missing"|"unavailable",
+                    "error"}}
+
+        Un statvfs por dispositivo y como mucho uno cada max_age segundos.
+        """
+        default_warn, default_critical = thresholds()
+        warn = default_warn if warn is None else warn
+        critical = default_critical if critical is None else critical
+        mounts = ExportCapacity.mount_table()
+        by_device = {}
+        for m in mounts:
+            by_device[m["device"]] = m
+
+        results: Dict[str, Dict] = {}
+        for path in paths:
+            if path in results:
+                continue
+            covering = ExportCapacity._covering(path, mounts)
+            if covering and covering["fstype"] in NFS_TYPES and \
+                    MountHealth.status(covering["mount_point"]) == STALE:
+                results[path] = {"level": UNAVAILABLE, "mount_point": covering["mount_point"],
+                                 "fstype": covering["fstype"], "source": covering["source"],
+                                 "error": "montaje NFS colgado"}
+                continue
+            try:
+                device = os.stat(path).st_dev
+            except FileNotFoundError:
+                results[path] = {"level": MISSING, "error": "no existe"}
+                continue
+            except OSError as e:
+                results[path] = {"level": UNAVAILABLE, "error": e.strerror or str(e)}
+                continue
+            mount = covering if covering and covering["device"] == device else by_device.get(device, covering or {})
+            info = {"device": device, "mount_point": mount.get("mount_point", ""),
+                    "fstype": mount.get("fstype", ""), "source": mount.get("source", "")}
+            try:
+                info.update(ExportCapacity._statvfs(device, path, max_age))
+            except OSError as e:
+                info.update(level=UNAVAILABLE, error=e.strerror or str(e))
+                results[path] = info
+                continue
+            info["level"] = ExportCapacity.level(info, warn, critical)
+            results[path] = info
+        return results
+
+    @staticmethod
+    def clear_cache() -> None:
+        with ExportCapacity._lock:
+            ExportCapacity._cache.clear()
@@ -0,0 +1,242 @@
+"""
+ExportsAccess
+-------------
+Consultas "¿qué puede montar este cliente y con qué opciones?" sobre todas
+las exportaciones a la vez.
+
+Un cliente (dirección IP y/o nombres de host, más los netgroups a los que
+pertenece) se resuelve contra las reglas de host de cada exportación con la
+semántica de exportfs: si varias reglas coinciden gana la de la clase más
+específica según exports(5) (host exacto, red IP, comodín, netgroup, '*') y,
+dentro de la misma clase, la primera en el orden del archivo.
+
+Todo se indexa una vez al construir AccessIndex:
+  - hosts exactos (nombres e IPs sueltas) en un diccionario
+  - redes CIDR en una tabla de prefijos: un diccionario por longitud de
+    prefijo, así que una dirección se resuelve con como mucho 33 (IPv4) o
+    129 (IPv6) búsquedas, sin importar cuántas redes haya
+  - comodines compilados a expresiones regulares y agrupados por su sufijo
+    literal ("*.lab.ejemplo.com" -> ".lab.ejemplo.com"); solo se prueban los
+    que comparten sufijo con el nombre consultado
+  - netgroups y reglas '*' en listas por nombre
+
+Una consulta cuesta del orden de microsegundos más lo que ocupe la
+respuesta, incluso con cientos de miles de reglas.
+"""
+
+import fnmatch
+import ipaddress
+import re
+import socket
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from util.exports_manager import ExportsManager
+from util.exports_diff import effective_options
+from util.exports_lint import _interval
+
+# Clases de regla, de más a menos prioritaria (exports(5))
+HOST, NETWORK, WILDCARD, NETGROUP, WORLD = "host", "network", "wildcard", "netgroup", "world"
+_PRIORITY = {HOST: 0, NETWORK: 1, WILDCARD: 2, NETGROUP: 3, WORLD: 4}
+
+_WILDCARD_CHARS = "*?["
+
+
+def classify(name: str) -> str:
+    """Clase de una regla de host de /etc/exports"""
+    if name in ("", "*"):
+        return WORLD
+    if name.startswith("@"):
+        return NETGROUP
+    if "/" in name:
+        return NETWORK
+    if any(c in name for c in _WILDCARD_CHARS):
+        return WILDCARD
+    return HOST
+
+
+def _address(value: str):
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _compile(pattern: str):
+    return re.compile(fnmatch.translate(pattern))
+
+
+@lru_cache(maxsize=4096)
+def _access(options: str) -> str:
+    return effective_options(options).get("access", "ro")
+
+
+def _literal_tail(pattern: str) -> str:
+    """Parte final de un comodín sin caracteres especiales"""
+    cut = max(pattern.rfind(c) for c in _WILDCARD_CHARS)
+    if pattern.find("]", cut) != -1 and pattern[cut] == "[":
+        cut = pattern.find("]", cut)
+    return pattern[cut + 1:]
+
+
+class AccessIndex:
+    """Índices de las reglas de host de todas las exportaciones"""
+
+    def __init__(self, entries: List[Dict]):
+        # Cada regla: (ruta, prioridad de clase, posición en la exportación,
+        #              nombre de la regla, clase, opciones)
+        self.paths: List[str] = []
+        self.rule_count = 0
+        self._hosts: Dict[str, List[Tuple]] = {}
+        # versión -> {longitud de prefijo -> {red como entero -> [reglas]}}
+        self._networks: Dict[int, Dict[int, Dict[int, List[Tuple]]]] = {4: {}, 6: {}}
+        self._prefixes: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        self._wildcards: Dict[str, List[Tuple]] = {}
+        self._netgroups: Dict[str, List[Tuple]] = {}
+        self._world: List[Tuple] = []
+
+        positions: Dict[str, int] = {}
+        for entry in entries:
+            path = entry["path"]
+            if path not in positions:
+                positions[path] = 0
+                self.paths.append(path)
+            defaults = ""
+            for host in entry["hosts"]:
+                name, options = host["name"], host.get("options", "")
+                if name.startswith("-"):
+                    # "/srv -sync host(rw)": opciones por defecto de la línea
+                    defaults = name[1:]
+                    continue
+                if defaults:
+                    options = "(" + defaults + "," + options.strip("()") + ")"
+                order = positions[path]
+                positions[path] += 1
+                self._add(path, order, name, options)
+        self._finish()
+
+    def _add(self, path: str, order: int, name: str, options: str) -> None:
+        kind = classify(name)
+        rule = (path, _PRIORITY[kind], order, name or "*", kind, options)
+        self.rule_count += 1
+        if kind == WORLD:
+            self._world.append(rule)
+        elif kind == NETGROUP:
+            self._netgroups.setdefault(name[1:], []).append(rule)
+        elif kind == NETWORK:
+            interval = _interval(name)
+            if interval is None:
+                return
+            version, start, end = interval
+            length = (32 if version == 4 else 128) - (end - start).bit_length()
+            table = self._networks[version].setdefault(length, {})
+            table.setdefault(start, []).append(rule)
+        elif kind == WILDCARD:
+            pattern = name.lower()
+            self._wildcards.setdefault(_literal_tail(pattern), []).append(
+                rule + (_compile(pattern),))
+        else:
+            address = _address(name)
+            key = str(address) if address is not None else name.lower()
+            self._hosts.setdefault(key, []).append(rule)
+
+    def _finish(self) -> None:
+        for version, bits in ((4, 32), (6, 128)):
+            # (longitud, máscara) de las longitudes que existen, de más a menos
+            # específica; las demás no cuestan nada en las consultas
+            self._prefixes[version] = [
+                (length, ((1 << length) - 1) << (bits - length))
+                for length in sorted(self._networks[version], reverse=True)]
+
+    @classmethod
+    def from_text(cls, text: str) -> "AccessIndex":
+        return cls(ExportsManager.parse_text(text))
+
+    @classmethod
+    def load(cls) -> "AccessIndex":
+        """Índice del /etc/exports actual"""
+        return cls(ExportsManager.list_parsed())
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _candidates(self, address, names: List[str], netgroups: Iterable[str]):
+        if address is not None:
+            yield from self._hosts.get(str(address), ())
+            value = int(address)
+            tables = self._networks[address.version]
+            for length, mask in self._prefixes[address.version]:
+                yield from tables[length].get(value & mask, ())
+        for name in names:
+            yield from self._hosts.get(name, ())
+            # Comodines cuyo sufijo literal es sufijo del nombre ("" = todos)
+            for start in range(len(name) + 1):
+                for rule in self._wildcards.get(name[start:], ()):
+                    if rule[6].match(name):
+                        yield rule[:6]
+        for group in netgroups:
+            yield from self._netgroups.get(group.lstrip("@"), ())
+        yield from self._world
+
+    def query(self, client: str, hostnames: Iterable[str] = (),
+              netgroups: Iterable[str] = (), resolve: bool = False) -> List[Dict]:
+        """
+        Exportaciones accesibles para un cliente, ordenadas por ruta:
+            [{"path", "rule", "kind", "options", "access"}]
+
+        client es una IP o un nombre de host; hostnames añade otros nombres
+        del mismo cliente y netgroups los grupos a los que pertenece. Con
+        resolve se completa con DNS (nombre inverso de la IP o IP del nombre),
+        como hace mountd.
+        """
+        address = _address(client)
+        names = [n.lower().rstrip(".") for n in hostnames]
+        if address is None:
+            names.insert(0, client.lower().rstrip("."))
+        if resolve:
+            address, names = _resolve(address, names)
+
+        best: Dict[str, Tuple] = {}
+        for rule in self._candidates(address, names, netgroups):
+            current = best.get(rule[0])
+            if current is None or rule[1:3] < current[1:3]:
+                best[rule[0]] = rule
+
+        results = []
+        for path in sorted(best):
+            _, _, _, name, kind, options = best[path]
+            results.append({"path": path, "rule": name, "kind": kind, "options": options,
+                            "access": _access(options)})
+        return results
+
+    def query_many(self, clients: Iterable, netgroups: Iterable[str] = (),
+                   resolve: bool = False) -> Dict[str, List[Dict]]:
+        """
+        Modo por lotes: {cliente: query(cliente)}. Cada cliente puede ser una
+        cadena o un dict {"client", "hostnames", "netgroups"}.
+        """
+        netgroups = list(netgroups)
+        results = {}
+        for item in clients:
+            if isinstance(item, dict):
+                key = item["client"]
+                results[key] = self.query(key, item.get("hostnames", ()),
+                                          list(item.get("netgroups", ())) + netgroups, resolve)
+            else:
+                results[item] = self.query(item, (), netgroups, resolve)
+        return results
+
+
+def _resolve(address, names: List[str]):
+    """Completa IP o nombres por DNS; los fallos de resolución se ignoran"""
+    try:
+        if address is not None:
+            name, aliases, _ = socket.gethostbyaddr(str(address))
+            names = names + [n.lower().rstrip(".") for n in [name] + aliases]
+        elif names:
+            address = _address(socket.gethostbyname(names[0]))
+    except (OSError, UnicodeError):
+        pass
+    return address, names
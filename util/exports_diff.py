@@ -0,0 +1,314 @@
+"""
+ExportsDiff
+-----------
+Diferencias semánticas entre configuraciones de exportación.
+
+Compara dos fuentes cualesquiera (un backup, el /etc/exports actual o la tabla
+activa del kernel según 'exportfs -v') a nivel de exportación y de regla de
+host: altas, bajas y cambios de opciones. Las exportaciones se indexan por
+ruta en diccionarios y cada una se resume con una firma hasheable de su forma
+canónica, así que solo se examinan en detalle las que cambian y el coste
+total es lineal en el número de entradas.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from util.exports_manager import ExportsManager, ExportsError
+from util.backup_manager import BackupManager, BackupError
+
+# Valores por defecto de exportfs: permiten comparar la configuración escrita
+# con la tabla del kernel, que siempre muestra todas las opciones explícitas.
+DEFAULT_OPTIONS = {
+    "access": "ro",
+    "sync": "sync",
+    "wdelay": "wdelay",
+    "hide": "hide",
+    "subtree": "no_subtree_check",
+    "secure": "secure",
+    "root": "root_squash",
+    "all": "no_all_squash",
+    "sec": "sys",
+    "secure_locks": "secure_locks",
+    "acl": "acl",
+    "pnfs": "no_pnfs",
+    "anonuid": "65534",
+    "anongid": "65534",
+}
+
+# Opción -> (clave, valor) para las opciones mutuamente excluyentes
+_FLAG_KEYS = {
+    "rw": ("access", "rw"), "ro": ("access", "ro"),
+    "sync": ("sync", "sync"), "async": ("sync", "async"),
+    "wdelay": ("wdelay", "wdelay"), "no_wdelay": ("wdelay", "no_wdelay"),
+    "hide": ("hide", "hide"), "nohide": ("hide", "nohide"),
+    "subtree_check": ("subtree", "subtree_check"),
+    "no_subtree_check": ("subtree", "no_subtree_check"),
+    "secure": ("secure", "secure"), "insecure": ("secure", "insecure"),
+    "root_squash": ("root", "root_squash"), "no_root_squash": ("root", "no_root_squash"),
+    "all_squash": ("all", "all_squash"), "no_all_squash": ("all", "no_all_squash"),
+    "secure_locks": ("secure_locks", "secure_locks"),
+    "insecure_locks": ("secure_locks", "insecure_locks"),
+    "auth_nlm": ("secure_locks", "secure_locks"),
+    "no_auth_nlm": ("secure_locks", "insecure_locks"),
+    "acl": ("acl", "acl"), "no_acl": ("acl", "no_acl"),
+    "pnfs": ("pnfs", "pnfs"), "no_pnfs": ("pnfs", "no_pnfs"),
+}
+
+
+def split_options(options: str) -> List[str]:
+    """'(rw,sync)' -> ['rw', 'sync']"""
+    return [o.strip() for o in options.strip().strip("()").split(",") if o.strip()]
+
+
+def effective_options(options: str) -> Dict[str, str]:
+    """
+    Opciones efectivas de una regla: los valores por defecto de exportfs
+    sobrescritos por los indicados (el último gana, como en exportfs).
+    """
+    return dict(_effective_items(options))
+
+
+@lru_cache(maxsize=4096)
+def _effective_items(options: str) -> Tuple[Tuple[str, str], ...]:
+    # Las mismas cadenas de opciones se repiten en casi todas las reglas
+    effective = dict(DEFAULT_OPTIONS)
+    for opt in split_options(options):
+        if opt in _FLAG_KEYS:
+            key, value = _FLAG_KEYS[opt]
+        elif "=" in opt:
+            key, value = opt.split("=", 1)
+        else:
+            key, value = opt, opt
+        effective[key] = value
+    return tuple(sorted(effective.items()))
+
+
+@lru_cache(maxsize=4096)
+def _canonical(options: str) -> str:
+    return "(" + ",".join(split_options(options)) + ")"
+
+
+def _host_name(name: str) -> str:
+    # exportfs -v muestra el comodín '*' como <world>
+    return "*" if not name or name == "<world>" else name
+
+
+class ExportsModel:
+    """
+    Tabla de exportaciones normalizada: ruta -> lista ordenada de
+    (host, opciones). Varias líneas con la misma ruta se fusionan.
+    """
+
+    def __init__(self, entries: List[Dict], name: str = ""):
+        self.name = name
+        self.exports: Dict[str, List[Tuple[str, str]]] = {}
+        for entry in entries:
+            rules = self.exports.setdefault(entry["path"], [])
+            for host in entry["hosts"]:
+                rules.append((_host_name(host["name"]), _canonical(host.get("options", ""))))
+        self._rules: Dict[str, Dict[str, str]] = {}
+        self._signatures: Dict[Tuple[str, bool], frozenset] = {}
+
+    @classmethod
+    def from_text(cls, content: str, name: str = "") -> "ExportsModel":
+        return cls(ExportsManager.parse_text(content), name)
+
+    @staticmethod
+    def parse_exportfs_v(output: str) -> List[Dict]:
+        """
+        Parsea la salida de 'exportfs -v'. Las rutas largas ocupan su propia
+        línea y el cliente aparece indentado en la siguiente.
+        """
+        entries = []
+        path = None
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            if not line[0].isspace():
+                parts = line.split()
+                path = parts[0]
+                rest = parts[1:]
+            else:
+                rest = line.split()
+            if path is None:
+                continue
+            hosts = []
+            for h in rest:
+                if "(" in h:
+                    name, opts = h.split("(", 1)
+                    hosts.append({"name": name, "options": "(" + opts})
+                else:
+                    hosts.append({"name": h, "options": ""})
+            if hosts:
+                entries.append({"path": path, "hosts": hosts})
+        return entries
+
+    def rule_map(self, path: str) -> Dict[str, str]:
+        """host -> opciones de una exportación (gana la primera regla, como en exportfs)"""
+        rules = self._rules.get(path)
+        if rules is None:
+            rules = {}
+            for host, options in self.exports.get(path, []):
+                rules.setdefault(host, options)
+            self._rules[path] = rules
+        return rules
+
+    def signature(self, path: str, effective: bool) -> frozenset:
+        """
+        Forma canónica e independiente del orden de una exportación. Al ser un
+        conjunto hasheable, comparar dos firmas cuesta O(reglas).
+        """
+        key = (path, effective)
+        sig = self._signatures.get(key)
+        if sig is None:
+            if effective:
+                sig = frozenset((h, _effective_items(o)) for h, o in self.rule_map(path).items())
+            else:
+                sig = frozenset(self.rule_map(path).items())
+            self._signatures[key] = sig
+        return sig
+
+
+class ExportsDiff:
+    """Calcula y formatea diferencias entre dos ExportsModel"""
+
+    @staticmethod
+    def load(source: str) -> ExportsModel:
+        """
+        Carga una fuente de configuración:
+            "current"         /etc/exports
+            "kernel"          tabla activa (exportfs -v)
+            "backup:<nombre>" un backup del BackupManager
+            cualquier otra    ruta a un archivo con formato exports
+        """
+        if source == "current":
+            return ExportsModel(ExportsManager.list_parsed(), source)
+        if source == "kernel":
+            res = ExportsManager._run_pkexec(["exportfs", "-v"])
+            if res.returncode != 0:
+                raise ExportsError(f"exportfs -v devolvió error: {res.stderr.strip()}")
+            return ExportsModel(ExportsModel.parse_exportfs_v(res.stdout), source)
+        if source.startswith("backup:"):
+            try:
+                content = BackupManager.read_backup_content(source[len("backup:"):])
+            except BackupError as e:
+                raise ExportsError(str(e))
+            return ExportsModel.from_text(content, source)
+        return ExportsModel.from_text(ExportsManager._read_file_as_root(source), source)
+
+    @staticmethod
+    def diff(old: ExportsModel, new: ExportsModel, effective: Optional[bool] = None) -> Dict:
+        """
+        Diferencias de old a new.
+
+        Args:
+            effective: comparar opciones efectivas (con los valores por defecto
+                       de exportfs aplicados). Por defecto se activa cuando una
+                       de las fuentes es la tabla del kernel.
+
+        Returns:
+            {"added_exports": [{"path", "hosts": [{"name", "options"}]}],
+             "removed_exports": [...],
+             "changed_exports": [{"path", "added_hosts", "removed_hosts",
+                                  "changed_hosts": [{"name", "old", "new",
+                                                     "added_options", "removed_options"}]}],
+             "unchanged": N}
+        """
+        if effective is None:
+            effective = "kernel" in (old.name, new.name)
+
+        result = {"added_exports": [], "removed_exports": [], "changed_exports": [], "unchanged": 0}
+
+        for path in old.exports:
+            if path not in new.exports:
+                result["removed_exports"].append({
+                    "path": path,
+                    "hosts": [{"name": h, "options": o} for h, o in old.rule_map(path).items()],
+                })
+
+        for path in new.exports:
+            if path not in old.exports:
+                result["added_exports"].append({
+                    "path": path,
+                    "hosts": [{"name": h, "options": o} for h, o in new.rule_map(path).items()],
+                })
+                continue
+
+            # Las mismas reglas en el mismo orden (el caso habitual) no
+            # necesitan ni siquiera la firma
+            if (old.exports[path] == new.exports[path]
+                    or old.signature(path, effective) == new.signature(path, effective)):
+                result["unchanged"] += 1
+                continue
+
+            old_rules = old.rule_map(path)
+            new_rules = new.rule_map(path)
+            change = {"path": path, "added_hosts": [], "removed_hosts": [], "changed_hosts": []}
+            for host, options in old_rules.items():
+                if host not in new_rules:
+                    change["removed_hosts"].append({"name": host, "options": options})
+            for host, options in new_rules.items():
+                if host not in old_rules:
+                    change["added_hosts"].append({"name": host, "options": options})
+                    continue
+                before = old_rules[host]
+                if effective:
+                    a, b = effective_options(before), effective_options(options)
+                    if a == b:
+                        continue
+                    removed = [f"{k}={v}" if k in ("anonuid", "anongid", "sec") else v
+                               for k, v in a.items() if b.get(k) != v]
+                    added = [f"{k}={v}" if k in ("anonuid", "anongid", "sec") else v
+                             for k, v in b.items() if a.get(k) != v]
+                else:
+                    a, b = split_options(before), split_options(options)
+                    if a == b:
+                        continue
+                    removed = [o for o in a if o not in b]
+                    added = [o for o in b if o not in a]
+                change["changed_hosts"].append({
+                    "name": host, "old": before, "new": options,
+                    "added_options": added, "removed_options": removed,
+                })
+            if change["added_hosts"] or change["removed_hosts"] or change["changed_hosts"]:
+                result["changed_exports"].append(change)
+            else:
+                # Solo cambió el orden o hay reglas duplicadas
+                result["unchanged"] += 1
+
+        return result
+
+    @staticmethod
+    def compare(old_source: str, new_source: str, effective: Optional[bool] = None) -> Dict:
+        """Carga dos fuentes (ver load) y devuelve su diff"""
+        return ExportsDiff.diff(ExportsDiff.load(old_source), ExportsDiff.load(new_source), effective)
+
+    @staticmethod
+    def is_empty(result: Dict) -> bool:
+        return not (result["added_exports"] or result["removed_exports"] or result["changed_exports"])
+
+    @staticmethod
+    def format(result: Dict) -> List[str]:
+        """Líneas legibles del diff ('+' alta, '-' baja, '~' cambio)"""
+        lines = []
+        for export in result["removed_exports"]:
+            hosts = " ".join(f"{h['name']}{h['options']}" for h in export["hosts"])
+            lines.append(f"- {export['path']} {hosts}")
+        for export in result["added_exports"]:
+            hosts = " ".join(f"{h['name']}{h['options']}" for h in export["hosts"])
+            lines.append(f"+ {export['path']} {hosts}")
+        for change in result["changed_exports"]:
+            lines.append(f"~ {change['path']}")
+            for h in change["removed_hosts"]:
+                lines.append(f"    - {h['name']}{h['options']}")
+            for h in change["added_hosts"]:
+                lines.append(f"    + {h['name']}{h['options']}")
+            for h in change["changed_hosts"]:
+                detail = []
+                if h["removed_options"]:
+                    detail.append("-" + ",-".join(h["removed_options"]))
+                if h["added_options"]:
+                    detail.append("+" + ",+".join(h["added_options"]))
+                lines.append(f"    ~ {h['name']}: {h['old']} -> {h['new']} ({' '.join(detail)})")
+        return lines
@@ -0,0 +1,334 @@
+"""
+ExportsLint
+-----------
+Validación de una configuración de /etc/exports antes de aplicarla.
+
+Detecta, con coste casi lineal en el número de reglas:
+  - rutas relativas, subredes o direcciones mal escritas y opciones
+    desconocidas
+  - un espacio entre host y opciones ("/srv host (rw)"), que concede las
+    opciones a todo el mundo
+  - opciones contradictorias en una misma regla (rw y ro, sync y async...)
+  - hosts repetidos en una exportación, con o sin opciones distintas
+  - subredes que se solapan con opciones distintas: los rangos IP de cada
+    exportación se ordenan y se recorren una vez manteniendo el intervalo
+    que llega más lejos (índice de intervalos)
+  - exportaciones anidadas sin 'crossmnt' en la padre ni 'nohide' en la
+    hija: las rutas se insertan en un trie por componentes y cada una se
+    compara solo con su antecesor exportado más cercano
+
+Los problemas de severidad "error" hacen que ExportsManager rechace la
+configuración antes de escribirla, sin llegar a 'exportfs -ra'.
+"""
+
+import ipaddress
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from util.exports_manager import ExportsError, ExportsManager
+from util.exports_diff import _FLAG_KEYS, effective_options, split_options
+
+ERROR = "error"
+WARNING = "warning"
+
+# Opciones de exports(5) que no están en _FLAG_KEYS
+_VALUE_OPTIONS = {"fsid", "anonuid", "anongid", "sec", "refer", "replicas",
+                  "mountpoint", "mp", "xprtsec", "security_label"}
+_PLAIN_OPTIONS = {"crossmnt", "no_crossmnt", "mountpoint", "mp", "nordirplus",
+                  "security_label", "no_security_label"}
+_KNOWN_OPTIONS = set(_FLAG_KEYS) | _PLAIN_OPTIONS
+
+# Referencias a otras líneas dentro de los mensajes ("línea 12")
+_LINE_REF = re.compile(r"línea \d+")
+
+# Sentinela de fin de ruta en el trie (los componentes son siempre str)
+_END = None
+
+
+class ExportsLintError(ExportsError):
+    """La configuración tiene errores; issues contiene todos los problemas"""
+
+    def __init__(self, message: str, issues: List[Dict]):
+        super().__init__(message)
+        self.issues = issues
+
+
+def _issue(severity: str, code: str, line: int, path: str, message: str) -> Dict:
+    return {"severity": severity, "code": code, "line": line, "path": path,
+            "message": message}
+
+
+@lru_cache(maxsize=65536)
+def _interval(name: str) -> Optional[Tuple[int, int, int]]:
+    """(versión IP, inicio, fin) de una dirección o subred; None si no es IP"""
+    addr, _, prefix = name.partition("/")
+    octets = addr.split(".")
+    # Camino rápido para a.b.c.d[/n], el caso habitual; ipaddress es
+    # bastante más lento y se deja para IPv6 y máscaras a.b.c.d/m.m.m.m
+    if len(octets) == 4 and all(o.isdigit() for o in octets) and (not prefix or prefix.isdigit()):
+        values = [int(o) for o in octets]
+        bits = int(prefix) if prefix else 32
+        if max(values) > 255 or bits > 32:
+            return None
+        host_mask = (1 << (32 - bits)) - 1
+        start = ((values[0] << 24) | (values[1] << 16) | (values[2] << 8) | values[3]) & ~host_mask
+        return 4, start, start | host_mask
+    if ":" not in addr and not addr[:1].isdigit():
+        return None
+    try:
+        net = ipaddress.ip_network(name, strict=False)
+    except ValueError:
+        return None
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+
+def _looks_like_address(name: str) -> bool:
+    head = name.split("/", 1)[0]
+    return bool(head) and (all(c.isdigit() or c == "." for c in head) or
+                           (":" in head and all(c in "0123456789abcdefABCDEF:." for c in head)))
+
+
+@lru_cache(maxsize=4096)
+def _option_problems(options: str) -> Tuple[Tuple[str, str, str], ...]:
+    """
+    (severidad, código, mensaje) de una cadena de opciones; el mensaje lleva
+    '{who}' para el host. Se cachea: casi todas las reglas repiten opciones.
+    """
+    problems = []
+    seen: Dict[str, str] = {}
+    for opt in split_options(options):
+        if "=" in opt:
+            if opt.split("=", 1)[0] not in _VALUE_OPTIONS:
+                problems.append((WARNING, "unknown-option",
+                                 f"Opción desconocida '{opt}' para " + "{who}"))
+            continue
+        if opt not in _KNOWN_OPTIONS:
+            problems.append((WARNING, "unknown-option",
+                             f"Opción desconocida '{opt}' para " + "{who}"))
+            continue
+        flag = _FLAG_KEYS.get(opt)
+        if flag is None:
+            continue
+        key, value = flag
+        if key in seen and seen[key] != value:
+            problems.append((ERROR, "conflicting-options",
+                             "Opciones contradictorias para {who}: " + f"'{seen[key]}' y '{opt}'"))
+        seen[key] = value
+    return tuple(problems)
+
+
+class ExportsLint:
+    """Comprobaciones estáticas de texto con formato /etc/exports"""
+
+    @staticmethod
+    def _check_options(options: str, line: int, path: str, who: str,
+                       issues: List[Dict]) -> None:
+        for severity, code, message in _option_problems(options):
+            issues.append(_issue(severity, code, line, path, message.replace("{who}", who)))
+
+    @staticmethod
+    def _check_export(path: str, rules: List[Tuple[int, str, str]],
+                      issues: List[Dict]) -> None:
+        """Comprueba las reglas (línea, host, opciones) de una exportación"""
+        hosts: Dict[str, Tuple[int, str]] = {}
+        intervals = []
+        for line, name, options in rules:
+            if options and _option_problems(options):
+                ExportsLint._check_options(options, line, path, name or "todo el mundo", issues)
+            if name == "*":
+                if name in hosts:
+                    ExportsLint._check_duplicate(path, line, name, options, hosts[name], issues)
+                else:
+                    hosts[name] = (line, options)
+                continue
+            if name.startswith("-"):
+                # Opciones por defecto de la línea ("/srv -sync host(...)")
+                continue
+            if not name:
+                issues.append(_issue(ERROR, "world-access", line, path,
+                                     f"Hay un espacio antes de '{options}': esas opciones "
+                                     "se conceden a todo el mundo"))
+                continue
+
+            previous = hosts.get(name)
+            if previous is not None:
+                ExportsLint._check_duplicate(path, line, name, options, previous, issues)
+                continue
+            hosts[name] = (line, options)
+
+            interval = _interval(name)
+            if interval is not None:
+                intervals.append(interval + (line, name, options))
+            elif _looks_like_address(name) or ("/" in name and not name.startswith("gss/")):
+                issues.append(_issue(ERROR, "invalid-address", line, path,
+                                     f"Dirección o subred inválida: {name}"))
+
+        if len(intervals) > 1:
+            ExportsLint._check_overlaps(path, intervals, issues)
+
+    @staticmethod
+    def _check_duplicate(path: str, line: int, name: str, options: str,
+                         previous: Tuple[int, str], issues: List[Dict]) -> None:
+        if effective_options(previous[1]) != effective_options(options):
+            issues.append(_issue(ERROR, "conflicting-host", line, path,
+                                 f"{name} aparece con opciones distintas "
+                                 f"(línea {previous[0]}: {previous[1] or '()'}, "
+                                 f"aquí: {options or '()'})"))
+        else:
+            issues.append(_issue(WARNING, "duplicate-host", line, path,
+                                 f"{name} ya aparece en la línea {previous[0]}"))
+
+    @staticmethod
+    def _check_overlaps(path: str, intervals: List[Tuple], issues: List[Dict]) -> None:
+        """
+        Subredes solapadas con opciones distintas. Se ordenan por inicio (las
+        más amplias primero) y cada intervalo se compara con el que, de los
+        anteriores, termina más tarde: un único recorrido, O(n log n).
+        """
+        intervals.sort(key=lambda iv: (iv[0], iv[1], -iv[2]))
+        cover = None
+        for iv in intervals:
+            version, start, end, line, name, options = iv
+            if cover is not None and cover[0] == version and start <= cover[2]:
+                if effective_options(cover[5]) != effective_options(options):
+                    issues.append(_issue(WARNING, "overlapping-subnets", line, path,
+                                         f"{name} se solapa con {cover[4]} (línea {cover[3]}) "
+                                         "con opciones distintas; a los clientes de ambas "
+                                         "se les aplica la que aparece primero"))
+                if end > cover[2]:
+                    cover = iv
+            else:
+                cover = iv
+
+    @staticmethod
+    def _check_nesting(exports: Dict[str, List[Tuple[int, str, str]]],
+                       first_line: Dict[str, int], issues: List[Dict]) -> None:
+        trie: Dict = {}
+        for path in exports:
+            node = trie
+            for part in path.split("/"):
+                if part:
+                    node = node.setdefault(part, {})
+            node[_END] = path
+
+        def has_option(path: str, option: str, every: bool) -> bool:
+            found = [option in split_options(opts) for _, name, opts in exports[path]
+                     if not name.startswith("-")]
+            return bool(found) and (all(found) if every else any(found))
+
+        stack = [(trie, None)]
+        while stack:
+            node, ancestor = stack.pop()
+            path = node.get(_END)
+            if path is not None:
+                if ancestor is not None and path != ancestor and not (
+                        has_option(ancestor, "crossmnt", every=False) or
+                        has_option(path, "nohide", every=True)):
+                    issues.append(_issue(WARNING, "nested-export", first_line[path], path,
+                                         f"Está dentro de la exportación {ancestor}: si es otro "
+                                         "sistema de archivos los clientes no la verán sin "
+                                         f"'crossmnt' en {ancestor} o 'nohide' aquí"))
+                ancestor = path
+            for key, child in node.items():
+                if key is not _END:
+                    stack.append((child, ancestor))
+
+    @staticmethod
+    def check_text(text: str) -> List[Dict]:
+        """
+        Todos los problemas de un texto con formato /etc/exports, ordenados
+        por línea. Cada uno es {"severity", "code", "line", "path", "message"}.
+        """
+        issues: List[Dict] = []
+        exports: Dict[str, List[Tuple[int, str, str]]] = {}
+        first_line: Dict[str, int] = {}
+
+        # Mismo formato que ExportsManager.parse_text, sin crear un dict por
+        # entrada y host: este bucle es la mayor parte del coste
+        split_line = ExportsManager.split_line
+        for line, raw in enumerate(text.splitlines(), start=1):
+            parts = split_line(raw)
+            if not parts or parts[0].startswith("#"):
+                continue
+            path, tokens = parts[0], parts[1:]
+            if not path.startswith("/"):
+                issues.append(_issue(ERROR, "relative-path", line, path,
+                                     f"La ruta exportada debe ser absoluta: {path}"))
+                continue
+            if len(path) > 1:
+                path = path.rstrip("/")
+            if path in first_line:
+                issues.append(_issue(WARNING, "duplicate-export", line, path,
+                                     f"{path} ya se exporta en la línea {first_line[path]}; "
+                                     "exportfs combina ambas líneas"))
+            else:
+                first_line[path] = line
+            if not tokens:
+                issues.append(_issue(WARNING, "no-hosts", line, path,
+                                     f"{path} no indica hosts: se exporta a todo el mundo "
+                                     "con las opciones por defecto"))
+            rules = exports.get(path)
+            if rules is None:
+                rules = exports[path] = []
+            for token in tokens:
+                if "(" in token and ")" in token:
+                    name, _, options = token.partition("(")
+                    rules.append((line, name, "(" + options))
+                else:
+                    rules.append((line, token, ""))
+
+        for path, rules in exports.items():
+            ExportsLint._check_export(path, rules, issues)
+        ExportsLint._check_nesting(exports, first_line, issues)
+
+        issues.sort(key=lambda i: (i["line"], i["severity"] != ERROR))
+        return issues
+
+    @staticmethod
+    def errors(issues: List[Dict]) -> List[Dict]:
+        return [i for i in issues if i["severity"] == ERROR]
+
+    @staticmethod
+    def format(issues: List[Dict]) -> str:
+        """Una línea por problema: 'línea N: [error] código: mensaje'"""
+        return "\n".join(f"línea {i['line']}: [{i['severity']}] {i['code']}: {i['message']}"
+                         for i in issues)
+
+    @staticmethod
+    def _error_key(issue: Dict) -> Tuple[str, str, str]:
+        # Sin números de línea: añadir o quitar líneas antes no la cambia
+        return issue["code"], issue["path"], _LINE_REF.sub("", issue["message"])
+
+    @staticmethod
+    def new_errors(issues: List[Dict], base_text: str) -> List[Dict]:
+        """Errores de issues que no estaban ya en base_text (el texto antes del cambio)"""
+        remaining = Counter(ExportsLint._error_key(i)
+                            for i in ExportsLint.errors(ExportsLint.check_text(base_text)))
+        introduced = []
+        for issue in ExportsLint.errors(issues):
+            key = ExportsLint._error_key(issue)
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                introduced.append(issue)
+        return introduced
+
+    @staticmethod
+    def validate(text: str, max_listed: int = 10, base_text: Optional[str] = None) -> List[Dict]:
+        """
+        Lanza ExportsLintError si hay errores; si no, devuelve los avisos.
+        Con base_text solo cuentan los errores que no estaban ya en él.
+        """
+        issues = ExportsLint.check_text(text)
+        errors = ExportsLint.errors(issues)
+        if errors and base_text is not None:
+            errors = ExportsLint.new_errors(issues, base_text)
+        if errors:
+            listed = ExportsLint.format(errors[:max_listed])
+            more = f"\n... y {len(errors) - max_listed} más" if len(errors) > max_listed else ""
+            raise ExportsLintError(
+                f"La configuración de exports tiene {len(errors)} error(es):\n{listed}{more}",
+                issues)
+        return issues
@@ -0,0 +1,99 @@
+"""
+ExportsLock
+-----------
+Cerrojo entre procesos para las modificaciones de /etc/exports.
+
+La GUI, la CLI, el servicio RPC y los scripts leen, modifican y escriben el
+mismo archivo; sin coordinación el último en escribir borra los cambios de
+los demás. Todos toman este cerrojo (flock exclusivo, advisory) mientras
+leen, hacen el backup, mueven el archivo y ejecutan 'exportfs -ra'.
+
+Se bloquea el directorio que contiene /etc/exports, abierto en solo
+lectura: cualquier usuario puede abrirlo (la GUI corre sin root y eleva
+cada comando con pkexec), no hay que crear ningún archivo y el cerrojo
+sigue siendo válido aunque /etc/exports se sustituya por otro inodo con mv.
+Con NFS_MANAGER_LOCK se usa otro archivo o directorio.
+
+BackupManager usa el mismo mecanismo, sobre el directorio que contiene
+BACKUP_DIR, para serializar los cambios del manifiesto de backups.
+
+Es reentrante dentro de un proceso: un hilo que ya lo tiene puede volver a
+tomarlo (p. ej. restaurar un backup crea antes otro backup).
+"""
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+DEFAULT_TIMEOUT = 60.0
+_POLL_INTERVAL = 0.05
+
+
+class ExportsLockError(Exception):
+    pass
+
+
+class ExportsLock:
+    _guard = threading.Lock()
+    # destino -> RLock del proceso (el flock solo excluye a otros procesos)
+    _thread_locks: Dict[str, threading.RLock] = {}
+    # destino -> (descriptor con el flock, profundidad de reentrada)
+    _held: Dict[str, Tuple[int, int]] = {}
+
+    @staticmethod
+    def target_for(exports_path: str) -> str:
+        """Archivo o directorio sobre el que se toma el flock"""
+        return os.environ.get("NFS_MANAGER_LOCK") or os.path.dirname(os.path.abspath(exports_path))
+
+    @staticmethod
+    def _flock(target: str, timeout: float, deadline: float) -> int:
+        flags = os.O_RDONLY | getattr(os, "O_CLOEXEC", 0)
+        try:
+            # Un NFS_MANAGER_LOCK que aún no existe se crea
+            fd = os.open(target, flags if os.path.isdir(target) else flags | os.O_CREAT, 0o644)
+        except OSError as e:
+            raise ExportsLockError(f"No se pudo abrir {target} para bloquear: {e}")
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise ExportsLockError(
+                        f"/etc/exports sigue bloqueado por otro proceso tras {timeout:g} s; "
+                        "inténtelo de nuevo")
+                time.sleep(_POLL_INTERVAL)
+            except OSError as e:
+                os.close(fd)
+                raise ExportsLockError(f"No se pudo bloquear {target}: {e}")
+
+    @staticmethod
+    @contextmanager
+    def hold(exports_path: str, timeout: float = DEFAULT_TIMEOUT):
+        """Contexto con el cerrojo exclusivo de exports_path tomado"""
+        target = ExportsLock.target_for(exports_path)
+        with ExportsLock._guard:
+            thread_lock = ExportsLock._thread_locks.setdefault(target, threading.RLock())
+        deadline = time.monotonic() + timeout
+        if not thread_lock.acquire(timeout=timeout):
+            raise ExportsLockError("/etc/exports está bloqueado por otro hilo; inténtelo de nuevo")
+        try:
+            fd, depth = ExportsLock._held.get(target, (-1, 0))
+            if depth == 0:
+                fd = ExportsLock._flock(target, timeout, deadline)
+            ExportsLock._held[target] = (fd, depth + 1)
+            try:
+                yield
+            finally:
+                fd, depth = ExportsLock._held[target]
+                if depth == 1:
+                    del ExportsLock._held[target]
+                    os.close(fd)  # cerrar el descriptor libera el flock
+                else:
+                    ExportsLock._held[target] = (fd, depth - 1)
+        finally:
+            thread_lock.release()
@@ -5,20 +5,120 @@ ExportsManager
 Módulo para listar / añadir / editar / eliminar entradas en /etc/exports
 Diseñado para integrarse con una GUI. Usa pkexec o sudo para las operaciones que
 requieren permisos de root (abrirá el diálogo gráfico en openSUSE si usa pkexec).
+
+Varios escritores (varias GUI, la CLI, el servicio RPC, scripts) pueden
+trabajar a la vez sobre el mismo servidor:
+  - cada modificación se hace con el cerrojo de ExportsLock tomado, desde la
+    lectura hasta 'exportfs -ra', así que ninguna pisa a otra
+  - las modificaciones son funciones texto -> texto que se aplican sobre el
+    contenido vigente al tomar el cerrojo, no sobre el que se leyó antes
+  - un cambio puede indicar el hash del contenido en el que se basaba
+    (base_hash). Si el archivo cambió desde entonces, el cambio se rebasa
+    cuando las líneas de sus rutas siguen igual y se rechaza con
+    ExportsConflictError si otro las modificó
+  - dentro de un proceso, las modificaciones que llegan mientras otra se
+    escribe se agrupan: se aplican en orden sobre el mismo texto y se
+    escriben con un solo backup, un mv y un 'exportfs -ra'
 """
 
+import hashlib
 import os
+import re
+import shlex
 import tempfile
 import shutil
 import subprocess
-from typing import List, Dict, Optional
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Dict, Iterable, Optional, Tuple
+
+from util.backup_manager import BackupManager, BackupError
+from util.exports_lock import ExportsLock, ExportsLockError
+from util.instrumentation import Instrumentation
 
 EXPORTS_PATH = "/etc/exports"
 BACKUP_SUFFIX = ".bak"
+# Escapes de exports(5) en la ruta: \040 = espacio
+_OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+# Versiones leídas recientemente (hash -> texto), para poder rebasar cambios
+_KNOWN_VERSIONS = 32
+
+# Con más reglas cambiadas que esto, una recarga dirigida no compensa
+# frente a 'exportfs -ra'
+TARGETED_RELOAD_MAX = 500
 
 class ExportsError(Exception):
     pass
 
+class ExportsConflictError(ExportsError):
+    """/etc/exports cambió desde la versión en la que se basaba un cambio"""
+
+    def __init__(self, message: str, current_hash: str = ""):
+        super().__init__(message)
+        self.current_hash = current_hash
+
+
+class _PendingCommit:
+    """Una modificación esperando en la cola de escritura"""
+
+    __slots__ = ("transform", "base_hash", "paths", "validate", "targeted", "done",
+                 "result", "error")
+
+    def __init__(self, transform: Callable[[str], str], base_hash: Optional[str],
+                 paths: Optional[List[str]], validate: bool, targeted: bool = False):
+        self.transform = transform
+        self.base_hash = base_hash
+        self.paths = paths
+        self.validate = validate
+        self.targeted = targeted
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class _CommitQueue:
+    """
+    Cola de escritura con agrupación: el primer hilo que encuentra la cola
+    libre escribe todo lo pendiente en ese momento (y lo que llegue mientras
+    tanto, en la siguiente vuelta); los demás esperan su resultado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: List[_PendingCommit] = []
+        self._writing = False
+
+    def submit(self, item: _PendingCommit) -> str:
+        with self._lock:
+            self._pending.append(item)
+            leader = not self._writing
+            if leader:
+                self._writing = True
+        if leader:
+            while True:
+                with self._lock:
+                    batch, self._pending = self._pending, []
+                    if not batch:
+                        self._writing = False
+                        break
+                try:
+                    ExportsManager._commit_batch(batch)
+                except BaseException as e:
+                    for pending in batch:
+                        if not pending.done.is_set():
+                            pending.error = e
+                            pending.done.set()
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+
+_commit_queue = _CommitQueue()
+_versions_lock = threading.Lock()
+_versions: "OrderedDict[str, str]" = OrderedDict()
+
 class ExportsManager:
     _privilege_cmd = None
 
@@ -26,9 +126,12 @@ class ExportsManager:
     def _get_privilege_command():
         """
         Detecta qué comando usar para obtener privilegios.
-        Retorna 'pkexec' si está disponible, sino 'sudo'.
+        Retorna 'pkexec' si está disponible, sino 'sudo' (None si ya se es root).
         Cachea el resultado para no verificar múltiples veces.
         """
+        if os.geteuid() == 0:
+            # Ya somos root (p. ej. el servicio RPC): sin pkexec/sudo
+            return None
         if ExportsManager._privilege_cmd is None:
             if shutil.which("pkexec"):
                 ExportsManager._privilege_cmd = "pkexec"
@@ -42,8 +145,8 @@ class ExportsManager:
     def _run_pkexec(cmd: List[str], timeout: int = 10) -> subprocess.CompletedProcess:
         """Ejecuta un comando usando pkexec o sudo compatible con Python 3.6."""
         priv_cmd = ExportsManager._get_privilege_command()
-        return subprocess.run(
-            [priv_cmd] + cmd,
+        return Instrumentation.run(
+            ([priv_cmd] if priv_cmd else []) + cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
@@ -57,8 +160,11 @@ class ExportsManager:
         Retorna el contenido del archivo como string.
         """
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+            with Instrumentation.timed("file", "read", path) as t, \
+                    open(path, "r", encoding="utf-8") as f:
+                data = f.read()
+                t.bytes = len(data)
+                return data
         except PermissionError:
             res = ExportsManager._run_pkexec(["cat", path])
             if res.returncode != 0:
@@ -87,7 +193,12 @@ class ExportsManager:
           }
         ]
         """
-        lines = ExportsManager.list_raw()
+        return ExportsManager.parse_text(ExportsManager._read_file_as_root(EXPORTS_PATH))
+
+    @staticmethod
+    def parse_text(content: str) -> List[Dict]:
+        """Parsea un texto con formato de /etc/exports (ver list_parsed)."""
+        lines = content.splitlines()
         parsed = []
 
         for i, line in enumerate(lines, start=1):
@@ -95,7 +206,7 @@ class ExportsManager:
             if not s or s.startswith("#"):
                 continue
 
-            parts = s.split()
+            parts = ExportsManager.split_line(s)
             path = parts[0]
             hosts = parts[1:]
 
@@ -123,9 +234,20 @@ class ExportsManager:
 
     @staticmethod
     def backup(backup_path: Optional[str] = None) -> str:
-        """Crea backup de /etc/exports usando pkexec o sudo si es necesario."""
+        """
+        Crea backup de /etc/exports.
+
+        Sin backup_path se guarda como snapshot en el almacén de backups
+        (direccionado por contenido: si no cambió desde el último no ocupa
+        nada) y se devuelve su nombre. Con backup_path se copia el archivo
+        usando pkexec o sudo si es necesario.
+        """
         if backup_path is None:
-            backup_path = EXPORTS_PATH + BACKUP_SUFFIX
+            content = ExportsManager._read_file_as_root(EXPORTS_PATH)
+            try:
+                return BackupManager.snapshot(content, "Auto-backup antes de modificar /etc/exports")
+            except BackupError as e:
+                raise ExportsError(f"No se pudo crear backup: {e}")
         try:
             shutil.copyfile(EXPORTS_PATH, backup_path)
         except PermissionError:
@@ -136,45 +258,282 @@ class ExportsManager:
         return backup_path
 
     @staticmethod
-    def _write_temp_and_move(new_text: str) -> None:
-        """Escribe temp local y mueve a /etc/exports usando pkexec o sudo."""
+    def _install_text(text: str) -> None:
+        """Escribe text en un temporal y lo mueve a /etc/exports con pkexec o sudo."""
         fd, tmp_path = tempfile.mkstemp(prefix="exports_tmp_", text=True)
         os.close(fd)
         try:
-            with open(tmp_path, "w", encoding="utf-8") as f:
-                f.write(new_text)
-
-            # Backup
-            ExportsManager.backup()
-
-            # Mover temp a /etc/exports con pkexec o sudo
+            with Instrumentation.timed("file", "write", tmp_path) as t, \
+                    open(tmp_path, "w", encoding="utf-8") as f:
+                t.bytes = f.write(text)
             res = ExportsManager._run_pkexec(["mv", tmp_path, EXPORTS_PATH])
             if res.returncode != 0:
-                try: os.remove(tmp_path)
-                except Exception: pass
                 raise ExportsError(f"No se pudo mover el archivo: {res.stderr.strip()}")
-
-            # Recargar exportfs
-            res2 = ExportsManager._run_pkexec(["exportfs", "-ra"])
-            if res2.returncode != 0:
-                # Restaurar backup
-                ExportsManager._run_pkexec(["cp", EXPORTS_PATH + BACKUP_SUFFIX, EXPORTS_PATH])
-                raise ExportsError(f"exportfs devolvió error: {res2.stderr.strip()}")
-
         finally:
             if os.path.exists(tmp_path):
                 try: os.remove(tmp_path)
                 except Exception: pass
 
     @staticmethod
-    def apply_new_content(new_text: str) -> None:
+    def validate(text: str, base_text: Optional[str] = None) -> List[Dict]:
+        """
+        Valida text con ExportsLint: lanza ExportsError si tiene errores y
+        devuelve los avisos. Con base_text (el contenido antes del cambio)
+        solo cuentan los errores que el cambio introduce: uno que ya estaba
+        no bloquea las modificaciones de otras entradas.
+        """
+        # Import diferido: exports_lint importa este módulo
+        from util.exports_lint import ExportsLint
+        return ExportsLint.validate(text, base_text=base_text)
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Hash (sha256) de un contenido de /etc/exports"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _remember(text: str) -> str:
+        digest = ExportsManager.content_hash(text)
+        with _versions_lock:
+            _versions[digest] = text
+            _versions.move_to_end(digest)
+            while len(_versions) > _KNOWN_VERSIONS:
+                _versions.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def read_versioned() -> Tuple[str, str]:
+        """(contenido de /etc/exports, hash) para usar como base_hash de un cambio"""
+        text = ExportsManager._read_file_as_root(EXPORTS_PATH)
+        return text, ExportsManager._remember(text)
+
+    @staticmethod
+    def list_parsed_versioned() -> Tuple[List[Dict], str]:
+        """Como list_parsed, más el hash de la versión leída"""
+        text, digest = ExportsManager.read_versioned()
+        return ExportsManager.parse_text(text), digest
+
+    @staticmethod
+    def _stored_version(digest: str) -> Optional[str]:
+        """
+        Contenido con ese hash en el almacén de backups. Cada escritura guarda
+        antes el contenido anterior, así que cualquier versión que otro haya
+        sustituido está ahí (útil para base_hash de otro proceso, p. ej. la CLI).
+        """
+        try:
+            if BackupManager._has_object(digest):
+                return BackupManager._load_object(digest)
+        except (BackupError, OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    def _path_lines(text: str, paths: Iterable[str]) -> Dict[str, List[str]]:
+        wanted = set(paths)
+        found: Dict[str, List[str]] = {p: [] for p in wanted}
+        for line in text.splitlines():
+            path = ExportsManager.line_path(line)
+            if path in wanted:
+                found[path].append(line.strip())
+        return found
+
+    @staticmethod
+    def _check_base(pending: _PendingCommit, disk_text: str, disk_hash: str, text: str) -> None:
+        """
+        Comprueba que el cambio se puede aplicar sobre text (el contenido
+        vigente más lo ya aplicado en este lote). Se rebasa si las líneas de
+        sus rutas no cambiaron desde la versión base.
+        """
+        if pending.base_hash is None:
+            return
+        if pending.base_hash == disk_hash:
+            base_text = disk_text
+        else:
+            with _versions_lock:
+                base_text = _versions.get(pending.base_hash)
+            if base_text is None:
+                base_text = ExportsManager._stored_version(pending.base_hash)
+        if base_text is text:
+            return
+        if base_text is None or pending.paths is None:
+            raise ExportsConflictError(
+                "/etc/exports ha sido modificado por otro usuario o proceso desde que se leyó; "
+                "recargue y repita el cambio", disk_hash)
+        before = ExportsManager._path_lines(base_text, pending.paths)
+        after = ExportsManager._path_lines(text, pending.paths)
+        for path in pending.paths:
+            if before[path] != after[path]:
+                raise ExportsConflictError(
+                    f"La entrada de {path} ha sido modificada por otro usuario o proceso "
+                    "desde que se leyó; recargue y repita el cambio", disk_hash)
+
+    @staticmethod
+    def reload_commands(old_text: str, new_text: str) -> Optional[List[List[str]]]:
+        """
+        Comandos exportfs que llevan la tabla del kernel de old_text a
+        new_text tocando solo las reglas que cambian: 'exportfs -u
+        host:/ruta' para las que desaparecen y 'exportfs -o opciones
+        host:/ruta' para las nuevas o modificadas.
+
+        Devuelve None cuando no es seguro o no compensa y hay que usar
+        'exportfs -ra': opciones por defecto de línea ("/srv -sync host"),
+        hosts IPv6 (exportfs no distingue sus ':' de los de host:/ruta) o
+        más de TARGETED_RELOAD_MAX reglas cambiadas.
+        """
+        # Import diferido: exports_diff importa este módulo
+        from util.exports_diff import ExportsModel
+        old, new = ExportsModel.from_text(old_text), ExportsModel.from_text(new_text)
+        commands: List[List[str]] = []
+        for path in set(old.exports) | set(new.exports):
+            if old.exports.get(path) == new.exports.get(path):
+                continue
+            before, after = old.rule_map(path), new.rule_map(path)
+            for host in set(before) | set(after):
+                if host.startswith("-") or ":" in host:
+                    return None
+                if host not in after:
+                    commands.append(["exportfs", "-u", f"{host}:{path}"])
+                elif before.get(host) != after[host]:
+                    options = after[host].strip("()")
+                    commands.append(["exportfs"] + (["-o", options] if options else [])
+                                    + [f"{host}:{path}"])
+            if len(commands) > TARGETED_RELOAD_MAX:
+                return None
+        return commands
+
+    @staticmethod
+    def _reload(old_text: str, new_text: str, targeted: bool) -> subprocess.CompletedProcess:
+        """
+        Recarga la tabla del kernel: con targeted, solo las reglas que
+        cambian (un único comando privilegiado); si eso no es posible o
+        falla, 'exportfs -ra'.
+        """
+        commands = ExportsManager.reload_commands(old_text, new_text) if targeted else None
+        if commands == []:
+            return subprocess.CompletedProcess([], 0, "", "")
+        if commands:
+            script = "set -e\n" + "\n".join(" ".join(shlex.quote(a) for a in cmd)
+                                             for cmd in commands) + "\n"
+            res = ExportsManager._run_pkexec(["sh", "-c", script],
+                                             timeout=max(10, len(commands) // 10))
+            if res.returncode == 0:
+                return res
+        return ExportsManager._run_pkexec(["exportfs", "-ra"])
+
+    @staticmethod
+    def _install_and_reload(old_text: str, new_text: str, targeted: bool = False) -> None:
+        """Backup + mv + recarga de exportfs; si exportfs falla se restaura old_text"""
+        # Backup (snapshot en el almacén de backups)
+        ExportsManager.backup()
+
+        # Mover temp a /etc/exports con pkexec o sudo
+        ExportsManager._install_text(new_text)
+
+        # Recargar exportfs
+        res2 = ExportsManager._reload(old_text, new_text, targeted)
+        if res2.returncode != 0:
+            # Restaurar el contenido anterior
+            ExportsManager._install_text(old_text)
+            ExportsManager._run_pkexec(["exportfs", "-ra"])
+            raise ExportsError(f"exportfs devolvió error: {res2.stderr.strip()}")
+
+    @staticmethod
+    def _commit_batch(batch: List[_PendingCommit]) -> None:
+        """Aplica un lote de la cola con el cerrojo tomado: una sola escritura"""
+        try:
+            with ExportsLock.hold(EXPORTS_PATH):
+                ExportsManager._commit_locked(batch)
+        except ExportsLockError as e:
+            raise ExportsError(str(e))
+
+    @staticmethod
+    def _commit_locked(batch: List[_PendingCommit]) -> None:
+        old_text = ExportsManager._read_file_as_root(EXPORTS_PATH)
+        old_hash = ExportsManager._remember(old_text)
+
+        def run(pending: _PendingCommit, text: str, check: bool) -> Optional[str]:
+            try:
+                ExportsManager._check_base(pending, old_text, old_hash, text)
+                new_text = pending.transform(text)
+                if check:
+                    ExportsManager.validate(new_text, base_text=old_text)
+                return new_text
+            except Exception as e:
+                pending.error = e
+                pending.done.set()
+                return None
+
+        text = old_text
+        applied = []
+        for pending in batch:
+            new_text = run(pending, text, check=False)
+            if new_text is not None:
+                text = new_text
+                applied.append(pending)
+
+        # Una configuración con errores se rechaza antes de tocar nada, en
+        # vez de descubrirlo con 'exportfs -ra' y tener que restaurar
+        if any(p.validate for p in applied):
+            try:
+                ExportsManager.validate(text, base_text=old_text)
+            except ExportsError:
+                # Repetir de uno en uno para que solo fallen los culpables
+                text = old_text
+                kept = []
+                for pending in applied:
+                    new_text = run(pending, text, check=pending.validate)
+                    if new_text is not None:
+                        text = new_text
+                        kept.append(pending)
+                applied = kept
+
+        if applied and text != old_text:
+            try:
+                ExportsManager._install_and_reload(old_text, text,
+                                                   all(p.targeted for p in applied))
+            except Exception as e:
+                for pending in applied:
+                    pending.error = e
+                    pending.done.set()
+                return
+        new_hash = ExportsManager._remember(text)
+        for pending in applied:
+            pending.result = new_hash
+            pending.done.set()
+
+    @staticmethod
+    def commit(transform: Callable[[str], str], base_hash: Optional[str] = None,
+               paths: Optional[Iterable[str]] = None, validate: bool = True,
+               targeted: bool = False) -> str:
+        """
+        Aplica transform (contenido actual -> contenido nuevo) a /etc/exports
+        con el cerrojo tomado: backup, mv y 'exportfs -ra'. Devuelve el hash
+        del contenido resultante.
+
+        base_hash es el hash de la versión en la que se basó el cambio y
+        paths las rutas que toca; si el archivo cambió, el cambio se rebasa
+        cuando esas rutas siguen igual y si no se lanza ExportsConflictError.
+        Con validate se rechaza el resultado si ExportsLint encuentra errores.
+        Con targeted se recargan solo las reglas que cambian (ver
+        reload_commands) en lugar de 'exportfs -ra'.
+        """
+        pending = _PendingCommit(transform, base_hash,
+                                 list(paths) if paths is not None else None, validate, targeted)
+        return _commit_queue.submit(pending)
+
+    @staticmethod
+    def apply_new_content(new_text: str, validate: bool = True,
+                          base_hash: Optional[str] = None) -> str:
         """
         Reemplaza /etc/exports por new_text de forma atómica (backup + mv + exportfs -ra).
+        Con validate (por defecto) se rechaza si ExportsLint encuentra errores;
+        con base_hash se rechaza si el archivo cambió desde esa versión.
         """
-        ExportsManager._write_temp_and_move(new_text)
+        return ExportsManager.commit(lambda _text: new_text, base_hash, paths=None,
+                                     validate=validate)
 
     @staticmethod
-    def add_entry(path: str, hosts_expr: str) -> None:
+    def add_entry(path: str, hosts_expr: str, base_hash: Optional[str] = None) -> str:
         """
         Añade una nueva entrada al final de /etc/exports.
         path: ruta del sistema a exportar, ej. /srv/nfs4
@@ -182,60 +541,255 @@ class ExportsManager:
         """
         if not path or not hosts_expr:
             raise ValueError("path y hosts_expr son requeridos.")
-        lines = ExportsManager.list_raw()
-        # Comprobar si ya existe una entrada para la misma ruta (startswith)
-        for l in lines:
-            if l.strip().startswith(path):
-                raise ExportsError(f"Ya existe una entrada para la ruta: {path}")
-        if not lines or lines[-1].strip() != "":
-            lines.append("")  # asegurar nueva línea antes de añadir
-        lines.append(f"{path} {hosts_expr}")
-        new_text = "\n".join(lines) + "\n"
-        ExportsManager.apply_new_content(new_text)
-
-    @staticmethod
-    def remove_entry(match_path: str) -> None:
-        """
-        Elimina todas las líneas que comienzan con match_path.
-        match_path: la ruta a buscar al inicio de la línea (ej. '/srv/nfs4').
-        """
-        lines = ExportsManager.list_raw()
-        new_lines = [l for l in lines if not l.strip().startswith(match_path)]
-        if len(new_lines) == len(lines):
-            raise ExportsError(f"No se encontró ninguna entrada que comience con: {match_path}")
-        new_text = "\n".join(new_lines) + "\n"
-        ExportsManager.apply_new_content(new_text)
-
-    @staticmethod
-    def edit_entry(match_path: str, new_hosts_expr: str) -> None:
-        """
-        Reemplaza la primera línea que comienza con match_path por 'match_path new_hosts_expr'.
-        """
-        lines = ExportsManager.list_raw()
-        new_lines = []
-        replaced = False
-        for l in lines:
-            if (not replaced) and l.strip().startswith(match_path):
-                new_lines.append(f"{match_path} {new_hosts_expr}")
-                replaced = True
+
+        def transform(text: str) -> str:
+            lines = text.splitlines()
+            # Comprobar si ya existe una entrada para la misma ruta (exacta)
+            for l in lines:
+                if ExportsManager.line_path(l) == path:
+                    raise ExportsError(f"Ya existe una entrada para la ruta: {path}")
+            if not lines or lines[-1].strip() != "":
+                lines.append("")  # asegurar nueva línea antes de añadir
+            lines.append(f"{ExportsManager.quote_path(path)} {hosts_expr}")
+            return "\n".join(lines) + "\n"
+
+        return ExportsManager.commit(transform, base_hash, [path])
+
+    @staticmethod
+    def remove_entry(match_path: str, base_hash: Optional[str] = None) -> str:
+        """
+        Elimina todas las líneas que exportan exactamente match_path.
+        match_path: la ruta exportada (ej. '/srv/nfs4'; no elimina '/srv/nfs45').
+        """
+        def transform(text: str) -> str:
+            lines = text.splitlines()
+            new_lines = [l for l in lines if ExportsManager.line_path(l) != match_path]
+            if len(new_lines) == len(lines):
+                raise ExportsError(f"No se encontró ninguna entrada para la ruta: {match_path}")
+            return "\n".join(new_lines) + "\n"
+
+        return ExportsManager.commit(transform, base_hash, [match_path])
+
+    @staticmethod
+    def edit_entry(match_path: str, new_hosts_expr: str, base_hash: Optional[str] = None) -> str:
+        """
+        Reemplaza la primera línea que exporta exactamente match_path por
+        'match_path new_hosts_expr'.
+        """
+        def transform(text: str) -> str:
+            new_lines = []
+            replaced = False
+            for l in text.splitlines():
+                if (not replaced) and ExportsManager.line_path(l) == match_path:
+                    new_lines.append(f"{ExportsManager.quote_path(match_path)} {new_hosts_expr}")
+                    replaced = True
+                else:
+                    new_lines.append(l)
+            if not replaced:
+                raise ExportsError(f"No se encontró ninguna entrada para la ruta: {match_path}")
+            return "\n".join(new_lines) + "\n"
+
+        return ExportsManager.commit(transform, base_hash, [match_path])
+
+    # ------------------------------------------------------------------
+    # Cambios en lote
+    # ------------------------------------------------------------------
+
+    CHANGE_OPS = ("add", "remove", "edit", "set")
+
+    @staticmethod
+    def split_line(line: str) -> List[str]:
+        """
+        Campos de una línea como los separa exportfs: por espacios salvo
+        dentro de comillas dobles, que se quitan ('"/srv/mi dir" host(rw)').
+        En la ruta se decodifican los escapes octales de exports(5) ('\\040').
+        """
+        if '"' not in line and "\\" not in line:
+            return line.split()
+        fields, current, quoted, started = [], [], False, False
+        for c in line:
+            if c == '"':
+                quoted, started = not quoted, True
+            elif c.isspace() and not quoted:
+                if started:
+                    fields.append("".join(current))
+                    current, started = [], False
+            else:
+                current.append(c)
+                started = True
+        if started:
+            fields.append("".join(current))
+        if fields and "\\" in fields[0]:
+            fields[0] = _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[0])
+        return fields
+
+    @staticmethod
+    def quote_path(path: str) -> str:
+        """Ruta tal como se escribe en /etc/exports (entre comillas si tiene espacios)"""
+        return f'"{path}"' if any(c.isspace() for c in path) else path
+
+    @staticmethod
+    def line_path(line: str) -> Optional[str]:
+        """Ruta exportada por una línea (None si es comentario o vacía)"""
+        s = line.strip()
+        if not s or s.startswith("#"):
+            return None
+        return ExportsManager.split_line(s)[0]
+
+    @staticmethod
+    def normalize_change(change: Dict) -> Dict:
+        """
+        Valida un cambio y lo devuelve normalizado:
+            {"op": "add"|"remove"|"edit"|"set", "path": str, "hosts": str}
+        hosts puede darse como texto ("a(rw) b(ro)") o como lista de
+        {"name", "options"} o de cadenas.
+        """
+        if not isinstance(change, dict):
+            raise ExportsError(f"Cambio inválido (se esperaba un objeto): {change!r}")
+        op = change.get("op", "set")
+        path = change.get("path")
+        if op not in ExportsManager.CHANGE_OPS:
+            raise ExportsError(f"Operación desconocida '{op}' (válidas: {', '.join(ExportsManager.CHANGE_OPS)})")
+        # Los espacios se escriben entre comillas (quote_path); comillas y
+        # saltos de línea no se pueden representar en /etc/exports
+        if not path or not isinstance(path, str) or any(c in path for c in '"\n\r'):
+            raise ExportsError(f"Ruta inválida en el cambio: {path!r}")
+
+        hosts = change.get("hosts", "")
+        if isinstance(hosts, list):
+            parts = []
+            for h in hosts:
+                if isinstance(h, dict):
+                    options = h.get("options", "")
+                    if isinstance(options, list):
+                        options = "(" + ",".join(options) + ")"
+                    elif options and not options.startswith("("):
+                        options = f"({options})"
+                    parts.append(f"{h.get('name', '')}{options}")
+                else:
+                    parts.append(str(h))
+            hosts = " ".join(parts)
+        hosts = (hosts or "").strip()
+        if op != "remove" and not hosts:
+            raise ExportsError(f"Falta 'hosts' para {op} {path}")
+        return {"op": op, "path": path, "hosts": hosts}
+
+    @staticmethod
+    def apply_changes_to_text(text: str, changes: List[Dict]) -> Tuple[str, Dict]:
+        """
+        Aplica una lista de cambios a un texto con formato /etc/exports, sin
+        tocar el disco. Las rutas se comparan exactas y el coste es lineal en
+        líneas + cambios.
+
+        Returns:
+            (nuevo_texto, {"added": [...], "removed": [...], "edited": [...],
+                           "unchanged": [...]})
+        """
+        lines: List[Optional[str]] = text.splitlines()
+        index: Dict[str, List[int]] = {}
+        for i, line in enumerate(lines):
+            path = ExportsManager.line_path(line)
+            if path is not None:
+                index.setdefault(path, []).append(i)
+
+        summary = {"added": [], "removed": [], "edited": [], "unchanged": []}
+        for n, raw in enumerate(changes, start=1):
+            try:
+                change = ExportsManager.normalize_change(raw)
+            except ExportsError as e:
+                raise ExportsError(f"Cambio {n}: {e}")
+            op, path, hosts = change["op"], change["path"], change["hosts"]
+            new_line = f"{ExportsManager.quote_path(path)} {hosts}"
+            existing = index.get(path)
+
+            if op == "add" and existing:
+                raise ExportsError(f"Cambio {n}: ya existe una entrada para la ruta: {path}")
+            if op in ("remove", "edit") and not existing:
+                raise ExportsError(f"Cambio {n}: no existe ninguna entrada para la ruta: {path}")
+
+            if op == "remove":
+                for i in existing:
+                    lines[i] = None
+                del index[path]
+                summary["removed"].append(path)
+            elif existing:
+                first = existing[0]
+                if lines[first].strip() == new_line and len(existing) == 1:
+                    summary["unchanged"].append(path)
+                    continue
+                lines[first] = new_line
+                # Las líneas duplicadas de la misma ruta quedan sustituidas
+                for i in existing[1:]:
+                    lines[i] = None
+                index[path] = [first]
+                summary["edited"].append(path)
             else:
-                new_lines.append(l)
-        if not replaced:
-            raise ExportsError(f"No se encontró ninguna entrada que comience con: {match_path}")
-        new_text = "\n".join(new_lines) + "\n"
-        ExportsManager.apply_new_content(new_text)
+                index[path] = [len(lines)]
+                lines.append(new_line)
+                summary["added"].append(path)
+
+        new_text = "\n".join(l for l in lines if l is not None)
+        return (new_text + "\n" if new_text else ""), summary
+
+    @staticmethod
+    def apply_changes(changes: List[Dict], dry_run: bool = False,
+                      base_hash: Optional[str] = None, targeted: bool = False) -> Dict:
+        """
+        Aplica muchos cambios como una única modificación de /etc/exports:
+        una lectura, un backup, una escritura y un solo 'exportfs -ra'.
+        Si algún cambio no es válido no se aplica ninguno. base_hash y
+        targeted funcionan como en commit, con las rutas de todos los cambios.
+
+        Returns:
+            Resumen de apply_changes_to_text más "changed" (bool), "hash"
+            (del contenido resultante) y, con dry_run, "content" con el texto
+            resultante e "issues" con los problemas que encuentra ExportsLint
+        """
+        def transform(text: str) -> str:
+            new_text, result = ExportsManager.apply_changes_to_text(text, changes)
+            result["changed"] = new_text != text and bool(
+                result["added"] or result["removed"] or result["edited"])
+            summary.clear()
+            summary.update(result)
+            return new_text if result["changed"] else text
+
+        summary: Dict = {}
+        if dry_run:
+            from util.exports_lint import ExportsLint
+            old_text = ExportsManager._read_file_as_root(EXPORTS_PATH)
+            new_text = transform(old_text)
+            summary["hash"] = ExportsManager.content_hash(new_text)
+            summary["content"] = new_text
+            summary["issues"] = ExportsLint.check_text(new_text)
+            return summary
+        paths = [c.get("path") for c in changes if isinstance(c, dict)]
+        summary["hash"] = ExportsManager.commit(transform, base_hash, paths, targeted=targeted)
+        return summary
 
     @staticmethod
     def restore_backup(backup_path: Optional[str] = None) -> None:
         """
-        Restaura el backup (por defecto /etc/exports.bak) y recarga exportfs.
+        Restaura un backup y recarga exportfs. Sin backup_path restaura el
+        snapshot más reciente del almacén de backups.
         """
-        backup = backup_path or (EXPORTS_PATH + BACKUP_SUFFIX)
-        if not os.path.exists(backup):
-            raise ExportsError("No existe backup para restaurar: " + backup)
-        res = ExportsManager._run_pkexec(["cp", backup, EXPORTS_PATH])
-        if res.returncode != 0:
-            raise ExportsError("No se pudo restaurar backup: " + res.stderr.strip())
-        res2 = ExportsManager._run_pkexec(["exportfs", "-ra"])
-        if res2.returncode != 0:
-            raise ExportsError("exportfs devolvió error al restaurar backup: " + res2.stderr.strip())
+        if backup_path is None:
+            try:
+                backups = BackupManager.list_backups()
+                if not backups:
+                    raise ExportsError("No existe backup para restaurar")
+                BackupManager.restore_backup(backups[0]["filename"])
+                return
+            except BackupError as e:
+                raise ExportsError(f"No se pudo restaurar backup: {e}")
+        if not os.path.exists(backup_path):
+            raise ExportsError("No existe backup para restaurar: " + backup_path)
+        try:
+            with ExportsLock.hold(EXPORTS_PATH):
+                res = ExportsManager._run_pkexec(["cp", backup_path, EXPORTS_PATH])
+                if res.returncode != 0:
+                    raise ExportsError("No se pudo restaurar backup: " + res.stderr.strip())
+                res2 = ExportsManager._run_pkexec(["exportfs", "-ra"])
+                if res2.returncode != 0:
+                    raise ExportsError("exportfs devolvió error al restaurar backup: " + res2.stderr.strip())
+        except ExportsLockError as e:
+            raise ExportsError(str(e))
@@ -0,0 +1,281 @@
+"""
+ExportsReconcile
+----------------
+Convergencia de /etc/exports hacia un estado deseado declarativo, p. ej. un
+archivo versionado en git que un timer de systemd aplica cada minuto.
+
+El estado deseado es un documento JSON/YAML:
+
+    {"exports": [{"path": "/srv/a", "hosts": "10.0.0.0/8(rw,sync)"},
+                 {"path": "/srv/b", "hosts": [{"name": "*", "options": ["ro"]}]}],
+     "prune": true,                  (por defecto: se eliminan las no declaradas)
+     "managed": ["/srv"]}            (opcional: solo se eliminan bajo estas rutas)
+
+("exports" también puede ser un objeto ruta -> hosts, o el documento una
+lista de exportaciones) o directamente un texto con formato /etc/exports.
+
+reconcile() hace tres cosas:
+  1. camino rápido: si el estado deseado y /etc/exports son los mismos que
+     en la última convergencia (hash del documento; stat y, si cambió, hash
+     de /etc/exports, guardados en default_state_path()) no hay deriva y no se parsea
+     nada
+  2. si no, compara exportación a exportación indexando por ruta (coste
+     lineal) y calcula los cambios mínimos: altas, sustituciones de las que
+     difieren y bajas de las no declaradas. Las demás líneas y los
+     comentarios no se tocan
+  3. aplica todos los cambios en un único commit de ExportsManager (cerrojo,
+     backup, una escritura) recargando solo las reglas que cambian
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from util.exports_manager import ExportsManager, ExportsError, EXPORTS_PATH
+from util.exports_diff import ExportsModel
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_INTERVAL = "1min"
+
+
+def default_state_path() -> str:
+    """NFS_MANAGER_RECONCILE_STATE, o /var/lib (root) o ~/.local/state"""
+    path = os.environ.get("NFS_MANAGER_RECONCILE_STATE")
+    if path:
+        return path
+    if os.geteuid() == 0:
+        return "/var/lib/nfs-manager/reconcile.json"
+    base = os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state")
+    return os.path.join(base, "nfs-manager", "reconcile.json")
+
+
+class ReconcileError(ExportsError):
+    pass
+
+
+class DesiredState:
+    """Exportaciones deseadas: ruta -> hosts, en el orden declarado"""
+
+    def __init__(self, exports: List[Tuple[str, str]], prune: bool = True,
+                 managed: Optional[List[str]] = None):
+        self.exports: Dict[str, str] = {}
+        for path, hosts in exports:
+            if path in self.exports:
+                raise ReconcileError(f"La ruta {path} aparece dos veces en el estado deseado")
+            self.exports[path] = hosts
+        self.prune = prune
+        self.managed = [m.rstrip("/") or "/" for m in (managed or [])]
+        self._model: Optional[ExportsModel] = None
+
+    @classmethod
+    def from_document(cls, doc) -> "DesiredState":
+        """Documento JSON/YAML ya parseado (ver el formato en el módulo)"""
+        if doc is None:
+            doc = []
+        if isinstance(doc, list) or (isinstance(doc, dict) and doc
+                                     and all(str(k).startswith("/") for k in doc)):
+            doc = {"exports": doc}
+        if not isinstance(doc, dict):
+            raise ReconcileError("El estado deseado debe ser un objeto con 'exports' o una lista")
+        unknown = set(doc) - {"exports", "prune", "managed"}
+        if unknown:
+            raise ReconcileError(f"Claves desconocidas en el estado deseado: {', '.join(sorted(unknown))}")
+        items = doc.get("exports") or []
+        if isinstance(items, dict):
+            items = [{"path": path, "hosts": hosts} for path, hosts in items.items()]
+        if not isinstance(items, list):
+            raise ReconcileError("'exports' debe ser una lista o un objeto ruta -> hosts")
+        exports = []
+        for n, item in enumerate(items, start=1):
+            if not isinstance(item, dict):
+                raise ReconcileError(f"Exportación {n}: se esperaba un objeto con 'path' y 'hosts'")
+            try:
+                change = ExportsManager.normalize_change(
+                    {"op": "set", "path": item.get("path"), "hosts": item.get("hosts")})
+            except ExportsError as e:
+                raise ReconcileError(f"Exportación {n}: {e}")
+            exports.append((change["path"], change["hosts"]))
+        managed = doc.get("managed")
+        if managed is not None and not (isinstance(managed, list)
+                                        and all(isinstance(m, str) for m in managed)):
+            raise ReconcileError("'managed' debe ser una lista de rutas")
+        return cls(exports, bool(doc.get("prune", True)), managed)
+
+    @classmethod
+    def from_exports_text(cls, text: str, prune: bool = True,
+                          managed: Optional[List[str]] = None) -> "DesiredState":
+        """Texto con formato /etc/exports; varias líneas de una ruta se unen"""
+        exports: Dict[str, List[str]] = {}
+        for entry in ExportsManager.parse_text(text):
+            exports.setdefault(entry["path"], []).extend(
+                h["name"] + h["options"] for h in entry["hosts"])
+        return cls([(path, " ".join(hosts)) for path, hosts in exports.items()], prune, managed)
+
+    @property
+    def model(self) -> ExportsModel:
+        if self._model is None:
+            self._model = ExportsModel.from_text(
+                "".join(f"{ExportsManager.quote_path(path)} {hosts}\n"
+                        for path, hosts in self.exports.items()), "desired")
+        return self._model
+
+    def manages(self, path: str) -> bool:
+        """Si una ruta que no está en el estado deseado se puede eliminar"""
+        if not self.prune:
+            return False
+        if not self.managed:
+            return True
+        return any(path == m or path.startswith(m.rstrip("/") + "/") for m in self.managed)
+
+
+class ExportsReconcile:
+    """Plan y aplicación de la convergencia hacia un DesiredState"""
+
+    @staticmethod
+    def plan(desired: DesiredState, current_text: str) -> List[Dict]:
+        """
+        Cambios mínimos (formato de ExportsManager.apply_changes) que llevan
+        current_text al estado deseado. Una exportación se considera igual si
+        tiene las mismas reglas en el mismo orden (el orden decide qué regla
+        se aplica cuando varias coinciden).
+        """
+        current = ExportsModel.from_text(current_text, "current")
+        target = desired.model
+        changes = []
+        for path in current.exports:
+            if path not in target.exports and desired.manages(path):
+                changes.append({"op": "remove", "path": path})
+        for path, hosts in desired.exports.items():
+            rules = current.exports.get(path)
+            if rules is None:
+                changes.append({"op": "add", "path": path, "hosts": hosts})
+            elif rules != target.exports[path]:
+                changes.append({"op": "set", "path": path, "hosts": hosts})
+        return changes
+
+    @staticmethod
+    def _stat_key(path: str) -> Optional[List[int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def _load_state(state_path: str) -> Dict:
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_state(state_path: str, state: Dict) -> None:
+        """Se escribe con rename; si no se puede, solo se pierde el camino rápido"""
+        try:
+            os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+            tmp_path = f"{state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_path)
+        except OSError as e:
+            log.warning("No se pudo guardar el estado de reconcile en %s: %s", state_path, e)
+
+    @staticmethod
+    def source_key(text: str, *flags) -> str:
+        """Hash del documento de estado deseado (más las opciones que lo interpretan)"""
+        digest = hashlib.sha256(text.encode("utf-8"))
+        digest.update(json.dumps(flags).encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def reconcile(load_desired: Callable[[], DesiredState], key: str, dry_run: bool = False,
+                  force: bool = False, targeted: bool = True,
+                  state_path: Optional[str] = None) -> Dict:
+        """
+        Converge /etc/exports al estado deseado.
+
+        Args:
+            load_desired: construye el DesiredState; solo se llama si el
+                          camino rápido no basta
+            key: source_key del documento, para el camino rápido
+            force: ignorar el camino rápido y comparar siempre
+            targeted: recargar solo las reglas que cambian
+
+        Returns:
+            {"drift": bool, "fast_path": bool, "changes": [...],
+             "summary": {...} (si se aplicó), "hash", "elapsed"}
+        """
+        start = time.perf_counter()
+        state_path = state_path or default_state_path()
+        state = {} if force else ExportsReconcile._load_state(state_path)
+        stat_key = ExportsReconcile._stat_key(EXPORTS_PATH)
+
+        def result(**values) -> Dict:
+            values["elapsed"] = round(time.perf_counter() - start, 6)
+            return values
+
+        # 1. Sin deriva: mismo documento y /etc/exports sin tocar desde la
+        #    última convergencia (por stat; si el stat cambió, por contenido)
+        if state.get("desired") == key and stat_key is not None and state.get("stat") == stat_key:
+            return result(drift=False, fast_path=True, changes=[], hash=state.get("exports"))
+        current_text, current_hash = ExportsManager.read_versioned()
+        if state.get("desired") == key and state.get("exports") == current_hash:
+            state["stat"] = stat_key
+            ExportsReconcile._save_state(state_path, state)
+            return result(drift=False, fast_path=True, changes=[], hash=current_hash)
+
+        # 2. Cambios mínimos
+        desired = load_desired()
+        changes = ExportsReconcile.plan(desired, current_text)
+        if not changes:
+            ExportsReconcile._save_state(state_path, {"desired": key, "exports": current_hash,
+                                                      "stat": stat_key})
+            return result(drift=False, fast_path=False, changes=[], hash=current_hash)
+        if dry_run:
+            summary = ExportsManager.apply_changes_to_text(current_text, changes)[1]
+            return result(drift=True, fast_path=False, changes=changes, summary=summary,
+                          hash=current_hash)
+
+        # 3. Un único commit, rebasado si otro escritor toca otras rutas
+        summary = ExportsManager.apply_changes(changes, base_hash=current_hash, targeted=targeted)
+        ExportsReconcile._save_state(state_path, {
+            "desired": key, "exports": summary["hash"],
+            "stat": ExportsReconcile._stat_key(EXPORTS_PATH)})
+        log.info("reconcile: %d cambio(s) aplicados en %s", len(changes), EXPORTS_PATH)
+        return result(drift=True, fast_path=False, changes=changes, summary=summary,
+                      hash=summary["hash"])
+
+    @staticmethod
+    def render_units(command: str, interval: str = DEFAULT_INTERVAL,
+                     working_directory: Optional[str] = None) -> Dict[str, str]:
+        """
+        Unidades nfs-manager-reconcile.service/.timer que ejecutan command
+        (p. ej. 'python3 -m util.cli reconcile /srv/git/exports.yaml')
+        cada interval.
+        """
+        service = (
+            "[Unit]\n"
+            "Description=Converge /etc/exports to the declared state\n"
+            "After=nfs-server.service\n\n"
+            "[Service]\n"
+            "Type=oneshot\n"
+            + (f"WorkingDirectory={working_directory}\n" if working_directory else "")
+            + f"ExecStart={command}\n"
+        )
+        timer = (
+            "[Unit]\n"
+            "Description=Run nfs-manager-reconcile periodically\n\n"
+            "[Timer]\n"
+            f"OnBootSec={interval}\n"
+            f"OnUnitActiveSec={interval}\n"
+            "AccuracySec=5s\n\n"
+            "[Install]\n"
+            "WantedBy=timers.target\n"
+        )
+        return {"nfs-manager-reconcile.service": service, "nfs-manager-reconcile.timer": timer}
@@ -0,0 +1,581 @@
+"""
+Fleet
+-----
+Operaciones de exports, servicio y backups sobre muchos servidores NFS a
+la vez.
+
+Los servidores salen de un inventario (formato INI de Ansible o JSON) y
+cada operación se ejecuta en paralelo en un pool de hilos acotado, así que
+aplicar un cambio a 50 servidores tarda lo que el más lento y no la suma
+de todos. Cada host informa de su progreso por separado y al final se
+obtiene una tabla con el resultado de cada uno.
+
+El acceso a los hosts lo hace un transporte intercambiable:
+    ssh      ssh en modo batch con conexión maestra compartida (ControlMaster)
+    local    ejecuta los comandos en esta máquina (pruebas; cada host puede
+             apuntar a su propio exports_path)
+    docker / podman
+             'docker exec' en un contenedor con el nombre del host
+
+Variables de host reconocidas en el inventario:
+    ansible_host, ansible_user, ansible_port, ansible_become (o address,
+    user, port, become), transport, container, exports_path, backup_dir,
+    exportfs_cmd (comando de recarga tras aplicar; por defecto 'exportfs -ra'
+    si exports_path es /etc/exports y 'true', no recargar, si es otro archivo)
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from util.exports_manager import ExportsManager, ExportsError
+from util.exports_lint import ExportsLint
+from util.instrumentation import Instrumentation
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_INVENTORY = os.path.join(os.path.expanduser("~"), ".config", "nfs-manager", "inventory")
+DEFAULT_WORKERS = 64
+DEFAULT_TIMEOUT = 120
+EXPORTS_PATH = "/etc/exports"
+REMOTE_BACKUP_DIR = "/var/backups/nfs-manager/fleet"
+
+# Sustituye el archivo de exports por stdin en una única llamada remota:
+# comprueba que nadie lo cambió desde que se leyó ($1 = sha256 esperado),
+# guarda una copia en $3, lo reemplaza de forma atómica y recarga con el
+# comando $5 (normalmente 'exportfs -ra'); si falla se restaura la copia.
+_APPLY_SCRIPT = (
+    'set -e\n'
+    'f="$2"\n'
+    # Mismo cerrojo que ExportsLock (flock del directorio de exports), para
+    # no pisar a una GUI o CLI que esté modificando el archivo en el servidor
+    'if command -v flock >/dev/null 2>&1; then\n'
+    '  exec 9<"$(dirname "$f")"\n'
+    '  flock -w 60 9 || { echo "$f está bloqueado por otro proceso" >&2; exit 3; }\n'
+    'fi\n'
+    'cur=$(sha256sum "$f" | cut -d" " -f1)\n'
+    'if [ "$cur" != "$1" ]; then echo "$f cambió durante la operación" >&2; exit 3; fi\n'
+    'tmp=$(mktemp "$(dirname "$f")/.exports.XXXXXX")\n'
+    'cat > "$tmp"\n'
+    'chmod 644 "$tmp"\n'
+    'mkdir -p "$3"\n'
+    'cp -p "$f" "$3/$4"\n'
+    'mv -f "$tmp" "$f"\n'
+    'if ! sh -c "$5"; then\n'
+    '  cp -p "$3/$4" "$f"; sh -c "$5" || true\n'
+    '  echo "Falló la recarga ($5); se restauró $f" >&2\n'
+    '  exit 4\n'
+    'fi\n'
+)
+
+_BACKUP_SCRIPT = 'set -e\nmkdir -p "$2"\ncp -p "$1" "$2/$3"\n'
+
+_SERVICE_STATUS_SCRIPT = (
+    'echo "$(systemctl is-active nfs-server 2>/dev/null || true)"\n'
+    'echo "$(systemctl is-enabled nfs-server 2>/dev/null || true)"\n'
+)
+
+
+class FleetError(Exception):
+    pass
+
+
+class UnreachableError(FleetError):
+    pass
+
+
+# ----------------------------------------------------------------------
+# Inventario
+# ----------------------------------------------------------------------
+
+_HOST_VARS = {
+    "ansible_host": "address", "ansible_user": "user", "ansible_port": "port",
+    "ansible_become": "become",
+}
+
+
+def _host(name: str, variables: Dict, groups: List[str]) -> Dict:
+    host = {"name": name, "address": name, "user": None, "port": None,
+            "become": False, "transport": None, "groups": list(groups)}
+    for key, value in variables.items():
+        host[_HOST_VARS.get(key, key)] = value
+    if isinstance(host["become"], str):
+        host["become"] = host["become"].lower() in ("1", "true", "yes")
+    if host["port"] is not None:
+        host["port"] = int(host["port"])
+    return host
+
+
+class Inventory:
+    """Lista de servidores con sus variables y grupos"""
+
+    def __init__(self, hosts: List[Dict]):
+        self.hosts = hosts
+
+    @staticmethod
+    def parse_ini(text: str) -> "Inventory":
+        """
+        Inventario INI de Ansible:
+
+            [nfs_servers]
+            nfs1 ansible_host=10.0.0.11 ansible_user=admin ansible_become=true
+            nfs2
+
+            [nfs_servers:vars]
+            exports_path=/etc/exports
+        """
+        hosts: Dict[str, Dict] = {}
+        order: List[str] = []
+        group_vars: Dict[str, Dict] = {}
+        members: Dict[str, List[str]] = {}
+        section, is_vars = "ungrouped", False
+
+        for n, line in enumerate(text.splitlines(), start=1):
+            s = line.strip()
+            if not s or s[0] in "#;":
+                continue
+            if s.startswith("[") and s.endswith("]"):
+                section = s[1:-1].strip()
+                is_vars = section.endswith(":vars")
+                if is_vars:
+                    section = section[:-5]
+                    group_vars.setdefault(section, {})
+                elif section.endswith(":children"):
+                    raise FleetError(f"Inventario línea {n}: los grupos anidados no están soportados")
+                continue
+            try:
+                parts = shlex.split(s, comments=True)
+            except ValueError as e:
+                raise FleetError(f"Inventario línea {n}: {e}")
+            if is_vars:
+                key, sep, value = s.partition("=")
+                if not sep:
+                    raise FleetError(f"Inventario línea {n}: se esperaba clave=valor")
+                group_vars[section][key.strip()] = value.strip()
+                continue
+            name, variables = parts[0], {}
+            for part in parts[1:]:
+                key, sep, value = part.partition("=")
+                if not sep:
+                    raise FleetError(f"Inventario línea {n}: se esperaba clave=valor en '{part}'")
+                variables[key] = value
+            if name not in hosts:
+                hosts[name] = {}
+                order.append(name)
+            hosts[name].update(variables)
+            members.setdefault(name, [])
+            if section not in members[name]:
+                members[name].append(section)
+
+        result = []
+        for name in order:
+            variables = {}
+            for group in members[name]:
+                variables.update(group_vars.get(group, {}))
+            variables.update(hosts[name])
+            result.append(_host(name, variables, members[name]))
+        return Inventory(result)
+
+    @staticmethod
+    def parse_json(text: str) -> "Inventory":
+        """Lista de hosts (nombres u objetos con 'name') o {"hosts": [...]}"""
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("hosts", [])
+        result = []
+        for item in data:
+            if isinstance(item, str):
+                item = {"name": item}
+            if not isinstance(item, dict) or not item.get("name"):
+                raise FleetError(f"Host inválido en el inventario: {item!r}")
+            variables = {k: v for k, v in item.items() if k not in ("name", "groups")}
+            result.append(_host(item["name"], variables, item.get("groups", ["ungrouped"])))
+        return Inventory(result)
+
+    @staticmethod
+    def load(path: Optional[str] = None) -> "Inventory":
+        path = path or os.environ.get("NFS_MANAGER_INVENTORY") or DEFAULT_INVENTORY
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            raise FleetError(f"No se pudo leer el inventario {path}: {e}")
+        if path.endswith(".json") or text.lstrip().startswith(("[{", "[\"", "{")):
+            try:
+                return Inventory.parse_json(text)
+            except ValueError as e:
+                raise FleetError(f"Inventario JSON inválido: {e}")
+        return Inventory.parse_ini(text)
+
+    def select(self, patterns: Optional[List[str]] = None) -> List[Dict]:
+        """Hosts cuyo nombre o algún grupo coincide con los patrones (fnmatch)"""
+        if not patterns:
+            return list(self.hosts)
+        return [h for h in self.hosts
+                if any(fnmatch.fnmatch(h["name"], p) or
+                       any(fnmatch.fnmatch(g, p) for g in h["groups"])
+                       for p in patterns)]
+
+
+# ----------------------------------------------------------------------
+# Transportes
+# ----------------------------------------------------------------------
+
+class Transport:
+    """Ejecuta un comando (lista de argumentos) en un host"""
+
+    name = ""
+
+    def command(self, host: Dict, argv: List[str]) -> List[str]:
+        raise NotImplementedError
+
+    def run(self, host: Dict, argv: List[str], input: Optional[str] = None,
+            timeout: float = DEFAULT_TIMEOUT) -> subprocess.CompletedProcess:
+        try:
+            return Instrumentation.run(self.command(host, argv), input=input,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       universal_newlines=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise UnreachableError(f"Sin respuesta en {timeout}s")
+        except FileNotFoundError as e:
+            raise FleetError(f"Transporte '{self.name}' no disponible: {e}")
+
+    def is_unreachable(self, res: subprocess.CompletedProcess) -> bool:
+        return False
+
+
+class LocalTransport(Transport):
+    """En esta máquina; el nombre del host llega en NFS_FLEET_HOST"""
+
+    name = "local"
+
+    def command(self, host: Dict, argv: List[str]) -> List[str]:
+        return ["env", f"NFS_FLEET_HOST={host['name']}"] + argv
+
+
+class SshTransport(Transport):
+    """ssh sin interacción; la conexión maestra se reutiliza entre operaciones"""
+
+    name = "ssh"
+
+    def __init__(self, connect_timeout: int = 10, control_persist: int = 60,
+                 options: Optional[List[str]] = None):
+        self.connect_timeout = connect_timeout
+        self.control_persist = control_persist
+        self.options = options or []
+        self.control_dir = os.path.join(os.path.expanduser("~"), ".cache", "nfs-manager", "ssh")
+
+    def command(self, host: Dict, argv: List[str]) -> List[str]:
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        cmd = ["ssh", "-o", "BatchMode=yes",
+               "-o", f"ConnectTimeout={self.connect_timeout}",
+               "-o", "ControlMaster=auto",
+               "-o", f"ControlPath={os.path.join(self.control_dir, '%C')}",
+               "-o", f"ControlPersist={self.control_persist}"]
+        for option in self.options:
+            cmd += ["-o", option]
+        if host.get("port"):
+            cmd += ["-p", str(host["port"])]
+        if host.get("user"):
+            cmd += ["-l", host["user"]]
+        # ssh concatena los argumentos y los interpreta el shell remoto
+        return cmd + [host["address"], "--", " ".join(shlex.quote(a) for a in argv)]
+
+    def is_unreachable(self, res: subprocess.CompletedProcess) -> bool:
+        return res.returncode == 255
+
+
+class ContainerTransport(Transport):
+    """'docker exec' / 'podman exec' en el contenedor del host"""
+
+    def __init__(self, engine: str = "docker"):
+        self.name = engine
+
+    def command(self, host: Dict, argv: List[str]) -> List[str]:
+        return [self.name, "exec", "-i", host.get("container") or host["name"]] + argv
+
+    def is_unreachable(self, res: subprocess.CompletedProcess) -> bool:
+        # docker/podman devuelven 125 si el contenedor no existe o no corre
+        return res.returncode == 125
+
+
+TRANSPORTS: Dict[str, Callable[[], Transport]] = {
+    "ssh": SshTransport,
+    "local": LocalTransport,
+    "docker": lambda: ContainerTransport("docker"),
+    "podman": lambda: ContainerTransport("podman"),
+}
+
+
+def register_transport(name: str, factory: Callable[[], Transport]) -> None:
+    TRANSPORTS[name] = factory
+
+
+# ----------------------------------------------------------------------
+# Operaciones por host
+# ----------------------------------------------------------------------
+
+class HostSession:
+    """Un host con su transporte; añade sudo -n si el host lo pide (become)"""
+
+    def __init__(self, host: Dict, transport: Transport, timeout: float = DEFAULT_TIMEOUT):
+        self.host = host
+        self.transport = transport
+        self.timeout = timeout
+
+    @property
+    def exports_path(self) -> str:
+        return self.host.get("exports_path") or EXPORTS_PATH
+
+    @property
+    def backup_dir(self) -> str:
+        return self.host.get("backup_dir") or REMOTE_BACKUP_DIR
+
+    @property
+    def exportfs_cmd(self) -> str:
+        # Un exports_path de pruebas no es el que sirve el kernel: no se recarga
+        if self.host.get("exportfs_cmd"):
+            return self.host["exportfs_cmd"]
+        return "exportfs -ra" if self.exports_path == EXPORTS_PATH else "true"
+
+    def run(self, argv: List[str], input: Optional[str] = None,
+            privileged: bool = False, check: bool = True) -> subprocess.CompletedProcess:
+        if privileged and self.host.get("become"):
+            argv = ["sudo", "-n"] + argv
+        res = self.transport.run(self.host, argv, input=input, timeout=self.timeout)
+        if self.transport.is_unreachable(res):
+            raise UnreachableError(res.stderr.strip() or "Host inaccesible")
+        if check and res.returncode != 0:
+            raise FleetError(res.stderr.strip() or f"'{argv[0]}' devolvió {res.returncode}")
+        return res
+
+    def script(self, script: str, *args: str, input: Optional[str] = None,
+               privileged: bool = False) -> subprocess.CompletedProcess:
+        return self.run(["sh", "-c", script, "sh"] + list(args), input=input,
+                        privileged=privileged)
+
+    def read_exports(self) -> str:
+        return self.run(["cat", self.exports_path], privileged=True).stdout
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+class FleetOps:
+    """
+    Operaciones disponibles en Fleet.run. Cada una recibe la sesión del host
+    y sus parámetros; si devuelve un dict con "changed": True el host se
+    marca como 'changed'.
+    """
+
+    @staticmethod
+    def exports_list(session: HostSession) -> List[Dict]:
+        entries = ExportsManager.parse_text(session.read_exports())
+        for entry in entries:
+            entry.pop("raw", None)
+        return entries
+
+    @staticmethod
+    def exports_apply(session: HostSession, changes: List[Dict], dry_run: bool = False) -> Dict:
+        old_text = session.read_exports()
+        new_text, summary = ExportsManager.apply_changes_to_text(old_text, changes)
+        summary["changed"] = new_text != old_text and bool(
+            summary["added"] or summary["removed"] or summary["edited"])
+        if dry_run:
+            summary["content"] = new_text
+            summary["issues"] = ExportsLint.check_text(new_text)
+            summary["would_change"] = summary.pop("changed")
+        elif summary["changed"]:
+            ExportsManager.validate(new_text, base_text=old_text)
+            backup = f"exports_{_stamp()}.bak"
+            expected = hashlib.sha256(old_text.encode("utf-8")).hexdigest()
+            session.script(_APPLY_SCRIPT, expected, session.exports_path,
+                           session.backup_dir, backup, session.exportfs_cmd,
+                           input=new_text, privileged=True)
+            summary["backup"] = backup
+        return summary
+
+    @staticmethod
+    def service_status(session: HostSession) -> Dict:
+        lines = session.script(_SERVICE_STATUS_SCRIPT).stdout.splitlines() + ["", ""]
+        return {"active": lines[0] or "unknown", "enabled": lines[1] or "unknown"}
+
+    @staticmethod
+    def _service(session: HostSession, action: str) -> Dict:
+        session.run(["systemctl", action, "nfs-server"], privileged=True)
+        return dict(FleetOps.service_status(session), changed=True)
+
+    @staticmethod
+    def service_start(session: HostSession) -> Dict:
+        return FleetOps._service(session, "start")
+
+    @staticmethod
+    def service_stop(session: HostSession) -> Dict:
+        return FleetOps._service(session, "stop")
+
+    @staticmethod
+    def service_restart(session: HostSession) -> Dict:
+        return FleetOps._service(session, "restart")
+
+    @staticmethod
+    def backup_create(session: HostSession) -> Dict:
+        backup = f"exports_{_stamp()}.bak"
+        session.script(_BACKUP_SCRIPT, session.exports_path, session.backup_dir, backup,
+                       privileged=True)
+        return {"backup": os.path.join(session.backup_dir, backup), "changed": True}
+
+    @staticmethod
+    def backup_list(session: HostSession) -> List[str]:
+        res = session.run(["ls", "-1t", session.backup_dir], privileged=True, check=False)
+        return res.stdout.split() if res.returncode == 0 else []
+
+
+OPERATIONS = {
+    "exports.list": FleetOps.exports_list,
+    "exports.apply": FleetOps.exports_apply,
+    "service.status": FleetOps.service_status,
+    "service.start": FleetOps.service_start,
+    "service.stop": FleetOps.service_stop,
+    "service.restart": FleetOps.service_restart,
+    "backup.create": FleetOps.backup_create,
+    "backup.list": FleetOps.backup_list,
+}
+
+
+# ----------------------------------------------------------------------
+# Ejecución en paralelo
+# ----------------------------------------------------------------------
+
+class Fleet:
+    """
+    Ejecuta operaciones de OPERATIONS en muchos hosts a la vez:
+
+        fleet = Fleet(Inventory.load(), transport="ssh", workers=32)
+        results = fleet.run("exports.apply", changes=[...],
+                            progress=lambda event: print(event))
+        print(format_table(results))
+    """
+
+    def __init__(self, inventory: Inventory, transport: str = "ssh",
+                 workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT):
+        if transport not in TRANSPORTS:
+            raise FleetError(f"Transporte desconocido: {transport} "
+                             f"(disponibles: {', '.join(sorted(TRANSPORTS))})")
+        self.inventory = inventory
+        self.default_transport = transport
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._transports: Dict[str, Transport] = {}
+        self._lock = threading.Lock()
+
+    def _transport(self, host: Dict) -> Transport:
+        name = host.get("transport") or self.default_transport
+        with self._lock:
+            if name not in self._transports:
+                if name not in TRANSPORTS:
+                    raise FleetError(f"Transporte desconocido: {name}")
+                self._transports[name] = TRANSPORTS[name]()
+            return self._transports[name]
+
+    def _run_host(self, host: Dict, func: Callable, params: Dict) -> Dict:
+        start = time.perf_counter()
+        result = {"host": host["name"], "status": "ok", "result": None, "error": None}
+        try:
+            value = func(HostSession(host, self._transport(host), self.timeout), **params)
+            result["result"] = value
+            if isinstance(value, dict) and value.get("changed"):
+                result["status"] = "changed"
+        except UnreachableError as e:
+            result.update(status="unreachable", error=str(e))
+        except (FleetError, ExportsError, ValueError, TypeError) as e:
+            result.update(status="failed", error=str(e))
+        except Exception as e:
+            log.exception("Error inesperado en %s", host["name"])
+            result.update(status="failed", error=f"{type(e).__name__}: {e}")
+        result["duration"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def run(self, operation: str, hosts: Optional[List[str]] = None,
+            progress: Optional[Callable[[Dict], None]] = None, **params) -> List[Dict]:
+        """
+        Ejecuta operation en los hosts seleccionados (patrones de nombre o
+        grupo; todos si es None). progress recibe un evento por host al
+        empezar ("running") y al terminar ("done", con su resultado).
+        Devuelve un resultado por host en el orden del inventario.
+        """
+        func = OPERATIONS.get(operation)
+        if func is None:
+            raise FleetError(f"Operación desconocida: {operation} "
+                             f"(disponibles: {', '.join(OPERATIONS)})")
+        selected = self.inventory.select(hosts)
+        if not selected:
+            raise FleetError("Ningún host del inventario coincide con la selección")
+
+        total = len(selected)
+        done = [0]
+        lock = threading.Lock()
+
+        def task(host):
+            if progress:
+                progress({"host": host["name"], "state": "running", "done": done[0], "total": total})
+            result = self._run_host(host, func, params)
+            with lock:
+                done[0] += 1
+                event = dict(result, state="done", done=done[0], total=total)
+            if progress:
+                progress(event)
+            return result
+
+        log.info("Operación en la flota", extra={
+            "operation": operation, "hosts": total, "workers": min(self.workers, total)})
+        results: Dict[str, Dict] = {}
+        with ThreadPoolExecutor(max_workers=min(self.workers, total),
+                                thread_name_prefix="fleet") as pool:
+            futures = {pool.submit(task, host): host for host in selected}
+            for future in as_completed(futures):
+                results[futures[future]["name"]] = future.result()
+        return [results[h["name"]] for h in selected]
+
+
+def summarize(results: List[Dict]) -> Dict[str, int]:
+    counts = {"ok": 0, "changed": 0, "failed": 0, "unreachable": 0}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return counts
+
+
+def _detail(result: Dict) -> str:
+    if result["error"]:
+        return result["error"].splitlines()[0]
+    value = result["result"]
+    if isinstance(value, dict):
+        if "added" in value:
+            return (f"+{len(value['added'])} -{len(value['removed'])} "
+                    f"~{len(value['edited'])}" + (f" backup {value['backup']}" if value.get("backup") else ""))
+        return " ".join(f"{k}={v}" for k, v in value.items() if k != "changed")
+    if isinstance(value, list):
+        return f"{len(value)} elementos"
+    return "" if value is None else str(value)
+
+
+def format_table(results: List[Dict]) -> str:
+    """Tabla de texto con una fila por host y un resumen final"""
+    rows = [("HOST", "ESTADO", "TIEMPO", "DETALLE")]
+    rows += [(r["host"], r["status"], f"{r['duration']:.2f}s", _detail(r)) for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(3)]
+    lines = ["  ".join(row[i].ljust(widths[i]) for i in range(3)) + "  " + row[3] for row in rows]
+    counts = summarize(results)
+    lines.append("")
+    lines.append(", ".join(f"{k}={v}" for k, v in counts.items()) +
+                 f"; total {len(results)} hosts")
+    return "\n".join(lines)
@@ -0,0 +1,285 @@
+"""
+FstabTable
+----------
+Modelo estructurado de /etc/fstab.
+
+Conserva comentarios, líneas vacías y el formato original de cada línea,
+indexa las entradas por punto de montaje y por origen, y permite acumular
+muchas altas, bajas y cambios de opciones que se confirman con un único
+backup y una única escritura atómica.
+"""
+
+import os
+import re
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+from util.instrumentation import Instrumentation
+
+FSTAB_PATH = "/etc/fstab"
+BACKUP_SUFFIX = ".bak"
+
+# Guion que ejecuta la confirmación en una sola llamada privilegiada:
+# backup + copia a un temporal en el mismo directorio + rename atómico.
+_COMMIT_SCRIPT = (
+    'set -e\n'
+    'if [ "$3" = "1" ]; then cp -p "$1" "$1.bak"; fi\n'
+    'cp "$2" "$1.nfsmgr.tmp"\n'
+    'chmod 644 "$1.nfsmgr.tmp"\n'
+    'mv -f "$1.nfsmgr.tmp" "$1"\n'
+)
+
+
+class FstabError(Exception):
+    pass
+
+
+class FstabEntry:
+    """Una línea de montaje de fstab (los seis campos clásicos)."""
+
+    __slots__ = ("source", "mount_point", "fstype", "options", "dump", "passno")
+
+    def __init__(self, source: str, mount_point: str, fstype: str = "nfs",
+                 options: str = "defaults", dump: str = "0", passno: str = "0"):
+        self.source = source
+        self.mount_point = mount_point
+        self.fstype = fstype
+        self.options = options or "defaults"
+        self.dump = str(dump)
+        self.passno = str(passno)
+
+    @property
+    def fields(self) -> List[str]:
+        return [self.source, self.mount_point, self.fstype,
+                self.options, self.dump, self.passno]
+
+    def option_list(self) -> List[str]:
+        return [o for o in self.options.split(",") if o]
+
+    def to_dict(self) -> Dict:
+        return {
+            "source": self.source,
+            "mount_point": self.mount_point,
+            "type": self.fstype,
+            "options": self.options,
+            "dump": self.dump,
+            "passno": self.passno,
+        }
+
+
+class FstabTable:
+    """
+    Tabla de fstab en memoria.
+
+    Cada línea se guarda tal cual; las líneas de montaje llevan además su
+    FstabEntry. Las eliminaciones dejan un hueco (None) para que los índices
+    por número de línea no cambien mientras se acumulan cambios.
+    """
+
+    def __init__(self, text: str = "", path: str = FSTAB_PATH,
+                 run_privileged: Optional[Callable] = None):
+        self.path = path
+        self._run_privileged = run_privileged
+        self._lines: List[Optional[str]] = []
+        self._entries: Dict[int, FstabEntry] = {}
+        self._by_mount_point: Dict[str, int] = {}
+        self._by_source: Dict[str, List[int]] = {}
+        self._dirty = False
+        self._trailing_newline = text.endswith("\n") or not text
+
+        for line in text.splitlines():
+            self._append_line(line)
+
+    # ------------------------------------------------------------------
+    # Carga y parseo
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def parse_line(line: str) -> Optional[FstabEntry]:
+        """Devuelve la entrada de una línea o None si es comentario/vacía."""
+        s = line.strip()
+        if not s or s.startswith("#"):
+            return None
+        parts = s.split()
+        if len(parts) < 2:
+            return None
+        parts += ["auto", "defaults", "0", "0"][len(parts) - 2:]
+        return FstabEntry(*parts[:6])
+
+    @classmethod
+    def load(cls, path: str = FSTAB_PATH,
+             run_privileged: Optional[Callable] = None) -> "FstabTable":
+        """
+        Lee fstab del disco. Si no hay permisos de lectura usa el ejecutor
+        privilegiado (pkexec/sudo cat) que se pase.
+        """
+        try:
+            with Instrumentation.timed("file", "read", path) as t, \
+                    open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+                t.bytes = len(content)
+        except PermissionError:
+            if run_privileged is None:
+                raise FstabError(f"No se pudo leer {path}: permiso denegado")
+            res = run_privileged(["cat", path])
+            if res.returncode != 0:
+                raise FstabError(f"No se pudo leer {path}: {res.stderr.strip()}")
+            content = res.stdout
+        return cls(content, path=path, run_privileged=run_privileged)
+
+    def _append_line(self, line: str) -> int:
+        idx = len(self._lines)
+        self._lines.append(line)
+        entry = self.parse_line(line)
+        if entry is not None:
+            self._index(idx, entry)
+        return idx
+
+    def _index(self, idx: int, entry: FstabEntry) -> None:
+        self._entries[idx] = entry
+        self._by_mount_point[entry.mount_point] = idx
+        self._by_source.setdefault(entry.source, []).append(idx)
+
+    def _unindex(self, idx: int) -> FstabEntry:
+        entry = self._entries.pop(idx)
+        if self._by_mount_point.get(entry.mount_point) == idx:
+            del self._by_mount_point[entry.mount_point]
+        same_source = self._by_source.get(entry.source, [])
+        if idx in same_source:
+            same_source.remove(idx)
+        if not same_source:
+            self._by_source.pop(entry.source, None)
+        return entry
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def entries(self) -> List[FstabEntry]:
+        return [self._entries[i] for i in sorted(self._entries)]
+
+    def nfs_entries(self) -> List[FstabEntry]:
+        return [e for e in self.entries() if e.fstype.startswith("nfs")]
+
+    def get(self, mount_point: str) -> Optional[FstabEntry]:
+        idx = self._by_mount_point.get(mount_point)
+        return self._entries[idx] if idx is not None else None
+
+    def find_by_source(self, source: str) -> List[FstabEntry]:
+        return [self._entries[i] for i in self._by_source.get(source, [])]
+
+    def __contains__(self, mount_point: str) -> bool:
+        return mount_point in self._by_mount_point
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Cambios acumulados
+    # ------------------------------------------------------------------
+
+    def add(self, source: str, mount_point: str, fstype: str = "nfs",
+            options: str = "defaults", dump: str = "0", passno: str = "0") -> FstabEntry:
+        """Añade una entrada al final. Falla si el punto de montaje ya existe."""
+        if mount_point in self._by_mount_point:
+            raise FstabError(f"Ya existe una entrada en fstab para {mount_point}")
+        entry = FstabEntry(source, mount_point, fstype, options, dump, passno)
+        idx = len(self._lines)
+        self._lines.append("\t".join(entry.fields))
+        self._index(idx, entry)
+        self._dirty = True
+        return entry
+
+    def remove(self, mount_point: str) -> FstabEntry:
+        """Elimina la entrada del punto de montaje indicado."""
+        idx = self._by_mount_point.get(mount_point)
+        if idx is None:
+            raise FstabError(f"No se encontró entrada en fstab para {mount_point}")
+        entry = self._unindex(idx)
+        self._lines[idx] = None
+        self._dirty = True
+        return entry
+
+    def set_options(self, mount_point: str, options: str) -> FstabEntry:
+        """Reemplaza las opciones de una entrada conservando el formato de la línea."""
+        idx = self._by_mount_point.get(mount_point)
+        if idx is None:
+            raise FstabError(f"No se encontró entrada en fstab para {mount_point}")
+        entry = self._entries[idx]
+        options = options or "defaults"
+        if entry.options == options:
+            return entry
+        entry.options = options
+        self._lines[idx] = self._rewrite_field(self._lines[idx], 3, options, entry)
+        self._dirty = True
+        return entry
+
+    def update_options(self, mount_point: str, add: Optional[List[str]] = None,
+                       remove: Optional[List[str]] = None) -> FstabEntry:
+        """
+        Añade o quita opciones sueltas. Las opciones con valor (timeo=10) se
+        reemplazan por clave.
+        """
+        entry = self.get(mount_point)
+        if entry is None:
+            raise FstabError(f"No se encontró entrada en fstab para {mount_point}")
+        drop = {o.split("=", 1)[0] for o in (remove or [])}
+        drop |= {o.split("=", 1)[0] for o in (add or [])}
+        opts = [o for o in entry.option_list() if o.split("=", 1)[0] not in drop]
+        opts += [o for o in (add or []) if o]
+        if len(opts) > 1 and "defaults" in opts:
+            opts.remove("defaults")
+        return self.set_options(mount_point, ",".join(opts))
+
+    @staticmethod
+    def _rewrite_field(line: str, field: int, value: str, entry: FstabEntry) -> str:
+        """Sustituye un campo respetando los separadores originales."""
+        tokens = re.split(r"(\s+)", line)
+        # tokens alterna campo/separador; si la línea empieza con espacios
+        # el primer token es "" seguido de la indentación
+        start = 2 if tokens and tokens[0] == "" else 0
+        pos = start + field * 2
+        if pos < len(tokens) and tokens[pos].strip():
+            tokens[pos] = value
+            return "".join(tokens)
+        return "\t".join(entry.fields)
+
+    # ------------------------------------------------------------------
+    # Serialización y confirmación
+    # ------------------------------------------------------------------
+
+    def render(self) -> str:
+        text = "\n".join(l for l in self._lines if l is not None)
+        if self._trailing_newline or self._dirty:
+            text += "\n"
+        return text
+
+    def commit(self, backup: bool = True) -> bool:
+        """
+        Escribe todos los cambios acumulados con un único backup (fstab.bak)
+        y un único rename atómico. Devuelve False si no había cambios.
+        """
+        if not self._dirty:
+            return False
+        if self._run_privileged is None:
+            raise FstabError("No hay ejecutor privilegiado para escribir fstab")
+
+        fd, tmp_path = tempfile.mkstemp(prefix="fstab_tmp_", text=True)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            res = self._run_privileged(["sh", "-c", _COMMIT_SCRIPT, "sh",
+                                        self.path, tmp_path, "1" if backup else "0"])
+            if res.returncode != 0:
+                raise FstabError(f"No se pudo actualizar fstab: {res.stderr.strip()}")
+        finally:
+            try: os.remove(tmp_path)
+            except Exception: pass
+
+        self._dirty = False
+        self._trailing_newline = True
+        return True
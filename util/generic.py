@@ -1,11 +1,69 @@
-from PIL import ImageTk, Image
+import hashlib
+import io
+import os
+import tkinter as tk
+
+# Raíz de la aplicación: el directorio del proyecto o el propio .pyz
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Copias ya escaladas de las imágenes: en un arranque normal no hace falta
+# importar PIL ni decodificar y redimensionar el original
+IMAGE_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "nfs-manager", "images")
+
+def ruta_recurso(path):
+    """Ruta de un recurso de la aplicación (relativa a APP_ROOT)"""
+    return path if os.path.isabs(path) else os.path.join(APP_ROOT, path)
+
+def leer_recurso(path):
+    """
+    Bytes de un recurso, tanto si la aplicación se ejecuta desde el árbol de
+    fuentes como desde el zipapp (se lee del propio archivo)
+    """
+    full = ruta_recurso(path)
+    if os.path.isfile(full):
+        with open(full, "rb") as f:
+            return f.read()
+    loader = globals().get("__loader__")
+    if loader is not None and hasattr(loader, "get_data"):
+        return loader.get_data(full)
+    raise FileNotFoundError(full)
+
+def _cache_path(path, size):
+    """Ruta en caché de path escalada a size; cambia si cambia el original"""
+    full = ruta_recurso(path)
+    # Dentro del zipapp la fecha y el tamaño que cuentan son los del .pyz
+    st = os.stat(full if os.path.isfile(full) else APP_ROOT)
+    key = f"{full}|{st.st_mtime_ns}|{st.st_size}|{size[0]}x{size[1]}"
+    return os.path.join(IMAGE_CACHE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
 
 def leer_imagen(path,size):
-    return ImageTk.PhotoImage(Image.open(path).resize(size))        
+    try:
+        cached = _cache_path(path, size)
+    except OSError:
+        cached = None
+    if cached and os.path.exists(cached):
+        try:
+            return tk.PhotoImage(file=cached)
+        except tk.TclError:
+            pass  # caché dañada: se regenera
+
+    from PIL import ImageTk, Image
+    image = Image.open(io.BytesIO(leer_recurso(path))).resize(size)
+    if cached:
+        try:
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            tmp = f"{cached}.{os.getpid()}.tmp"
+            image.save(tmp, "PNG")
+            os.replace(tmp, cached)
+        except OSError:
+            pass
+    return ImageTk.PhotoImage(image)
 
 def centrar_ventana(ventana, ancho, alto):
     ancho_pantalla = ventana.winfo_screenwidth()
     alto_pantalla = ventana.winfo_screenheight()
     x = (ancho_pantalla // 2) - (ancho // 2)
     y = (alto_pantalla // 2) - (alto // 2)
-    ventana.geometry(f"{ancho}x{alto}+{x}+{y}")
\ No newline at end of file
+    ventana.geometry(f"{ancho}x{alto}+{x}+{y}")
@@ -0,0 +1,257 @@
+"""
+Instrumentation
+---------------
+Medición de las operaciones costosas de util/: comandos externos (pkexec,
+sudo, exportfs, mount, tar...) y lecturas/escrituras de archivos.
+
+Por cada operación se guarda tipo, duración, código de salida y bytes, y se
+mantiene en memoria un histograma de latencias por operación. Está
+desactivada por defecto: en ese caso run() llama directamente a
+subprocess.run y timed() devuelve un contexto vacío compartido, así que el
+coste es una comprobación de un booleano.
+
+Se activa con NFS_MANAGER_TRACE=1 (o Instrumentation.enable()). Si además
+se define NFS_MANAGER_TRACE_FILE, al salir se vuelca todo en ese JSON.
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+# Límites superiores (ms) de las cubetas del histograma; la última es abierta
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+RECENT_EVENTS = 500
+
+# Prefijos de elevación que no dicen nada de la operación en sí
+_WRAPPERS = ("pkexec", "sudo", "env")
+
+
+class _Timer:
+    """Contexto que mide una operación; el llamador puede rellenar bytes/returncode"""
+
+    __slots__ = ("kind", "op", "target", "bytes", "returncode", "_start")
+
+    def __init__(self, kind: str, op: str, target: str = ""):
+        self.kind = kind
+        self.op = op
+        self.target = target
+        self.bytes = 0
+        self.returncode = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        error = exc_type.__name__ if exc_type else None
+        Instrumentation.record(self.kind, self.op, time.perf_counter() - self._start,
+                               self.returncode, self.bytes, self.target, error)
+        return False
+
+
+class _NullTimer:
+    """Contexto sin coste para cuando la instrumentación está desactivada"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """Registro global de tiempos de comandos externos y E/S de archivos"""
+
+    enabled = os.environ.get("NFS_MANAGER_TRACE", "") not in ("", "0")
+
+    _lock = threading.Lock()
+    _stats: Dict[str, Dict] = {}
+    _events = deque(maxlen=RECENT_EVENTS)
+    _started = time.time()
+
+    @staticmethod
+    def enable() -> None:
+        Instrumentation.enabled = True
+
+    @staticmethod
+    def disable() -> None:
+        Instrumentation.enabled = False
+
+    @staticmethod
+    def reset() -> None:
+        with Instrumentation._lock:
+            Instrumentation._stats.clear()
+            Instrumentation._events.clear()
+            Instrumentation._started = time.time()
+
+    @staticmethod
+    def command_name(cmd: List[str]) -> str:
+        """
+        Nombre de la operación de un comando: el programa real tras
+        pkexec/sudo; para 'sh -c' se añade la función que lo lanzó.
+        """
+        args = [str(a) for a in cmd]
+        while args and os.path.basename(args[0]) in _WRAPPERS:
+            args = args[1:]
+        if not args:
+            return "?"
+        name = os.path.basename(args[0])
+        if name == "sh" and len(args) > 1 and args[1] == "-c":
+            return "sh:" + Instrumentation._caller()
+        if name.startswith("python") and len(args) > 1 and args[1] == "-c":
+            return "python:" + Instrumentation._caller()
+        return name
+
+    @staticmethod
+    def _caller() -> str:
+        """Primera función fuera de este módulo y de los envoltorios _run_*"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            name = frame.f_code.co_name
+            if frame.f_code.co_filename != __file__ and not name.startswith("_run"):
+                return name
+            frame = frame.f_back
+        return "?"
+
+    @staticmethod
+    def record(kind: str, op: str, duration: float, returncode: Optional[int] = None,
+               nbytes: int = 0, target: str = "", error: Optional[str] = None) -> None:
+        """Añade una medición (duración en segundos)"""
+        key = f"{kind}:{op}"
+        ms = duration * 1000.0
+        failed = error is not None or (returncode is not None and returncode != 0)
+        with Instrumentation._lock:
+            stat = Instrumentation._stats.get(key)
+            if stat is None:
+                stat = Instrumentation._stats[key] = {
+                    "kind": kind, "op": op, "count": 0, "errors": 0, "bytes": 0,
+                    "total_ms": 0.0, "min_ms": None, "max_ms": 0.0,
+                    "buckets": [0] * (len(BUCKETS_MS) + 1),
+                }
+            stat["count"] += 1
+            stat["errors"] += failed
+            stat["bytes"] += nbytes or 0
+            stat["total_ms"] += ms
+            stat["min_ms"] = ms if stat["min_ms"] is None else min(stat["min_ms"], ms)
+            stat["max_ms"] = max(stat["max_ms"], ms)
+            for i, bound in enumerate(BUCKETS_MS):
+                if ms <= bound:
+                    stat["buckets"][i] += 1
+                    break
+            else:
+                stat["buckets"][-1] += 1
+            Instrumentation._events.append({
+                "time": time.time(), "kind": kind, "op": op, "target": target,
+                "ms": round(ms, 3), "returncode": returncode, "bytes": nbytes,
+                "error": error,
+            })
+
+    @staticmethod
+    def timed(kind: str, op: str, target: str = ""):
+        """
+        Contexto que mide un bloque:
+
+            with Instrumentation.timed("file", "read", path) as t:
+                data = f.read()
+                t.bytes = len(data)
+        """
+        if not Instrumentation.enabled:
+            return _NULL_TIMER
+        return _Timer(kind, op, target)
+
+    @staticmethod
+    def run(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run con medición (mismos argumentos y resultado)"""
+        if not Instrumentation.enabled:
+            return subprocess.run(cmd, **kwargs)
+
+        op = Instrumentation.command_name(cmd)
+        kind = "privileged" if cmd and os.path.basename(str(cmd[0])) in _WRAPPERS else "command"
+        start = time.perf_counter()
+        try:
+            res = subprocess.run(cmd, **kwargs)
+        except Exception as e:
+            Instrumentation.record(kind, op, time.perf_counter() - start, None, 0,
+                                   " ".join(map(str, cmd[:4])), type(e).__name__)
+            raise
+        nbytes = len(kwargs.get("input") or "")
+        for stream in (res.stdout, res.stderr):
+            if stream:
+                nbytes += len(stream)
+        Instrumentation.record(kind, op, time.perf_counter() - start, res.returncode,
+                               nbytes, " ".join(map(str, cmd[:4])))
+        return res
+
+    @staticmethod
+    def percentile(stat: Dict, fraction: float) -> float:
+        """Percentil aproximado (límite superior de su cubeta, en ms)"""
+        if not stat["count"]:
+            return 0.0
+        target = fraction * stat["count"]
+        seen = 0
+        for i, n in enumerate(stat["buckets"]):
+            seen += n
+            if seen >= target:
+                return min(BUCKETS_MS[i] if i < len(BUCKETS_MS) else stat["max_ms"],
+                           stat["max_ms"])
+        return stat["max_ms"]
+
+    @staticmethod
+    def summary() -> List[Dict]:
+        """Estadísticas por operación, de más a menos tiempo total"""
+        with Instrumentation._lock:
+            stats = [dict(s, buckets=list(s["buckets"])) for s in Instrumentation._stats.values()]
+        for s in stats:
+            s["avg_ms"] = s["total_ms"] / s["count"] if s["count"] else 0.0
+            s["p50_ms"] = Instrumentation.percentile(s, 0.50)
+            s["p95_ms"] = Instrumentation.percentile(s, 0.95)
+        stats.sort(key=lambda s: s["total_ms"], reverse=True)
+        return stats
+
+    @staticmethod
+    def recent(limit: int = RECENT_EVENTS) -> List[Dict]:
+        with Instrumentation._lock:
+            return list(Instrumentation._events)[-limit:]
+
+    @staticmethod
+    def to_dict() -> Dict:
+        return {
+            "enabled": Instrumentation.enabled,
+            "since": Instrumentation._started,
+            "buckets_ms": BUCKETS_MS,
+            "operations": Instrumentation.summary(),
+            "recent": Instrumentation.recent(),
+        }
+
+    @staticmethod
+    def dump(path: str) -> str:
+        """Guarda todas las mediciones en un archivo JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(Instrumentation.to_dict(), f, indent=2)
+        return path
+
+
+def _dump_at_exit():
+    path = os.environ.get("NFS_MANAGER_TRACE_FILE")
+    if path and Instrumentation.enabled:
+        try:
+            Instrumentation.dump(path)
+        except OSError:
+            pass
+
+
+atexit.register(_dump_at_exit)
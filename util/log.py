@@ -0,0 +1,180 @@
+"""
+Log
+---
+Logging estructurado y asíncrono para toda la aplicación.
+
+Los módulos obtienen su logger con get_logger(__name__). Los registros se
+entregan a una cola sin límite (put nunca bloquea) y un hilo en segundo plano
+(QueueListener) los escribe como JSON-lines en un archivo rotativo, así que
+ni las operaciones privilegiadas ni el bucle de Tk esperan nunca a disco o
+a la terminal.
+
+Configuración por variables de entorno:
+    NFS_MANAGER_LOG_LEVEL    nivel global y por módulo, p. ej.
+                             "INFO,util.mount_manager=DEBUG,forms=WARNING"
+    NFS_MANAGER_LOG_DIR      directorio de los logs
+                             (por defecto ~/.local/state/nfs-manager)
+    NFS_MANAGER_LOG_CONSOLE  "1" para copiar también a stderr (desde el hilo
+                             de escritura, nunca desde el llamador)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+ROOT_LOGGER = "nfs_manager"
+LOG_FILE = "nfs-manager.jsonl"
+MAX_BYTES = 2 * 1024 * 1024
+BACKUP_COUNT = 5
+DEFAULT_LEVEL = "INFO"
+
+# Atributos estándar de LogRecord; el resto son campos estructurados (extra=)
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con los campos pasados en extra="""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name[len(ROOT_LOGGER) + 1:] or record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Formato corto '[NIVEL] módulo: mensaje' para la consola"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = f"[{record.levelname}] {record.name[len(ROOT_LOGGER) + 1:]}: {record.getMessage()}"
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        return text
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Igual que QueueHandler pero conserva los campos estructurados y formatea
+    la excepción en el hilo llamador (el traceback no se puede encolar)
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    "INFO,util.mount_manager=DEBUG" -> {"": 20, "util.mount_manager": 10}
+    La clave "" es el nivel global.
+    """
+    levels = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, level = part.rpartition("=")
+        value = logging.getLevelName(level.strip().upper())
+        if isinstance(value, int):
+            levels[name.strip()] = value
+    return levels
+
+
+def default_log_dir() -> str:
+    state = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state, "nfs-manager")
+
+
+def setup(level_spec: Optional[str] = None, log_dir: Optional[str] = None,
+          console: Optional[bool] = None) -> None:
+    """
+    Configura los handlers y arranca el hilo escritor. Se llama sola la
+    primera vez que se usa get_logger; llamarla otra vez reconfigura.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        if level_spec is None:
+            level_spec = os.environ.get("NFS_MANAGER_LOG_LEVEL", DEFAULT_LEVEL)
+        if log_dir is None:
+            log_dir = os.environ.get("NFS_MANAGER_LOG_DIR") or default_log_dir()
+        if console is None:
+            console = os.environ.get("NFS_MANAGER_LOG_CONSOLE", "") not in ("", "0")
+
+        handlers = []
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, LOG_FILE), maxBytes=MAX_BYTES,
+                backupCount=BACKUP_COUNT, encoding="utf-8", delay=True)
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError:
+            # Sin directorio escribible los mensajes van a la consola
+            console = True
+        if console:
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(ConsoleFormatter())
+            handlers.append(stream_handler)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        log_queue = queue.SimpleQueue()
+        root.addHandler(_QueueHandler(log_queue))
+        root.propagate = False
+
+        levels = parse_levels(level_spec)
+        root.setLevel(levels.pop("", logging.getLevelName(DEFAULT_LEVEL)))
+        for name, level in levels.items():
+            logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers,
+                                                   respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown() -> None:
+    """Vacía la cola y detiene el hilo escritor"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger de un módulo (usar get_logger(__name__))"""
+    if _listener is None:
+        setup()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+atexit.register(shutdown)
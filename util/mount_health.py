@@ -0,0 +1,209 @@
+"""
+MountHealth
+-----------
+Detección de montajes NFS colgados sin arriesgar el proceso principal.
+
+Sobre un montaje 'hard' con el servidor caído, cualquier stat() bloquea de
+forma no interrumpible. Por eso cada sonda corre en un proceso aparte
+('stat -f' sobre el punto de montaje) con un límite de tiempo estricto: si
+no responde a tiempo se mata y el montaje se clasifica como 'stale', sin que
+la GUI llegue a tocarlo nunca. Todas las sondas se lanzan en paralelo.
+"""
+
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from util.instrumentation import Instrumentation
+
+HEALTHY = "healthy"
+SLOW = "slow"
+STALE = "stale"
+UNKNOWN = "unknown"
+
+DEFAULT_TIMEOUT = 3.0
+DEFAULT_SLOW_THRESHOLD = 0.5
+CACHE_TTL = 30.0
+
+NFS_TYPES = ("nfs", "nfs4")
+
+
+class MountHealthError(Exception):
+    pass
+
+
+class MountHealth:
+    """Sondea y cachea el estado de los montajes NFS"""
+
+    _cache: Dict[str, Dict] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _unescape(field: str) -> str:
+        """Decodifica los escapes octales de /proc/mounts (\\040 = espacio)."""
+        if "\\" not in field:
+            return field
+        return field.encode("utf-8").decode("unicode_escape").encode("latin-1").decode("utf-8")
+
+    @staticmethod
+    def nfs_mount_points() -> List[str]:
+        """
+        Puntos de montaje NFS leídos de /proc/self/mounts. Leer este archivo
+        nunca toca el servidor, así que es seguro aunque haya montajes colgados.
+        """
+        points = []
+        try:
+            with open("/proc/self/mounts", "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 3 and parts[2] in NFS_TYPES:
+                        points.append(MountHealth._unescape(parts[1]))
+        except OSError:
+            pass
+        return points
+
+    @staticmethod
+    def _reap(proc: subprocess.Popen) -> None:
+        """Recoge un proceso matado en segundo plano para no dejar zombis."""
+        threading.Thread(target=proc.wait, daemon=True).start()
+
+    @staticmethod
+    def probe(mount_points: Iterable[str], timeout: float = DEFAULT_TIMEOUT,
+              slow_threshold: float = DEFAULT_SLOW_THRESHOLD) -> Dict[str, Dict]:
+        """
+        Sondea varios montajes en paralelo, cada uno en su propio proceso
+
+        Returns:
+            {punto_de_montaje: {"status", "latency", "error", "checked_at"}}
+        """
+        procs = {}
+        results = {}
+        for mp in dict.fromkeys(mount_points):
+            try:
+                procs[mp] = (time.monotonic(), subprocess.Popen(
+                    ["stat", "-f", "-c", "%T", mp],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True))
+            except OSError as e:
+                results[mp] = {"status": UNKNOWN, "latency": None, "error": str(e)}
+
+        deadline = time.monotonic() + timeout
+        pending = dict(procs)
+        while pending:
+            for mp, (started, proc) in list(pending.items()):
+                if proc.poll() is None:
+                    continue
+                latency = time.monotonic() - started
+                if proc.returncode == 0:
+                    status = SLOW if latency >= slow_threshold else HEALTHY
+                    error = ""
+                else:
+                    # ESTALE y similares devuelven error inmediatamente
+                    status = STALE
+                    error = proc.stderr.read().strip()
+                proc.stderr.close()
+                results[mp] = {"status": status, "latency": latency, "error": error}
+                del pending[mp]
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+
+        for mp, (started, proc) in pending.items():
+            proc.kill()
+            MountHealth._reap(proc)
+            results[mp] = {"status": STALE, "latency": None,
+                           "error": f"Sin respuesta en {timeout:.1f}s"}
+
+        if Instrumentation.enabled:
+            for mp, info in results.items():
+                Instrumentation.record("probe", "stat -f", info["latency"] or timeout,
+                                       0 if info["status"] in (HEALTHY, SLOW) else 1,
+                                       target=mp)
+
+        now = time.time()
+        with MountHealth._lock:
+            for mp, info in results.items():
+                info["checked_at"] = now
+                MountHealth._cache[mp] = info
+        return results
+
+    @staticmethod
+    def probe_all(timeout: float = DEFAULT_TIMEOUT,
+                  slow_threshold: float = DEFAULT_SLOW_THRESHOLD) -> Dict[str, Dict]:
+        """Sondea todos los montajes NFS del sistema"""
+        return MountHealth.probe(MountHealth.nfs_mount_points(), timeout, slow_threshold)
+
+    @staticmethod
+    def cached(mount_point: str, max_age: float = CACHE_TTL) -> Optional[Dict]:
+        """Último resultado conocido si no es más antiguo que max_age"""
+        with MountHealth._lock:
+            info = MountHealth._cache.get(mount_point)
+        if info and time.time() - info["checked_at"] <= max_age:
+            return info
+        return None
+
+    @staticmethod
+    def status(mount_point: str, max_age: float = CACHE_TTL,
+               timeout: float = DEFAULT_TIMEOUT) -> str:
+        """Estado de un montaje, usando la caché o sondeándolo si hace falta"""
+        info = MountHealth.cached(mount_point, max_age)
+        if info is None:
+            info = MountHealth.probe([mount_point], timeout)[mount_point]
+        return info["status"]
+
+    @staticmethod
+    def covering_mount(path: str) -> Optional[str]:
+        """Montaje NFS más específico que contiene path (o None)"""
+        path = os.path.abspath(path)
+        best = None
+        for mp in MountHealth.nfs_mount_points():
+            if path == mp or path.startswith(mp.rstrip("/") + "/"):
+                if best is None or len(mp) > len(best):
+                    best = mp
+        return best
+
+    @staticmethod
+    def guard(path: str, max_age: float = CACHE_TTL,
+              timeout: float = DEFAULT_TIMEOUT) -> None:
+        """
+        Comprobar antes de tocar path: lanza MountHealthError si está dentro de
+        un montaje NFS colgado. Si no hay NFS de por medio no cuesta nada.
+        """
+        mp = MountHealth.covering_mount(path)
+        if mp is None:
+            return
+        if MountHealth.status(mp, max_age, timeout) == STALE:
+            raise MountHealthError(
+                f"El montaje NFS {mp} no responde (stale); "
+                f"no se accederá a {path} para no bloquear la aplicación")
+
+    @staticmethod
+    def safe_exists(path: str, max_age: float = CACHE_TTL,
+                    timeout: float = DEFAULT_TIMEOUT) -> bool:
+        """
+        os.path.exists que nunca se cuelga: fuera de NFS es la llamada normal;
+        dentro de un montaje NFS la comprobación se hace en un proceso aparte
+        con límite de tiempo
+        """
+        mp = MountHealth.covering_mount(path)
+        if mp is None:
+            return os.path.exists(path)
+        MountHealth.guard(path, max_age, timeout)
+
+        proc = subprocess.Popen(["test", "-e", path], stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            return proc.wait(timeout=timeout) == 0
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            MountHealth._reap(proc)
+            with MountHealth._lock:
+                MountHealth._cache[mp] = {"status": STALE, "latency": None,
+                                          "error": f"Sin respuesta en {timeout:.1f}s",
+                                          "checked_at": time.time()}
+            raise MountHealthError(
+                f"El montaje NFS {mp} no responde; no se pudo comprobar {path}")
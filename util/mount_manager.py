@@ -9,6 +9,79 @@ import subprocess
 import shutil
 from typing import List, Dict, Optional
 
+from util.fstab_table import FstabTable, FstabError, FSTAB_PATH
+from util import mount_users
+from util.mount_health import MountHealth, MountHealthError
+from util.systemd_units import AutomountUnit, UNIT_DIR, MANAGED_MARKER, unit_names
+from util.instrumentation import Instrumentation
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+# Instala las unidades generadas, recarga systemd y activa los .automount,
+# todo en una única llamada privilegiada. Tras el directorio destino van pares
+# "punto_de_montaje unidad.automount", "--" y los ficheros de unidad: systemd
+# no arranca un .automount sobre un punto ya montado, así que antes se
+# desmontan (salvo los que ya gestiona un .automount activo), guardando cómo
+# estaban montados. Si algo falla se deshace todo: se recuperan los ficheros
+# de unidad sobrescritos, se borran los nuevos, se desactivan solo las
+# unidades que activó esta ejecución y se vuelve a montar lo desmontado.
+_INSTALL_UNITS_SCRIPT = (
+    'set -e\n'
+    'src="$1"; dst="$2"; shift 2\n'
+    'bak=$(mktemp -d)\n'
+    'autos=""; newly=""; installed=""; n=0\n'
+    'rollback() {\n'
+    '  set +e\n'
+    '  if [ -n "$newly" ]; then systemctl disable --now $newly 2>/dev/null; fi\n'
+    '  for f in $installed; do\n'
+    '    if [ -e "$bak/$f" ]; then cp -p "$bak/$f" "$dst/$f"; else rm -f "$dst/$f"; fi\n'
+    '  done\n'
+    '  systemctl daemon-reload\n'
+    '  i=1\n'
+    '  while [ $i -le $n ]; do\n'
+    '    IFS= read -r point < "$bak/point.$i"\n'
+    '    read -r source fstype options < "$bak/mount.$i"\n'
+    '    mount -t "$fstype" -o "$options" "$source" "$point"\n'
+    '    i=$((i + 1))\n'
+    '  done\n'
+    '  rm -rf "$bak"\n'
+    '}\n'
+    'trap rollback EXIT\n'
+    'while [ "$1" != "--" ]; do\n'
+    '  point="$1"; unit="$2"; shift 2\n'
+    '  autos="$autos $unit"\n'
+    '  systemctl is-enabled --quiet "$unit" 2>/dev/null || newly="$newly $unit"\n'
+    '  systemctl is-active --quiet "$unit" 2>/dev/null && continue\n'
+    '  if mountpoint -q "$point"; then\n'
+    '    n=$((n + 1))\n'
+    '    findmnt -n -o SOURCE,FSTYPE,OPTIONS -M "$point" > "$bak/mount.$n"\n'
+    '    printf "%s\\n" "$point" > "$bak/point.$n"\n'
+    '    umount "$point" || { n=$((n - 1)); exit 1; }\n'
+    '  fi\n'
+    'done\n'
+    'shift\n'
+    'for f in "$@"; do\n'
+    '  if [ -e "$dst/$f" ]; then cp -p "$dst/$f" "$bak/$f"; fi\n'
+    '  installed="$installed $f"\n'
+    '  install -m 644 "$src/$f" "$dst/$f"\n'
+    'done\n'
+    'systemctl daemon-reload\n'
+    'if [ -n "$autos" ]; then systemctl enable $autos; systemctl start $autos; fi\n'
+    'trap - EXIT\n'
+    'rm -rf "$bak"\n'
+)
+
+_REMOVE_UNITS_SCRIPT = (
+    'dst="$1"; shift\n'
+    'for base in "$@"; do\n'
+    '  systemctl disable --now "$base.automount" 2>/dev/null\n'
+    '  systemctl stop "$base.mount" 2>/dev/null\n'
+    '  rm -f "$dst/$base.automount" "$dst/$base.mount"\n'
+    'done\n'
+    'systemctl daemon-reload\n'
+)
+
 class MountError(Exception):
     pass
 
@@ -18,6 +91,9 @@ class MountManager:
     @staticmethod
     def _get_privilege_command():
         """Detecta qué comando usar para privilegios"""
+        if os.geteuid() == 0:
+            # Ya somos root (p. ej. el servicio RPC): sin pkexec/sudo
+            return None
         if shutil.which("pkexec"):
             return "pkexec"
         elif shutil.which("sudo"):
@@ -29,8 +105,8 @@ class MountManager:
     def _run_privileged(cmd: List[str], timeout: int = 30) -> subprocess.CompletedProcess:
         """Ejecuta comando con privilegios"""
         priv_cmd = MountManager._get_privilege_command()
-        return subprocess.run(
-            [priv_cmd] + cmd,
+        return Instrumentation.run(
+            ([priv_cmd] if priv_cmd else []) + cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
@@ -44,7 +120,7 @@ class MountManager:
         Retorna lista de diccionarios con información de cada montaje
         """
         try:
-            result = subprocess.run(
+            result = Instrumentation.run(
                 ["mount", "-t", "nfs,nfs4"],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -83,6 +159,21 @@ class MountManager:
         except Exception as e:
             raise MountError(f"Error obteniendo montajes NFS: {e}")
 
+    @staticmethod
+    def check_health(mounts: Optional[List[Dict]] = None, timeout: float = 3.0) -> List[Dict]:
+        """
+        Sondea en paralelo los montajes NFS (por defecto los de get_mounted_nfs)
+        y añade a cada uno "health" (healthy/slow/stale) y "latency"
+        """
+        if mounts is None:
+            mounts = MountManager.get_mounted_nfs()
+        results = MountHealth.probe([m["mount_point"] for m in mounts], timeout=timeout)
+        for m in mounts:
+            info = results.get(m["mount_point"], {})
+            m["health"] = info.get("status", "unknown")
+            m["latency"] = info.get("latency")
+        return mounts
+
     @staticmethod
     def mount_nfs(server: str, remote_path: str, mount_point: str, options: str = "") -> bool:
         """
@@ -98,17 +189,22 @@ class MountManager:
             True si se montó exitosamente
         """
         try:
-            print(f"[INFO] Iniciando montaje de {server}:{remote_path} en {mount_point}")
+            log.info("Iniciando montaje de %s:%s en %s", server, remote_path, mount_point)
 
             # Verificar que el punto de montaje existe, si no, crearlo
-            if not os.path.exists(mount_point):
-                print(f"[INFO] Creando punto de montaje: {mount_point}")
+            # (sin colgarse si cae dentro de otro montaje NFS que no responde)
+            try:
+                exists = MountHealth.safe_exists(mount_point)
+            except MountHealthError as e:
+                raise MountError(str(e))
+            if not exists:
+                log.info("Creando punto de montaje: %s", mount_point)
                 res = MountManager._run_privileged(["mkdir", "-p", mount_point])
                 if res.returncode != 0:
                     raise MountError(f"No se pudo crear punto de montaje: {res.stderr}")
-                print(f"[OK] Punto de montaje creado")
+                log.info("Punto de montaje creado: %s", mount_point)
             else:
-                print(f"[INFO] Punto de montaje ya existe: {mount_point}")
+                log.debug("Punto de montaje ya existe: %s", mount_point)
 
             # Construir comando de montaje
             server_path = f"{server}:{remote_path}"
@@ -121,16 +217,11 @@ class MountManager:
             cmd.extend(["-o", options])
             cmd.extend([server_path, mount_point])
 
-            # Mostrar comando completo
-            print(f"[INFO] Comando: {' '.join(cmd)}")
-
             # Ejecutar montaje
-            print(f"[INFO] Ejecutando montaje...")
+            log.info("Ejecutando montaje", extra={"command": cmd})
             res = MountManager._run_privileged(cmd)
-
-            print(f"[DEBUG] mount returncode: {res.returncode}")
-            print(f"[DEBUG] mount stdout: {res.stdout}")
-            print(f"[DEBUG] mount stderr: {res.stderr}")
+            log.debug("mount terminado", extra={"returncode": res.returncode,
+                                                "stdout": res.stdout, "stderr": res.stderr})
 
             if res.returncode != 0:
                 # Proporcionar mensaje de error más claro
@@ -157,7 +248,7 @@ class MountManager:
                 else:
                     raise MountError(f"Error al montar: {error_msg}")
 
-            print(f"[OK] Montaje exitoso!")
+            log.info("Montaje exitoso: %s", mount_point)
             return True
 
         except MountError:
@@ -166,13 +257,44 @@ class MountManager:
             raise MountError(f"No se pudo montar NFS: {e}")
 
     @staticmethod
-    def unmount_nfs(mount_point: str, force: bool = False) -> bool:
+    def find_mount_users(mount_point: str, privileged: bool = True) -> Dict:
+        """
+        Lista los procesos con archivos abiertos, cwd, raíz, ejecutable o
+        mapeos de memoria dentro de mount_point, sin hacer stat() sobre él
+
+        Args:
+            mount_point: Punto de montaje a revisar
+            privileged: Si True y no somos root, el escaneo se ejecuta con
+                        pkexec/sudo para ver los procesos de todos los usuarios
+
+        Returns:
+            {"mount_point", "processes": [{"pid", "command", "user", "uses", ...}],
+             "scanned", "denied"}
+        """
+        if not privileged or os.geteuid() == 0:
+            return mount_users.scan(mount_point)
+
+        import inspect
+        import json
+        import sys
+        source = inspect.getsource(mount_users)
+        res = MountManager._run_privileged([sys.executable, "-c", source, mount_point])
+        if res.returncode != 0:
+            raise MountError(f"No se pudieron listar los procesos: {res.stderr.strip()}")
+        try:
+            return json.loads(res.stdout)
+        except ValueError:
+            raise MountError("Respuesta inválida al listar procesos")
+
+    @staticmethod
+    def unmount_nfs(mount_point: str, force: bool = False, lazy: bool = False) -> bool:
         """
         Desmonta un recurso NFS
 
         Args:
             mount_point: Punto de montaje a desmontar
             force: Si True, fuerza el desmontaje (umount -f)
+            lazy: Si True, lo desconecta ya y libera cuando deje de usarse (umount -l)
 
         Returns:
             True si se desmontó exitosamente
@@ -181,9 +303,11 @@ class MountManager:
             cmd = ["umount"]
             if force:
                 cmd.append("-f")
+            if lazy:
+                cmd.append("-l")
             cmd.append(mount_point)
 
-            print(f"[INFO] Desmontando {mount_point}")
+            log.info("Desmontando %s", mount_point, extra={"force": force, "lazy": lazy})
             res = MountManager._run_privileged(cmd)
 
             if res.returncode != 0:
@@ -209,7 +333,7 @@ class MountManager:
         """
         try:
             # Usar showmount para verificar
-            result = subprocess.run(
+            result = Instrumentation.run(
                 ["showmount", "-e", server],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
@@ -249,6 +373,17 @@ class MountManager:
             "NFSv3": "rw,sync,vers=3"
         }
 
+    @staticmethod
+    def load_fstab(path: str = FSTAB_PATH) -> FstabTable:
+        """
+        Carga /etc/fstab como FstabTable para acumular varios cambios y
+        confirmarlos juntos con table.commit()
+        """
+        try:
+            return FstabTable.load(path, run_privileged=MountManager._run_privileged)
+        except FstabError as e:
+            raise MountError(str(e))
+
     @staticmethod
     def add_to_fstab(server: str, remote_path: str, mount_point: str,
                      options: str = "defaults,_netdev", backup: bool = True) -> bool:
@@ -266,52 +401,9 @@ class MountManager:
             True si se añadió exitosamente
         """
         try:
-            fstab_path = "/etc/fstab"
-
-            # Crear backup si se solicita
-            if backup:
-                res = MountManager._run_privileged(["cp", fstab_path, f"{fstab_path}.bak"])
-                if res.returncode != 0:
-                    print("[WARNING] No se pudo crear backup de fstab")
-
-            # Leer fstab actual
-            try:
-                with open(fstab_path, 'r') as f:
-                    content = f.read()
-            except PermissionError:
-                res = MountManager._run_privileged(["cat", fstab_path])
-                if res.returncode != 0:
-                    raise MountError("No se pudo leer /etc/fstab")
-                content = res.stdout
-
-            # Verificar si ya existe una entrada para este mount_point
-            for line in content.split('\n'):
-                if line.strip() and not line.strip().startswith('#'):
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == mount_point:
-                        raise MountError(f"Ya existe una entrada en fstab para {mount_point}")
-
-            # Construir nueva entrada
-            server_path = f"{server}:{remote_path}"
-            new_entry = f"{server_path}\t{mount_point}\tnfs\t{options}\t0 0\n"
-
-            # Crear archivo temporal con el nuevo contenido
-            import tempfile
-            fd, tmp_path = tempfile.mkstemp(text=True)
-            os.close(fd)
-
-            with open(tmp_path, 'w') as f:
-                f.write(content)
-                if not content.endswith('\n'):
-                    f.write('\n')
-                f.write(new_entry)
-
-            # Mover el archivo temporal a fstab
-            res = MountManager._run_privileged(["mv", tmp_path, fstab_path])
-            if res.returncode != 0:
-                os.remove(tmp_path)
-                raise MountError(f"No se pudo actualizar fstab: {res.stderr}")
-
+            table = MountManager.load_fstab()
+            table.add(f"{server}:{remote_path}", mount_point, "nfs", options)
+            table.commit(backup=backup)
             return True
 
         except Exception as e:
@@ -330,53 +422,144 @@ class MountManager:
             True si se eliminó exitosamente
         """
         try:
-            fstab_path = "/etc/fstab"
+            table = MountManager.load_fstab()
+            table.remove(mount_point)
+            table.commit(backup=backup)
+            return True
 
-            # Crear backup
-            if backup:
-                res = MountManager._run_privileged(["cp", fstab_path, f"{fstab_path}.bak"])
-                if res.returncode != 0:
-                    print("[WARNING] No se pudo crear backup de fstab")
+        except Exception as e:
+            raise MountError(f"Error eliminando entrada de fstab: {e}")
 
-            # Leer fstab actual
-            try:
-                with open(fstab_path, 'r') as f:
-                    lines = f.readlines()
-            except PermissionError:
-                res = MountManager._run_privileged(["cat", fstab_path])
-                if res.returncode != 0:
-                    raise MountError("No se pudo leer /etc/fstab")
-                lines = res.stdout.split('\n')
-
-            # Filtrar la línea del mount_point
-            new_lines = []
-            found = False
-            for line in lines:
-                if line.strip() and not line.strip().startswith('#'):
-                    parts = line.split()
-                    if len(parts) >= 2 and parts[1] == mount_point:
-                        found = True
-                        continue
-                new_lines.append(line if isinstance(line, str) else line)
+    @staticmethod
+    def update_fstab_options(changes: Dict[str, str], backup: bool = True) -> int:
+        """
+        Cambia las opciones de varias entradas de fstab en una sola escritura
+
+        Args:
+            changes: {punto_de_montaje: nuevas_opciones}
+            backup: Si True, crea backup antes de modificar
+
+        Returns:
+            Número de entradas modificadas
+        """
+        try:
+            table = MountManager.load_fstab()
+            changed = 0
+            for mount_point, options in changes.items():
+                before = table.get(mount_point)
+                if before is None:
+                    raise MountError(f"No se encontró entrada en fstab para {mount_point}")
+                if before.options != options:
+                    table.set_options(mount_point, options)
+                    changed += 1
+            table.commit(backup=backup)
+            return changed
 
-            if not found:
-                raise MountError(f"No se encontró entrada en fstab para {mount_point}")
+        except Exception as e:
+            raise MountError(f"Error actualizando opciones en fstab: {e}")
+
+    @staticmethod
+    def add_automounts(mounts: List[Dict]) -> List[str]:
+        """
+        Genera e instala pares .mount + .automount para varios recursos NFS y
+        los activa en un único lote (una llamada privilegiada y un daemon-reload).
+        Los puntos que ya estén montados se desmontan antes de activarlos (y
+        se vuelven a montar si la instalación falla).
 
-            # Crear archivo temporal
-            import tempfile
-            fd, tmp_path = tempfile.mkstemp(text=True)
-            os.close(fd)
+        Args:
+            mounts: lista de dicts con server, remote_path, mount_point y
+                    opcionalmente options, idle_timeout, mount_timeout y after
 
-            with open(tmp_path, 'w') as f:
-                f.writelines(new_lines)
+        Returns:
+            Lista de unidades .automount activadas
+        """
+        import tempfile
+        try:
+            units = [AutomountUnit(**m) for m in mounts]
+        except (TypeError, ValueError) as e:
+            raise MountError(f"Definición de automontaje inválida: {e}")
+        if not units:
+            return []
 
-            # Mover a fstab
-            res = MountManager._run_privileged(["mv", tmp_path, fstab_path])
+        tmp_dir = tempfile.mkdtemp(prefix="nfs_units_")
+        try:
+            filenames = []
+            for unit in units:
+                for name, content in unit.render().items():
+                    with open(os.path.join(tmp_dir, name), "w") as f:
+                        f.write(content)
+                    filenames.append(name)
+
+            res = MountManager._run_privileged(
+                ["sh", "-c", _INSTALL_UNITS_SCRIPT, "sh", tmp_dir, UNIT_DIR]
+                + [arg for u in units for arg in (u.mount_point, u.names["automount"])]
+                + ["--"] + filenames,
+                timeout=30 + 5 * len(units))
             if res.returncode != 0:
-                os.remove(tmp_path)
-                raise MountError(f"No se pudo actualizar fstab: {res.stderr}")
+                raise MountError(f"No se pudieron instalar las unidades systemd: {res.stderr.strip()}")
 
-            return True
+            return [u.names["automount"] for u in units]
 
+        except MountError:
+            raise
         except Exception as e:
-            raise MountError(f"Error eliminando entrada de fstab: {e}")
+            raise MountError(f"Error generando unidades systemd: {e}")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def add_automount(server: str, remote_path: str, mount_point: str, options: str = "",
+                      idle_timeout: int = 600, mount_timeout: int = 30) -> str:
+        """
+        Configura un montaje NFS bajo demanda: se monta al primer acceso y se
+        desmonta tras idle_timeout segundos sin uso
+
+        Returns:
+            Nombre de la unidad .automount activada
+        """
+        return MountManager.add_automounts([{
+            "server": server,
+            "remote_path": remote_path,
+            "mount_point": mount_point,
+            "options": options,
+            "idle_timeout": idle_timeout,
+            "mount_timeout": mount_timeout,
+        }])[0]
+
+    @staticmethod
+    def remove_automounts(mount_points: List[str]) -> bool:
+        """Desactiva y elimina las unidades de automontaje de varios puntos de montaje"""
+        if not mount_points:
+            return True
+        bases = [unit_names(mp)["mount"][:-len(".mount")] for mp in mount_points]
+        res = MountManager._run_privileged(
+            ["sh", "-c", _REMOVE_UNITS_SCRIPT, "sh", UNIT_DIR] + bases,
+            timeout=30 + 5 * len(bases))
+        if res.returncode != 0:
+            raise MountError(f"No se pudieron eliminar las unidades systemd: {res.stderr.strip()}")
+        return True
+
+    @staticmethod
+    def list_automounts() -> List[Dict]:
+        """Lista los automontajes NFS gestionados por esta aplicación"""
+        automounts = []
+        try:
+            names = sorted(os.listdir(UNIT_DIR))
+        except OSError:
+            return automounts
+
+        for name in names:
+            if not name.endswith(".mount"):
+                continue
+            try:
+                with open(os.path.join(UNIT_DIR, name), "r") as f:
+                    content = f.read()
+            except OSError:
+                continue
+            if MANAGED_MARKER not in content:
+                continue
+            info = AutomountUnit.parse_mount_unit(content)
+            if info:
+                info["unit"] = name
+                automounts.append(info)
+        return automounts
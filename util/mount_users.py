@@ -0,0 +1,176 @@
+"""
+MountUsers
+----------
+Localiza los procesos que mantienen ocupado un punto de montaje: archivos
+abiertos, directorio de trabajo, directorio raíz, ejecutable o regiones
+mapeadas en memoria.
+
+Solo lee /proc (readlink y maps), nunca hace stat() sobre el montaje, así que
+funciona aunque el servidor NFS esté colgado. Los PIDs se reparten entre un
+pool de hilos. El módulo usa únicamente la biblioteca estándar para poder
+ejecutarse tal cual como proceso privilegiado (ver MountManager).
+"""
+
+import os
+import pwd
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+PROC = "/proc"
+DEFAULT_WORKERS = 32
+
+
+def _unescape(field: str) -> str:
+    """Decodifica los escapes octales de mountinfo (\\040 = espacio)."""
+    if "\\" not in field:
+        return field
+    return field.encode("utf-8").decode("unicode_escape").encode("latin-1").decode("utf-8")
+
+
+def mount_device(mount_point: str) -> Optional[str]:
+    """Número de dispositivo 'major:minor' del montaje según /proc/self/mountinfo."""
+    mount_point = os.path.normpath(mount_point)
+    device = None
+    try:
+        with open(os.path.join(PROC, "self", "mountinfo"), "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) > 4 and _unescape(parts[4]) == mount_point:
+                    device = parts[2]  # el último montaje sobre el punto gana
+    except OSError:
+        pass
+    return device
+
+
+def _under(path: str, prefix: str) -> bool:
+    if path.endswith(" (deleted)"):
+        path = path[:-len(" (deleted)")]
+    return path == prefix or path.startswith(prefix + "/")
+
+
+def _maps_device(device: str) -> str:
+    """Convierte '0:53' (mountinfo) al formato '00:35' de /proc/pid/maps."""
+    major, minor = device.split(":")
+    return "%02x:%02x" % (int(major), int(minor))
+
+
+@lru_cache(maxsize=None)
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+def _scan_pid(pid: str, prefix: str, maps_dev: Optional[str]) -> Tuple[Optional[Dict], bool]:
+    """
+    Revisa un proceso. Devuelve (info o None, acceso_denegado).
+    """
+    base = os.path.join(PROC, pid)
+    uses = []
+    denied = False
+
+    for link, kind in (("cwd", "cwd"), ("root", "root"), ("exe", "exe")):
+        try:
+            if _under(os.readlink(os.path.join(base, link)), prefix):
+                uses.append(kind)
+        except PermissionError:
+            denied = True
+        except OSError:
+            pass
+
+    files = []
+    try:
+        fd_dir = os.path.join(base, "fd")
+        for fd in os.listdir(fd_dir):
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if _under(target, prefix):
+                files.append(target)
+        if files:
+            uses.append("fd")
+    except PermissionError:
+        denied = True
+    except OSError:
+        pass
+
+    mapped = []
+    try:
+        with open(os.path.join(base, "maps"), "r") as f:
+            for line in f:
+                parts = line.split(None, 5)
+                if len(parts) < 6:
+                    continue
+                path = parts[5].rstrip("\n")
+                if (maps_dev and parts[3] == maps_dev) or _under(path, prefix):
+                    mapped.append(path)
+        if mapped:
+            uses.append("mmap")
+    except PermissionError:
+        denied = True
+    except OSError:
+        pass
+
+    if not uses:
+        return None, denied
+
+    info = {"pid": int(pid), "uses": uses, "files": sorted(set(files + mapped))[:20]}
+    try:
+        with open(os.path.join(base, "comm"), "r") as f:
+            info["command"] = f.read().strip()
+    except OSError:
+        info["command"] = "?"
+    try:
+        with open(os.path.join(base, "cmdline"), "rb") as f:
+            info["cmdline"] = f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+    except OSError:
+        info["cmdline"] = ""
+    try:
+        with open(os.path.join(base, "status"), "r") as f:
+            for line in f:
+                if line.startswith("Uid:"):
+                    info["user"] = _user_name(int(line.split()[1]))
+                    break
+    except OSError:
+        info["user"] = "?"
+    return info, denied
+
+
+def scan(mount_point: str, workers: int = DEFAULT_WORKERS) -> Dict:
+    """
+    Busca en todos los procesos los que usan mount_point
+
+    Returns:
+        {"mount_point", "processes": [...], "scanned": N, "denied": N}
+    """
+    prefix = os.path.normpath(mount_point)
+    device = mount_device(prefix)
+    maps_dev = _maps_device(device) if device else None
+    own = str(os.getpid())
+    pids = [p for p in os.listdir(PROC) if p.isdigit() and p != own]
+
+    processes = []
+    denied = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for info, was_denied in pool.map(lambda p: _scan_pid(p, prefix, maps_dev), pids):
+            if info is not None:
+                processes.append(info)
+            if was_denied:
+                denied += 1
+
+    processes.sort(key=lambda p: p["pid"])
+    return {
+        "mount_point": prefix,
+        "processes": processes,
+        "scanned": len(pids),
+        "denied": denied,
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    print(json.dumps(scan(sys.argv[1])))
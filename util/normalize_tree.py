@@ -0,0 +1,323 @@
+"""
+NormalizeTree
+-------------
+Normalización recursiva de propietario, grupo y permisos de un árbol
+exportado, p. ej. al cambiar el anonuid/anongid de una exportación:
+
+    {"owner": 2000, "group": "nfsanon",
+     "dir_mode": "2775", "file_mode": "0664", "exec_mode": "0775"}
+
+Cada clave es opcional y lo que no se indica no se toca. exec_mode se usa
+para los archivos que ya tienen algún bit de ejecución (si falta, también
+file_mode). Los enlaces simbólicos no se tocan ni se siguen y los
+dispositivos, FIFOs y sockets solo cambian de propietario.
+
+El árbol lo pueden modificar los clientes NFS mientras se recorre, así que
+nada se resuelve por ruta completa: cada directorio se abre componente a
+componente desde el descriptor de la raíz con O_NOFOLLOW, se recorre con
+os.scandir sobre su descriptor y se comprueba que sigue siendo el mismo
+inodo (st_dev/st_ino) que se vio al encolarlo. Cada cambio se hace sobre un
+descriptor O_PATH del inodo abierto con O_NOFOLLOW y verificado contra el
+lstat previo: un enlace simbólico colado entre la lectura y el cambio no
+puede desviar un chown o chmod fuera del árbol.
+
+El árbol se recorre desde un pool de hilos que comparten una cola de
+directorios; las llamadas al sistema liberan el GIL, así que los
+hilos trabajan de verdad en paralelo. Solo se hace chown/chmod sobre los
+inodos que difieren de la política, por lo que repetirlo sobre un árbol ya
+normalizado no escribe nada. Por defecto no se cruzan puntos de montaje.
+
+Como util/provision.py, usa solo la biblioteca estándar para ejecutarse tal
+cual como proceso privilegiado (ver Add.normalize_tree): lee la petición
+JSON de stdin y escribe en stdout una línea JSON {"progress": {...}} cada
+PROGRESS_INTERVAL segundos y al final {"result": {...}}.
+"""
+
+import errno
+import grp
+import os
+import pwd
+import queue
+import stat
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+DEFAULT_WORKERS = 32
+PROGRESS_INTERVAL = 1.0
+MAX_ERROR_SAMPLES = 50
+
+_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | _CLOEXEC
+_INODE_FLAGS = os.O_PATH | os.O_NOFOLLOW | _CLOEXEC
+
+_COUNTERS = ("scanned", "directories", "changed", "chown", "chmod", "errors", "skipped_mounts")
+
+
+class NormalizeError(ValueError):
+    pass
+
+
+def resolve_policy(policy: Dict) -> Dict:
+    """Nombres de usuario/grupo -> uid/gid y modos octales -> enteros"""
+    resolved = {}
+    for key, db, attr in (("owner", pwd.getpwnam, "pw_uid"), ("group", grp.getgrnam, "gr_gid")):
+        value = policy.get(key)
+        if value in (None, ""):
+            continue
+        if isinstance(value, int) or str(value).isdigit():
+            resolved[key] = int(value)
+        else:
+            try:
+                resolved[key] = getattr(db(value), attr)
+            except KeyError:
+                raise NormalizeError(f"{'Usuario' if key == 'owner' else 'Grupo'} desconocido: {value}")
+    for key in ("dir_mode", "file_mode", "exec_mode"):
+        value = policy.get(key)
+        if value in (None, ""):
+            continue
+        try:
+            mode = value if isinstance(value, int) else int(str(value), 8)
+        except ValueError:
+            mode = -1
+        if not 0 <= mode <= 0o7777:
+            raise NormalizeError(f"Modo inválido en {key}: {value!r}")
+        resolved[key] = mode
+    if "exec_mode" not in resolved and "file_mode" in resolved:
+        resolved["exec_mode"] = resolved["file_mode"]
+    if not resolved:
+        raise NormalizeError("La política no indica propietario, grupo ni permisos")
+    return resolved
+
+
+class _Walker:
+    def __init__(self, root: str, policy: Dict, dry_run: bool, one_file_system: bool,
+                 progress: Optional[Callable[[Dict], None]] = None):
+        self.root = root
+        self.uid = policy.get("owner", -1)
+        self.gid = policy.get("group", -1)
+        self.dir_mode = policy.get("dir_mode")
+        self.file_mode = policy.get("file_mode")
+        self.exec_mode = policy.get("exec_mode")
+        self.dry_run = dry_run
+        self.one_file_system = one_file_system
+        self.root_fd = os.open(root, _DIR_FLAGS)
+        self.device = os.fstat(self.root_fd).st_dev
+        # (componentes desde la raíz, (st_dev, st_ino) esperados) o None para terminar
+        self.queue: "queue.Queue[Optional[Tuple[Tuple[str, ...], Tuple[int, int]]]]" = queue.Queue()
+        # Un diccionario de contadores por hilo: sin cerrojos en el camino caliente
+        self.counts = []
+        self.error_samples = []
+        self._errors_lock = threading.Lock()
+        self.progress = progress
+        self.start = time.monotonic()
+        self._next_report = self.start + PROGRESS_INTERVAL
+        self._report_lock = threading.Lock()
+
+    def totals(self) -> Dict[str, int]:
+        totals = dict.fromkeys(_COUNTERS, 0)
+        for counts in list(self.counts):
+            for key in _COUNTERS:
+                totals[key] += counts[key]
+        return totals
+
+    def _error(self, counts: Dict, path: str, e: OSError) -> None:
+        counts["errors"] += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            with self._errors_lock:
+                self.error_samples.append(f"{path}: {e.strerror or e}")
+
+    def _wanted_mode(self, st) -> Optional[int]:
+        if stat.S_ISDIR(st.st_mode):
+            return self.dir_mode
+        if stat.S_ISREG(st.st_mode):
+            return self.exec_mode if st.st_mode & 0o111 else self.file_mode
+        return None
+
+    def fix(self, dir_fd: int, name: Optional[str], st, counts: Dict) -> None:
+        """
+        Ajusta un inodo ya leído con lstat si difiere de la política. name es
+        relativo a dir_fd; con name=None se ajusta el propio dir_fd (la raíz).
+        """
+        if stat.S_ISLNK(st.st_mode):
+            return
+        need_chown = (self.uid != -1 and st.st_uid != self.uid) or \
+                     (self.gid != -1 and st.st_gid != self.gid)
+        mode = self._wanted_mode(st)
+        need_chmod = mode is not None and stat.S_IMODE(st.st_mode) != mode
+        if not (need_chown or need_chmod):
+            return
+        counts["changed"] += 1
+        counts["chown"] += need_chown
+        counts["chmod"] += need_chmod
+        if self.dry_run:
+            return
+
+        fd = dir_fd if name is None else os.open(name, _INODE_FLAGS, dir_fd=dir_fd)
+        try:
+            current = os.fstat(fd)
+            if (current.st_dev, current.st_ino, stat.S_IFMT(current.st_mode)) != \
+                    (st.st_dev, st.st_ino, stat.S_IFMT(st.st_mode)):
+                raise OSError(errno.ESTALE, "cambió durante el recorrido; no se modifica")
+            # Un descriptor O_PATH no admite fchown/fchmod; su enlace en
+            # /proc/self/fd lleva siempre a ese mismo inodo
+            target = fd if name is None else f"/proc/self/fd/{fd}"
+            if need_chown:
+                os.chown(target, self.uid, self.gid)
+                # chown quita setuid/setgid: volver a leer el modo real
+                current = os.fstat(fd)
+            if mode is not None and stat.S_IMODE(current.st_mode) != mode:
+                os.chmod(target, mode)
+        finally:
+            if name is not None:
+                os.close(fd)
+
+    def _open_dir(self, components: Tuple[str, ...], expected: Tuple[int, int]) -> int:
+        """Abre un directorio encolado sin seguir enlaces y comprueba que es el mismo"""
+        fd = os.dup(self.root_fd)
+        try:
+            for name in components:
+                child = os.open(name, _DIR_FLAGS, dir_fd=fd)
+                os.close(fd)
+                fd = child
+            st = os.fstat(fd)
+            if (st.st_dev, st.st_ino) != expected:
+                raise OSError(errno.ESTALE, "cambió durante el recorrido; no se recorre")
+            return fd
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def scan(self, components: Tuple[str, ...], expected: Tuple[int, int], counts: Dict) -> None:
+        directory = os.path.join(self.root, *components)
+        try:
+            fd = self._open_dir(components, expected)
+        except OSError as e:
+            self._error(counts, directory, e)
+            return
+        try:
+            with os.scandir(fd) as entries:
+                for n, entry in enumerate(entries, start=1):
+                    if self.progress and not n % 4096:
+                        self.report()  # directorios enormes: informar también a mitad
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        counts["scanned"] += 1
+                        if stat.S_ISDIR(st.st_mode):
+                            if self.one_file_system and st.st_dev != self.device:
+                                counts["skipped_mounts"] += 1
+                                continue
+                            counts["directories"] += 1
+                            self.fix(fd, entry.name, st, counts)
+                            self.queue.put((components + (entry.name,), (st.st_dev, st.st_ino)))
+                        else:
+                            self.fix(fd, entry.name, st, counts)
+                    except OSError as e:
+                        self._error(counts, os.path.join(directory, entry.name), e)
+        except OSError as e:
+            self._error(counts, directory, e)
+        finally:
+            os.close(fd)
+
+    def report(self) -> None:
+        # Lo hace el propio hilo que termina un directorio: un hilo aparte
+        # que solo espera apenas consigue el GIL con todos los demás ocupados
+        now = time.monotonic()
+        if now < self._next_report or not self._report_lock.acquire(blocking=False):
+            return
+        try:
+            if now >= self._next_report:
+                self._next_report = now + PROGRESS_INTERVAL
+                self.progress(dict(self.totals(), elapsed=round(now - self.start, 1)))
+        finally:
+            self._report_lock.release()
+
+    def work(self) -> None:
+        counts = dict.fromkeys(_COUNTERS, 0)
+        self.counts.append(counts)
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.scan(item[0], item[1], counts)
+                if self.progress:
+                    self.report()
+            finally:
+                self.queue.task_done()
+
+
+def normalize(root: str, policy: Dict, dry_run: bool = False, workers: int = DEFAULT_WORKERS,
+              one_file_system: bool = True,
+              progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Normaliza root y todo lo que contiene según policy.
+
+    Args:
+        dry_run: solo contar lo que cambiaría
+        one_file_system: no entrar en otros sistemas de archivos montados dentro
+        progress: llamada cada PROGRESS_INTERVAL segundos con los contadores
+
+    Returns:
+        {"root", "dry_run", "scanned", "directories", "changed" (inodos),
+         "chown", "chmod", "errors", "error_samples", "skipped_mounts", "elapsed"}
+    """
+    root = os.path.normpath(root)
+    if not os.path.isabs(root) or root == "/":
+        raise NormalizeError(f"Ruta raíz no permitida: {root!r}")
+    policy = resolve_policy(policy)
+    try:
+        st = os.lstat(root)
+    except OSError as e:
+        raise NormalizeError(f"No se puede acceder a {root}: {e.strerror or e}")
+    if not stat.S_ISDIR(st.st_mode):
+        raise NormalizeError(f"{root} no es un directorio")
+
+    try:
+        walker = _Walker(root, policy, dry_run, one_file_system, progress)
+    except OSError as e:
+        raise NormalizeError(f"No se puede abrir {root}: {e.strerror or e}")
+    st = os.fstat(walker.root_fd)
+    root_counts = dict.fromkeys(_COUNTERS, 0)
+    walker.counts.append(root_counts)
+    root_counts["scanned"] = root_counts["directories"] = 1
+    try:
+        walker.fix(walker.root_fd, None, st, root_counts)
+    except OSError as e:
+        walker._error(root_counts, root, e)
+    walker.queue.put(((), (st.st_dev, st.st_ino)))
+
+    threads = [threading.Thread(target=walker.work, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+    walker.queue.join()
+    for _ in threads:
+        walker.queue.put(None)
+    for t in threads:
+        t.join()
+    os.close(walker.root_fd)
+
+    result = {"root": root, "dry_run": dry_run}
+    result.update(walker.totals())
+    result["error_samples"] = walker.error_samples
+    result["elapsed"] = round(time.monotonic() - walker.start, 3)
+    return result
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    def emit(kind: str, value: Dict) -> None:
+        sys.stdout.write(json.dumps({kind: value}) + "\n")
+        sys.stdout.flush()
+
+    request = json.load(sys.stdin)
+    try:
+        emit("result", normalize(request["root"], request.get("policy", {}),
+                                 bool(request.get("dry_run")),
+                                 int(request.get("workers", DEFAULT_WORKERS)),
+                                 bool(request.get("one_file_system", True)),
+                                 lambda counts: emit("progress", counts)))
+    except NormalizeError as e:
+        emit("error", {"message": str(e)})
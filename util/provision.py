@@ -0,0 +1,313 @@
+"""
+Provision
+---------
+Creación en lote de directorios para exportar: modo, propietario, grupo y
+ACL POSIX opcionales para cualquier número de rutas en una sola operación.
+
+Cada directorio se describe con un dict:
+
+    {"path": "/srv/home/alice", "mode": "0700", "owner": "alice",
+     "group": "users", "acl": ["u:backup:rx", "d:u:alice:rwx"]}
+
+Las ACL usan la sintaxis de setfacl ('u:nombre:rwx', 'g::rx', 'm::rx',
+'o::-'; con 'd:' delante van a la ACL por defecto). En los valores de acl,
+owner y group se sustituyen {path}, {name} (último componente de la ruta),
+{owner} y {group}, así que una misma plantilla sirve para miles de homes.
+
+Es idempotente: solo se tocan las rutas y atributos que difieren de lo
+pedido. Las llamadas al sistema de archivos se reparten entre un pool de
+hilos. Las ACL se leen y escriben directamente en los atributos extendidos
+system.posix_acl_*, sin lanzar setfacl por ruta.
+
+El módulo usa únicamente la biblioteca estándar para poder ejecutarse tal
+cual como proceso privilegiado (ver Add.provision): lee la petición JSON de
+stdin y escribe el resultado JSON en stdout.
+"""
+
+import grp
+import os
+import pwd
+import stat
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_WORKERS = 16
+DEFAULT_MODE = 0o755
+
+ACL_ACCESS = "system.posix_acl_access"
+ACL_DEFAULT = "system.posix_acl_default"
+
+# Formato binario de las ACL en xattr (linux/posix_acl_xattr.h)
+_ACL_VERSION = 2
+_USER_OBJ, _USER, _GROUP_OBJ, _GROUP, _MASK, _OTHER = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20
+_UNDEFINED_ID = 0xFFFFFFFF
+_TAGS = {"u": (_USER_OBJ, _USER), "user": (_USER_OBJ, _USER),
+         "g": (_GROUP_OBJ, _GROUP), "group": (_GROUP_OBJ, _GROUP),
+         "m": (_MASK, _MASK), "mask": (_MASK, _MASK),
+         "o": (_OTHER, _OTHER), "other": (_OTHER, _OTHER)}
+
+
+class ProvisionSpecError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=4096)
+def _uid(owner) -> int:
+    if isinstance(owner, int) or str(owner).isdigit():
+        return int(owner)
+    try:
+        return pwd.getpwnam(owner).pw_uid
+    except KeyError:
+        raise ProvisionSpecError(f"Usuario desconocido: {owner}")
+
+
+@lru_cache(maxsize=4096)
+def _gid(group) -> int:
+    if isinstance(group, int) or str(group).isdigit():
+        return int(group)
+    try:
+        return grp.getgrnam(group).gr_gid
+    except KeyError:
+        raise ProvisionSpecError(f"Grupo desconocido: {group}")
+
+
+def parse_mode(mode) -> int:
+    """0o755 (entero) o '0755'/'755' (cadena octal, la forma a usar en JSON)"""
+    if mode is None:
+        return DEFAULT_MODE
+    try:
+        value = mode if isinstance(mode, int) else int(str(mode), 8)
+    except ValueError:
+        value = -1
+    if not 0 <= value <= 0o7777:
+        raise ProvisionSpecError(f"Modo inválido: {mode!r}")
+    return value
+
+
+def _perms(text: str) -> int:
+    if text.isdigit():
+        return int(text) & 7
+    bits = 0
+    for ch in text:
+        if ch == "r":
+            bits |= 4
+        elif ch == "w":
+            bits |= 2
+        elif ch in "xX":
+            bits |= 1
+        elif ch != "-":
+            raise ProvisionSpecError(f"Permisos de ACL inválidos: {text!r}")
+    return bits
+
+
+def parse_acl(entries: List[str]) -> Tuple[Dict[Tuple[int, int], int], Dict[Tuple[int, int], int]]:
+    """Entradas estilo setfacl -> ({(tag, id): permisos} de acceso, por defecto)"""
+    access: Dict[Tuple[int, int], int] = {}
+    default: Dict[Tuple[int, int], int] = {}
+    for entry in entries:
+        parts = entry.strip().split(":")
+        target = access
+        if parts and parts[0] in ("d", "default"):
+            target, parts = default, parts[1:]
+        if len(parts) != 3 or parts[0] not in _TAGS:
+            raise ProvisionSpecError(f"Entrada de ACL inválida: {entry!r}")
+        kind, name, perms = parts
+        obj_tag, named_tag = _TAGS[kind]
+        if not name or obj_tag in (_MASK, _OTHER):
+            key = (obj_tag, _UNDEFINED_ID)
+        elif named_tag == _USER:
+            key = (_USER, _uid(name))
+        else:
+            key = (_GROUP, _gid(name))
+        target[key] = _perms(perms)
+    return access, default
+
+
+def _complete(entries: Dict[Tuple[int, int], int], mode: int) -> Dict[Tuple[int, int], int]:
+    """Añade las entradas base que falten a partir del modo, como hace setfacl"""
+    full = dict(entries)
+    full.setdefault((_USER_OBJ, _UNDEFINED_ID), (mode >> 6) & 7)
+    full.setdefault((_GROUP_OBJ, _UNDEFINED_ID), (mode >> 3) & 7)
+    full.setdefault((_OTHER, _UNDEFINED_ID), mode & 7)
+    named = [p for (tag, _), p in full.items() if tag in (_USER, _GROUP)]
+    if named and (_MASK, _UNDEFINED_ID) not in full:
+        mask = full[(_GROUP_OBJ, _UNDEFINED_ID)]
+        for p in named:
+            mask |= p
+        full[(_MASK, _UNDEFINED_ID)] = mask
+    return full
+
+
+def encode_acl(entries: Dict[Tuple[int, int], int]) -> bytes:
+    data = [struct.pack("<I", _ACL_VERSION)]
+    for (tag, ident), perms in sorted(entries.items()):
+        data.append(struct.pack("<HHI", tag, perms, ident))
+    return b"".join(data)
+
+
+def _is_minimal(entries: Dict[Tuple[int, int], int]) -> bool:
+    """Solo propietario, grupo y otros: una ACL que se reduce a los bits del modo"""
+    return all(tag in (_USER_OBJ, _GROUP_OBJ, _OTHER) for tag, _ in entries)
+
+
+def _acl_mode(entries: Dict[Tuple[int, int], int], mode: int) -> int:
+    """Modo que deja el kernel al aplicar una ACL de acceso (grupo = máscara)"""
+    group = entries.get((_MASK, _UNDEFINED_ID), entries[(_GROUP_OBJ, _UNDEFINED_ID)])
+    return ((mode & ~0o777) | (entries[(_USER_OBJ, _UNDEFINED_ID)] << 6)
+            | (group << 3) | entries[(_OTHER, _UNDEFINED_ID)])
+
+
+def _read_xattr(path: str, name: str) -> Optional[bytes]:
+    try:
+        return os.getxattr(path, name, follow_symlinks=False)
+    except OSError as e:
+        if e.errno in (61, 95):  # ENODATA (sin ACL), ENOTSUP
+            return None
+        raise
+
+
+def _expand(value, spec: Dict) -> str:
+    if not isinstance(value, str) or "{" not in value:
+        return value
+    return value.format(path=spec["path"], name=os.path.basename(spec["path"].rstrip("/")),
+                        owner=spec.get("owner", ""), group=spec.get("group", ""))
+
+
+def normalize(spec: Dict, templates: Optional[Dict[str, Dict]] = None) -> Dict:
+    """
+    Valida un directorio y aplica su plantilla ("template": nombre). Los
+    valores del propio directorio tienen prioridad sobre los de la plantilla.
+    """
+    if not isinstance(spec, dict):
+        spec = {"path": spec}
+    if spec.get("template"):
+        template = (templates or {}).get(spec["template"])
+        if template is None:
+            raise ProvisionSpecError(f"Plantilla desconocida: {spec['template']}")
+        spec = dict(template, **{k: v for k, v in spec.items() if k != "template"})
+    path = spec.get("path")
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise ProvisionSpecError(f"La ruta debe ser absoluta: {path!r}")
+    result = {"path": os.path.normpath(path), "mode": parse_mode(spec.get("mode"))}
+    for key in ("owner", "group"):
+        if spec.get(key) not in (None, ""):
+            result[key] = spec[key]
+    for key in ("owner", "group"):
+        if key in result:
+            result[key] = _expand(result[key], result)
+    if spec.get("acl"):
+        result["acl"] = [_expand(entry, result) for entry in spec["acl"]]
+    return result
+
+
+def provision_one(spec: Dict, dry_run: bool = False) -> Dict:
+    """
+    Lleva un directorio (ya normalizado) al estado pedido.
+
+    Returns:
+        {"path", "status": "created"|"updated"|"unchanged"|"error",
+         "actions": [...], "error": str}
+    """
+    path, mode = spec["path"], spec["mode"]
+    result = {"path": path, "status": "unchanged", "actions": []}
+    try:
+        uid = _uid(spec["owner"]) if "owner" in spec else -1
+        gid = _gid(spec["group"]) if "group" in spec else -1
+        access = default = None
+        if spec.get("acl"):
+            access, default = parse_acl(spec["acl"])
+            access = _complete(access, mode) if access else None
+            default = _complete(default, mode) if default else None
+
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            st = None
+        if st is not None and not stat.S_ISDIR(st.st_mode):
+            raise ProvisionSpecError(f"{path} existe y no es un directorio"
+                                     + (" (es un enlace simbólico)" if stat.S_ISLNK(st.st_mode) else ""))
+        if st is None:
+            result["status"] = "created"
+            result["actions"].append("mkdir")
+            if dry_run:
+                return result
+            os.makedirs(path, mode=0o755, exist_ok=True)
+            st = os.lstat(path)
+
+        want_mode = _acl_mode(access, mode) if access else mode
+        if (uid != -1 and st.st_uid != uid) or (gid != -1 and st.st_gid != gid):
+            result["actions"].append("chown")
+            if not dry_run:
+                os.chown(path, uid, gid, follow_symlinks=False)
+        # chown puede quitar setuid/setgid: el modo se comprueba después
+        if stat.S_IMODE(st.st_mode) != want_mode:
+            result["actions"].append("chmod")
+            if not dry_run:
+                os.chmod(path, want_mode)
+        for name, entries in ((ACL_ACCESS, access), (ACL_DEFAULT, default)):
+            if entries is None:
+                continue
+            if name == ACL_ACCESS and _is_minimal(entries):
+                # Equivale al modo (ya comprobado) y el kernel no la guarda
+                # como xattr: solo hay que quitar una ACL extendida anterior
+                if _read_xattr(path, name) is not None:
+                    result["actions"].append("setfacl -b")
+                    if not dry_run:
+                        os.removexattr(path, name, follow_symlinks=False)
+                continue
+            data = encode_acl(entries)
+            if _read_xattr(path, name) != data:
+                result["actions"].append("setfacl -d" if name == ACL_DEFAULT else "setfacl")
+                if not dry_run:
+                    os.setxattr(path, name, data, follow_symlinks=False)
+        if result["actions"] and result["status"] == "unchanged":
+            result["status"] = "updated"
+    except (OSError, ProvisionSpecError) as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    return result
+
+
+def provision(specs: List[Dict], templates: Optional[Dict[str, Dict]] = None,
+              dry_run: bool = False, workers: int = DEFAULT_WORKERS) -> Dict:
+    """
+    Aplica provision_one a todos los directorios en paralelo.
+
+    Returns:
+        {"results": [...] (en el orden de specs), "created": N, "updated": N,
+         "unchanged": N, "errors": N}
+    """
+    normalized = []
+    for spec in specs:
+        try:
+            normalized.append(normalize(spec, templates))
+        except ProvisionSpecError as e:
+            path = spec.get("path") if isinstance(spec, dict) else spec
+            normalized.append({"path": path, "invalid": str(e)})
+
+    def run(spec: Dict) -> Dict:
+        if "invalid" in spec:
+            return {"path": spec["path"], "status": "error", "actions": [], "error": spec["invalid"]}
+        return provision_one(spec, dry_run)
+
+    old_umask = os.umask(0o022)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(run, normalized))
+    finally:
+        os.umask(old_umask)
+    summary = {"results": results, "created": 0, "updated": 0, "unchanged": 0, "errors": 0}
+    for r in results:
+        summary["errors" if r["status"] == "error" else r["status"]] += 1
+    return summary
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    request = json.load(sys.stdin)
+    print(json.dumps(provision(request.get("directories", []), request.get("templates"),
+                               bool(request.get("dry_run")),
+                               int(request.get("workers", DEFAULT_WORKERS)))))
@@ -0,0 +1,1000 @@
+"""
+RPC
+---
+Servicio local JSON-RPC 2.0 sobre un socket Unix para automatización:
+
+    python -m util.rpc serve [--socket RUTA] [--group GRUPO] [--fake]
+    python -m util.rpc call exports.list
+    python -m util.rpc call exports.apply '{"changes": [{"path": "/srv/a", "hosts": "*(ro)"}]}'
+
+Un proceso de larga duración evita arrancar un intérprete y detectar
+privilegios en cada llamada. Mantiene en memoria el parseo de /etc/exports
+y la lista de backups (se invalidan cuando cambia el stat del archivo o tras
+cada escritura) y, ejecutado como root (p. ej. desde una unidad systemd),
+lanza los comandos directamente sin pkexec/sudo.
+
+Protocolo: un mensaje JSON por línea; se admiten lotes JSON-RPC (arrays).
+Un cliente puede enviar muchas peticiones sin esperar respuesta
+(pipelining); cada respuesta lleva el id de su petición y pueden llegar en
+otro orden. Las lecturas se sirven en paralelo; las escrituras se ejecutan
+de una en una, en orden de llegada, y una lectura siempre ve las
+escrituras enviadas antes por su misma conexión.
+
+Solo se aceptan clientes (SO_PEERCRED) con uid 0, el uid del servicio o,
+con --group, los miembros de ese grupo.
+
+Con --fake el servicio usa FakeBackend: todo en memoria, sin NFS ni
+privilegios, para probar clientes y automatizaciones sin conexión.
+"""
+
+import argparse
+import grp
+import inspect
+import json
+import os
+import pwd
+import queue
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from util import backup_manager
+from util.exports_manager import ExportsManager, ExportsError, EXPORTS_PATH
+from util.exports_lint import ExportsLint
+from util.backup_manager import BackupManager, BackupError
+from util.backup_history import DEFAULT_RETENTION
+from util.mount_manager import MountManager, MountError
+from util.mount_health import HEALTHY
+from util.service_manager import ServiceManager, ServiceError
+from util.log import get_logger
+
+log = get_logger(__name__)
+
+MAX_MESSAGE = 16 * 1024 * 1024
+DEFAULT_WORKERS = 8
+
+# Códigos de error JSON-RPC 2.0 (y los propios, a partir de -32000)
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+APP_ERROR = -32000
+ACCESS_DENIED = -32001
+
+# Errores de los gestores: se devuelven al cliente como APP_ERROR
+_APP_ERRORS = (ExportsError, BackupError, MountError, ServiceError, ValueError)
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def to_dict(self) -> Dict:
+        error = {"code": self.code, "message": self.message}
+        if self.data is not None:
+            error["data"] = self.data
+        return error
+
+
+def default_socket_path() -> str:
+    """NFS_MANAGER_SOCKET, /run/nfs-manager/rpc.sock (root) o $XDG_RUNTIME_DIR"""
+    path = os.environ.get("NFS_MANAGER_SOCKET")
+    if path:
+        return path
+    if os.geteuid() == 0:
+        return "/run/nfs-manager/rpc.sock"
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime, "nfs-manager.sock")
+
+
+def peer_credentials(conn: socket.socket) -> Tuple[int, int, int]:
+    """(pid, uid, gid) del proceso al otro lado del socket"""
+    data = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", data)
+
+
+def rpc_method(mode: str) -> Callable:
+    """Marca un método del backend como 'read' o 'write'"""
+    def mark(func):
+        func.rpc_mode = mode
+        return func
+    return mark
+
+
+class ReadWriteLock:
+    """Muchos lectores o un escritor; un escritor en espera bloquea lectores nuevos"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _StatCache:
+    """Resultado de loader() válido mientras no cambie el stat de path"""
+
+    def __init__(self, path: str, loader: Callable[[], Any]):
+        self.path = path
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._key = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        try:
+            st = os.stat(self.path)
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            key = None
+        with self._lock:
+            if key is not None and key == self._key:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+        value = self.loader()
+        with self._lock:
+            self._key, self._value = key, value
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._key = self._value = None
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+
+class _Backend:
+    """
+    Métodos comunes a los backends. El nombre RPC sale del nombre del método
+    cambiando el primer '_' por '.': exports_list -> exports.list
+    """
+
+    @rpc_method("write")
+    def exports_add(self, path: str, hosts: Any) -> Dict:
+        return self.exports_apply([{"op": "add", "path": path, "hosts": hosts}])
+
+    @rpc_method("write")
+    def exports_edit(self, path: str, hosts: Any) -> Dict:
+        return self.exports_apply([{"op": "edit", "path": path, "hosts": hosts}])
+
+    @rpc_method("write")
+    def exports_remove(self, path: str) -> Dict:
+        return self.exports_apply([{"op": "remove", "path": path}])
+
+    def invalidate(self) -> None:
+        pass
+
+    def cache_stats(self) -> Dict:
+        return {}
+
+
+class SystemBackend(_Backend):
+    """Los gestores reales de util/ con el parseo de exports y backups cacheado"""
+
+    def __init__(self):
+        self._exports = _StatCache(EXPORTS_PATH, ExportsManager.list_parsed)
+        # El manifiesto se reemplaza con rename dentro de BACKUP_DIR, así que
+        # el mtime del directorio cambia con cada backup nuevo o borrado
+        self._backups = _StatCache(backup_manager.BACKUP_DIR, BackupManager.list_backups)
+
+    def invalidate(self) -> None:
+        self._exports.invalidate()
+        self._backups.invalidate()
+
+    def cache_stats(self) -> Dict:
+        return {name: {"hits": c.hits, "misses": c.misses}
+                for name, c in (("exports", self._exports), ("backups", self._backups))}
+
+    @rpc_method("read")
+    def exports_list(self) -> List[Dict]:
+        return self._exports.get()
+
+    @rpc_method("read")
+    def exports_raw(self) -> str:
+        return ExportsManager._read_file_as_root(EXPORTS_PATH)
+
+    @rpc_method("write")
+    def exports_apply(self, changes: List[Dict], dry_run: bool = False) -> Dict:
+        return ExportsManager.apply_changes(changes, dry_run=dry_run)
+
+    @rpc_method("read")
+    def backup_list(self) -> List[Dict]:
+        return self._backups.get()
+
+    @rpc_method("read")
+    def backup_info(self, name: str, include_content: bool = False) -> Optional[Dict]:
+        return BackupManager.get_backup_info(name, include_content=include_content)
+
+    @rpc_method("write")
+    def backup_create(self, description: str = "") -> str:
+        return BackupManager.create_backup(description)
+
+    @rpc_method("write")
+    def backup_restore(self, name: str) -> bool:
+        return BackupManager.restore_backup(name)
+
+    @rpc_method("write")
+    def backup_delete(self, name: str) -> bool:
+        return BackupManager.delete_backup(name)
+
+    @rpc_method("write")
+    def backup_prune(self, dry_run: bool = False) -> Dict:
+        return BackupManager.prune(dry_run=dry_run)
+
+    @rpc_method("read")
+    def mount_list(self, health: bool = False) -> List[Dict]:
+        mounts = MountManager.get_mounted_nfs()
+        return MountManager.check_health(mounts) if health else mounts
+
+    @rpc_method("write")
+    def mount_mount(self, server: str, remote_path: str, mount_point: str,
+                    options: str = "") -> bool:
+        return MountManager.mount_nfs(server, remote_path, mount_point, options)
+
+    @rpc_method("write")
+    def mount_unmount(self, mount_point: str, force: bool = False, lazy: bool = False) -> bool:
+        return MountManager.unmount_nfs(mount_point, force=force, lazy=lazy)
+
+    @rpc_method("read")
+    def service_status(self) -> Dict:
+        return ServiceManager.status()
+
+    @rpc_method("read")
+    def service_exports_active(self) -> List[Dict]:
+        return ServiceManager.get_exports_active()
+
+    @rpc_method("read")
+    def service_clients(self) -> List[Dict]:
+        return ServiceManager.get_connected_clients()
+
+    @rpc_method("write")
+    def service_start(self) -> bool:
+        return ServiceManager.start()
+
+    @rpc_method("write")
+    def service_stop(self) -> bool:
+        return ServiceManager.stop()
+
+    @rpc_method("write")
+    def service_restart(self) -> bool:
+        return ServiceManager.restart()
+
+
+class FakeBackend(_Backend):
+    """
+    Backend en memoria con la misma interfaz que SystemBackend. Usa el mismo
+    parser y la misma lógica de cambios que ExportsManager, y los mismos
+    registros, retención y claves que BackupManager y MountManager, así que
+    las respuestas tienen la forma real. delay simula la latencia de cada
+    operación (segundos).
+    """
+
+    def __init__(self, exports_text: str = "", delay: float = 0.0):
+        self.exports_text = exports_text
+        self.delay = delay
+        # Registros con el formato del manifiesto (más reciente primero)
+        self.backups: List[Dict] = []
+        self.contents: Dict[str, str] = {}
+        self.mounts: List[Dict] = []
+        self.service = {"active": "active", "enabled": "enabled"}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _op(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def _find_backup(self, name: str) -> Dict:
+        for backup in self.backups:
+            if backup["filename"] == name:
+                return backup
+        raise BackupError(f"El backup no existe: {name}")
+
+    def _snapshot(self, description: str) -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = f"exports_{timestamp}_{len(self.backups) + 1:04d}"
+        record = BackupManager._make_record(name, self.exports_text, description, timestamp=timestamp)
+        # Como un objeto completo (sin delta) del almacén
+        record.update(object=record["sha256"], stored_size=record["size"], depth=0, base=None)
+        self.backups.insert(0, record)
+        self.contents[name] = self.exports_text
+        return name
+
+    @rpc_method("read")
+    def exports_list(self) -> List[Dict]:
+        self._op("exports.list")
+        return ExportsManager.parse_text(self.exports_text)
+
+    @rpc_method("read")
+    def exports_raw(self) -> str:
+        self._op("exports.raw")
+        return self.exports_text
+
+    @rpc_method("write")
+    def exports_apply(self, changes: List[Dict], dry_run: bool = False) -> Dict:
+        self._op("exports.apply")
+        new_text, summary = ExportsManager.apply_changes_to_text(self.exports_text, changes)
+        summary["changed"] = new_text != self.exports_text and bool(
+            summary["added"] or summary["removed"] or summary["edited"])
+        if dry_run:
+            summary["content"] = new_text
+            summary["issues"] = ExportsLint.check_text(new_text)
+        elif summary["changed"]:
+            ExportsManager.validate(new_text, base_text=self.exports_text)
+            self._snapshot("Auto-backup antes de modificar /etc/exports")
+            self.exports_text = new_text
+        return summary
+
+    @rpc_method("read")
+    def backup_list(self) -> List[Dict]:
+        self._op("backup.list")
+        return [BackupManager.listing_entry(b) for b in self.backups]
+
+    @rpc_method("read")
+    def backup_info(self, name: str, include_content: bool = False) -> Optional[Dict]:
+        self._op("backup.info")
+        for backup in self.backups:
+            if backup["filename"] == name:
+                info = BackupManager.info_entry(backup)
+                if include_content:
+                    info["content"] = self.contents[name]
+                return info
+        return None
+
+    @rpc_method("write")
+    def backup_create(self, description: str = "") -> str:
+        self._op("backup.create")
+        return self._snapshot(description)
+
+    @rpc_method("write")
+    def backup_restore(self, name: str) -> bool:
+        self._op("backup.restore")
+        self._find_backup(name)
+        self._snapshot("Auto-backup antes de restaurar")
+        self.exports_text = self.contents[name]
+        return True
+
+    @rpc_method("write")
+    def backup_delete(self, name: str) -> bool:
+        self._op("backup.delete")
+        self.backups.remove(self._find_backup(name))
+        del self.contents[name]
+        return True
+
+    @rpc_method("write")
+    def backup_prune(self, dry_run: bool = False) -> Dict:
+        self._op("backup.prune")
+        kept, removed = DEFAULT_RETENTION.select(self.backups)
+        # Un objeto por contenido distinto, como en el almacén real
+        garbage = {r["sha256"] for r in removed} - {r["sha256"] for r in kept}
+        result = {"kept": len(kept), "removed": [r["filename"] for r in removed],
+                  "objects_removed": len(garbage) if removed else 0}
+        if removed and not dry_run:
+            self.backups = kept
+            for record in removed:
+                del self.contents[record["filename"]]
+        return result
+
+    @rpc_method("read")
+    def mount_list(self, health: bool = False) -> List[Dict]:
+        self._op("mount.list")
+        mounts = [dict(m) for m in self.mounts]
+        if health:
+            for m in mounts:
+                m["health"] = HEALTHY
+                m["latency"] = 0.0
+        return mounts
+
+    @rpc_method("write")
+    def mount_mount(self, server: str, remote_path: str, mount_point: str,
+                    options: str = "") -> bool:
+        self._op("mount.mount")
+        if any(m["mount_point"] == mount_point for m in self.mounts):
+            raise MountError(f"Ya hay algo montado en {mount_point}")
+        self.mounts.append({"server": server, "remote_path": remote_path,
+                            "mount_point": mount_point, "type": "nfs4",
+                            "options": options or "rw,sync"})
+        return True
+
+    @rpc_method("write")
+    def mount_unmount(self, mount_point: str, force: bool = False, lazy: bool = False) -> bool:
+        self._op("mount.unmount")
+        for m in self.mounts:
+            if m["mount_point"] == mount_point:
+                self.mounts.remove(m)
+                return True
+        raise MountError(f"{mount_point} no está montado")
+
+    @rpc_method("read")
+    def service_status(self) -> Dict:
+        self._op("service.status")
+        return dict(self.service, status_output="",
+                    running=self.service["active"] == "active")
+
+    @rpc_method("read")
+    def service_exports_active(self) -> List[Dict]:
+        self._op("service.exports_active")
+        return [{"path": e["path"], "client": h["name"], "options": h["options"].strip("()")}
+                for e in ExportsManager.parse_text(self.exports_text) for h in e["hosts"]]
+
+    @rpc_method("read")
+    def service_clients(self) -> List[Dict]:
+        self._op("service.clients")
+        return []
+
+    @rpc_method("write")
+    def service_start(self) -> bool:
+        self._op("service.start")
+        self.service["active"] = "active"
+        return True
+
+    @rpc_method("write")
+    def service_stop(self) -> bool:
+        self._op("service.stop")
+        self.service["active"] = "inactive"
+        return True
+
+    @rpc_method("write")
+    def service_restart(self) -> bool:
+        self._op("service.restart")
+        self.service["active"] = "active"
+        return True
+
+
+def backend_methods(backend: Any) -> Dict[str, Tuple[Callable, str]]:
+    """{"exports.list": (método, "read"), ...} de un backend"""
+    methods = {}
+    for attr in dir(backend):
+        func = getattr(backend, attr)
+        mode = getattr(func, "rpc_mode", None)
+        if mode:
+            methods[attr.replace("_", ".", 1)] = (func, mode)
+    return methods
+
+
+# ----------------------------------------------------------------------
+# Servidor
+# ----------------------------------------------------------------------
+
+class _Connection:
+    def __init__(self, conn: socket.socket, uid: int):
+        self.conn = conn
+        self.uid = uid
+        self.send_lock = threading.Lock()
+        # Orden por conexión: una lectura espera a la última escritura enviada
+        # antes que ella y una escritura a las lecturas enviadas antes
+        self.last_write: Optional[Future] = None
+        self.reads_since_write: List[Future] = []
+        self.pending: List[Future] = []
+
+    def track(self, future: Future) -> None:
+        self.pending.append(future)
+        if len(self.pending) >= 1024:
+            self.pending = [f for f in self.pending if not f.done()]
+
+
+class RpcServer:
+    """Servidor JSON-RPC sobre un socket Unix (ver el docstring del módulo)"""
+
+    def __init__(self, backend: Any = None, path: Optional[str] = None,
+                 group: Optional[str] = None, allowed_uids: Iterable[int] = (),
+                 workers: int = DEFAULT_WORKERS):
+        self.backend = backend if backend is not None else SystemBackend()
+        self.path = path or default_socket_path()
+        self.group = group
+        self.allowed_uids = set(allowed_uids) | {0, os.geteuid()}
+        self.methods = backend_methods(self.backend)
+        self.methods.update({
+            "rpc.ping": (self._ping, "none"),
+            "rpc.methods": (self._list_methods, "none"),
+            "rpc.stats": (self._get_stats, "none"),
+        })
+        self._gid = grp.getgrnam(group).gr_gid if group else None
+        self._rwlock = ReadWriteLock()
+        self._readers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc-read")
+        self._writes: "queue.Queue" = queue.Queue()
+        self._stop = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        self._threads: List[threading.Thread] = []
+        self._conns: set = set()
+        self._started = time.time()
+        self._stats_lock = threading.Lock()
+        self._stats = {"connections": 0, "rejected": 0, "requests": 0,
+                       "reads": 0, "writes": 0, "errors": 0}
+
+    # --- métodos propios ---
+
+    def _ping(self) -> str:
+        return "pong"
+
+    def _list_methods(self) -> Dict[str, str]:
+        return {name: mode for name, (_, mode) in sorted(self.methods.items())}
+
+    def _get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["uptime"] = round(time.time() - self._started, 3)
+        stats["pending_writes"] = self._writes.qsize()
+        stats["cache"] = self.backend.cache_stats()
+        stats["privileged"] = os.geteuid() == 0
+        return stats
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    # --- ciclo de vida ---
+
+    def _bind(self) -> socket.socket:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise RpcError(INTERNAL_ERROR, f"Ya hay un servicio escuchando en {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket de un proceso anterior que ya no existe
+                os.unlink(self.path)
+            finally:
+                probe.close()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o117)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        if self._gid is not None:
+            os.chown(self.path, -1, self._gid)
+        sock.listen(64)
+        sock.settimeout(0.5)
+        return sock
+
+    def start(self) -> "RpcServer":
+        """Abre el socket y atiende en hilos de fondo"""
+        self._sock = self._bind()
+        writer = threading.Thread(target=self._write_loop, name="rpc-write", daemon=True)
+        acceptor = threading.Thread(target=self._accept_loop, name="rpc-accept", daemon=True)
+        self._threads = [writer, acceptor]
+        writer.start()
+        acceptor.start()
+        log.info("Servicio RPC escuchando", extra={
+            "socket": self.path, "backend": type(self.backend).__name__,
+            "privileged": os.geteuid() == 0})
+        return self
+
+    def serve_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._sock is None:
+            return
+        self._stop.set()
+        for thread in self._threads:
+            if thread.name == "rpc-accept":
+                thread.join()
+        self._sock.close()
+        self._sock = None
+        for conn in list(self._conns):
+            try:
+                conn.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        self._writes.put(None)
+        self._readers.shutdown(wait=True)
+        for thread in self._threads:
+            thread.join()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        log.info("Servicio RPC detenido", extra=self._get_stats())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        return False
+
+    # --- conexiones ---
+
+    def _authorized(self, uid: int, gid: int) -> bool:
+        if uid in self.allowed_uids:
+            return True
+        if self._gid is None:
+            return False
+        if gid == self._gid:
+            return True
+        try:
+            return pwd.getpwuid(uid).pw_name in grp.getgrgid(self._gid).gr_mem
+        except KeyError:
+            return False
+
+    def _accept_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.settimeout(None)
+            threading.Thread(target=self._serve_connection, args=(conn,),
+                             name="rpc-conn", daemon=True).start()
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        try:
+            pid, uid, gid = peer_credentials(conn)
+            if not self._authorized(uid, gid):
+                self._count("rejected")
+                log.warning("Conexión RPC rechazada", extra={"pid": pid, "uid": uid})
+                self._send(_Connection(conn, uid), _error_response(
+                    None, RpcError(ACCESS_DENIED, "Acceso denegado")))
+                return
+            self._count("connections")
+            self._conns.add(conn)
+            state = _Connection(conn, uid)
+            reader = conn.makefile("rb")
+            try:
+                while not self._stop.is_set():
+                    line = reader.readline(MAX_MESSAGE + 1)
+                    if not line:
+                        break
+                    if len(line) > MAX_MESSAGE:
+                        self._send(state, _error_response(
+                            None, RpcError(INVALID_REQUEST, "Mensaje demasiado grande")))
+                        break
+                    if line.strip():
+                        self._handle_line(state, line)
+                # El cliente puede cerrar su lado de escritura y seguir
+                # esperando respuestas: se envían todas antes de cerrar
+                wait(state.pending)
+            finally:
+                reader.close()
+        except OSError:
+            pass
+        finally:
+            self._conns.discard(conn)
+            conn.close()
+
+    def _handle_line(self, state: _Connection, line: bytes) -> None:
+        try:
+            message = json.loads(line.decode("utf-8"))
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send(state, _error_response(None, RpcError(PARSE_ERROR, f"JSON inválido: {e}")))
+            return
+
+        if isinstance(message, list):
+            if not message:
+                self._send(state, _error_response(None, RpcError(INVALID_REQUEST, "Lote vacío")))
+                return
+            futures = [self._submit(state, item) for item in message]
+            done = Future()
+            remaining = [len(futures)]
+            lock = threading.Lock()
+
+            def collect(_):
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0]:
+                        return
+                responses = [f.result() for f in futures if f.result() is not None]
+                if responses:
+                    self._send(state, responses)
+                done.set_result(None)
+
+            for f in futures:
+                f.add_done_callback(collect)
+            state.track(done)
+        else:
+            future = self._submit(state, message)
+            future.add_done_callback(
+                lambda f: f.result() is not None and self._send(state, f.result()))
+            state.track(future)
+
+    def _submit(self, state: _Connection, request: Any) -> Future:
+        """Encola una petición y devuelve un Future con su respuesta (None si es notificación)"""
+        self._count("requests")
+        future = Future()
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            future.set_result(_error_response(
+                None, RpcError(INVALID_REQUEST, "Se esperaba un objeto con 'method'")))
+            return future
+
+        req_id = request.get("id")
+        notify = "id" not in request
+        params = request.get("params", {})
+        entry = self.methods.get(request["method"])
+        if entry is None:
+            error = RpcError(METHOD_NOT_FOUND, f"Método desconocido: {request['method']}")
+        elif not isinstance(params, (dict, list)):
+            error = RpcError(INVALID_PARAMS, "'params' debe ser un objeto o una lista")
+        else:
+            error = None
+        if error is not None:
+            self._count("errors")
+            future.set_result(None if notify else _error_response(req_id, error))
+            return future
+
+        func, mode = entry
+        if mode == "write":
+            self._count("writes")
+            barrier = state.reads_since_write
+            state.last_write = future
+            state.reads_since_write = []
+            self._writes.put((future, barrier, func, params, req_id, notify))
+        elif mode == "read":
+            self._count("reads")
+            try:
+                inner = self._readers.submit(self._run_read, state.last_write,
+                                             func, params, req_id, notify)
+            except RuntimeError:
+                # El servicio se está deteniendo
+                future.set_result(None if notify else _error_response(
+                    req_id, RpcError(INTERNAL_ERROR, "El servicio se está deteniendo")))
+                return future
+            inner.add_done_callback(lambda f: future.set_result(f.result()))
+            state.reads_since_write.append(future)
+        else:
+            future.set_result(self._call(func, params, req_id, notify))
+        return future
+
+    def _run_read(self, barrier: Optional[Future], func, params, req_id, notify):
+        if barrier is not None:
+            barrier.result()
+        with self._rwlock.read():
+            return self._call(func, params, req_id, notify)
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            future, barrier, func, params, req_id, notify = item
+            # Antes de tomar el cerrojo, para no bloquear a esas lecturas
+            wait(barrier)
+            with self._rwlock.write():
+                try:
+                    response = self._call(func, params, req_id, notify)
+                finally:
+                    self.backend.invalidate()
+            future.set_result(response)
+
+    def _call(self, func: Callable, params, req_id, notify: bool) -> Optional[Dict]:
+        args, kwargs = (params, {}) if isinstance(params, list) else ((), params)
+        try:
+            inspect.signature(func).bind(*args, **kwargs)
+        except TypeError as e:
+            result = _error_response(req_id, RpcError(INVALID_PARAMS, str(e)))
+        else:
+            try:
+                result = {"jsonrpc": "2.0", "id": req_id, "result": func(*args, **kwargs)}
+            except _APP_ERRORS as e:
+                result = _error_response(req_id, RpcError(APP_ERROR, str(e),
+                                                          {"type": type(e).__name__}))
+            except Exception as e:
+                log.exception("Error inesperado en una llamada RPC")
+                result = _error_response(req_id, RpcError(INTERNAL_ERROR, str(e),
+                                                          {"type": type(e).__name__}))
+        if "error" in result:
+            self._count("errors")
+        return None if notify else result
+
+    def _send(self, state: _Connection, message: Any) -> None:
+        data = json.dumps(message, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        with state.send_lock:
+            try:
+                state.conn.sendall(data)
+            except OSError:
+                pass
+
+
+def _error_response(req_id: Any, error: RpcError) -> Dict:
+    return {"jsonrpc": "2.0", "id": req_id, "error": error.to_dict()}
+
+
+# ----------------------------------------------------------------------
+# Cliente
+# ----------------------------------------------------------------------
+
+class RpcClient:
+    """
+    Cliente del servicio. Mantiene la conexión abierta entre llamadas:
+
+        with RpcClient() as rpc:
+            rpc.call("exports.apply", changes=[...])
+            listado, estado = rpc.pipeline([("exports.list", {}), ("service.status", {})])
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: Optional[float] = 60.0):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._next_id = 0
+        self._responses: Dict[Any, Dict] = {}
+
+    def connect(self) -> "RpcClient":
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._sock = sock
+            self._reader = sock.makefile("rb")
+        return self
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = self._reader = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _send(self, method: str, params: Any) -> int:
+        self.connect()
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        self._sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        return self._next_id
+
+    def _receive(self, req_id: int) -> Dict:
+        while req_id not in self._responses:
+            line = self._reader.readline()
+            if not line:
+                self.close()
+                raise RpcError(INTERNAL_ERROR, "El servicio cerró la conexión")
+            message = json.loads(line.decode("utf-8"))
+            for response in (message if isinstance(message, list) else [message]):
+                if response.get("id") is None and "error" in response:
+                    error = response["error"]
+                    raise RpcError(error["code"], error["message"], error.get("data"))
+                self._responses[response.get("id")] = response
+        return self._responses.pop(req_id)
+
+    @staticmethod
+    def _result(response: Dict) -> Any:
+        if "error" in response:
+            error = response["error"]
+            return RpcError(error["code"], error["message"], error.get("data"))
+        return response.get("result")
+
+    def call(self, method: str, *args, **params) -> Any:
+        """Llama a un método y devuelve su resultado (lanza RpcError si falla)"""
+        result = self._result(self._receive(self._send(method, list(args) if args else params)))
+        if isinstance(result, RpcError):
+            raise result
+        return result
+
+    def pipeline(self, calls: Iterable[Tuple[str, Any]]) -> List[Any]:
+        """
+        Envía todas las llamadas sin esperar y devuelve sus resultados en el
+        mismo orden. Las que fallan aparecen como objetos RpcError.
+        """
+        ids = [self._send(method, params if params is not None else {})
+               for method, params in calls]
+        return [self._result(self._receive(req_id)) for req_id in ids]
+
+
+# ----------------------------------------------------------------------
+# Línea de comandos
+# ----------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m util.rpc",
+                                     description="Servicio JSON-RPC local de gestión NFS")
+    parser.add_argument("--socket", help=f"ruta del socket (por defecto {default_socket_path()})")
+    sub = parser.add_subparsers(dest="command", metavar="COMANDO")
+    sub.required = True
+
+    p = sub.add_parser("serve", help="arranca el servicio")
+    p.add_argument("--group", help="grupo cuyos miembros pueden conectarse")
+    p.add_argument("--allow-uid", type=int, action="append", default=[],
+                   help="uid adicional autorizado (repetible)")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="lecturas simultáneas")
+    p.add_argument("--fake", action="store_true", help="backend en memoria, sin NFS")
+    p.add_argument("--fake-exports", help="contenido inicial de exports para --fake (archivo)")
+
+    p = sub.add_parser("call", help="llama a un método del servicio")
+    p.add_argument("method")
+    p.add_argument("params", nargs="?", default="{}", help="parámetros en JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        if args.fake:
+            text = ""
+            if args.fake_exports:
+                with open(args.fake_exports, "r", encoding="utf-8") as f:
+                    text = f.read()
+            backend = FakeBackend(text)
+        else:
+            backend = SystemBackend()
+        server = RpcServer(backend, args.socket, args.group, args.allow_uid, args.workers)
+        signal.signal(signal.SIGTERM, lambda *_: server._stop.set())
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        with RpcClient(args.socket) as client:
+            params = json.loads(args.params)
+            if isinstance(params, list):
+                result = client.call(args.method, *params)
+            else:
+                result = client.call(args.method, **params)
+    except (RpcError, OSError, ValueError) as e:
+        data = {"error": str(e)}
+        if isinstance(e, RpcError):
+            data.update(code=e.code, data=e.data)
+        sys.stderr.write(json.dumps(data, ensure_ascii=False) + "\n")
+        return 1
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
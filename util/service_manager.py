@@ -4,10 +4,13 @@ ServiceManager
 Módulo para gestionar el servicio NFS (start, stop, restart, status, enable, disable)
 """
 
+import os
 import subprocess
 import shutil
 from typing import Dict, List, Optional
 
+from util.instrumentation import Instrumentation
+
 
 class ServiceError(Exception):
     pass
@@ -21,6 +24,9 @@ class ServiceManager:
     @staticmethod
     def _get_privilege_command():
         """Detecta qué comando usar para privilegios (pkexec o sudo)"""
+        if os.geteuid() == 0:
+            # Ya somos root (p. ej. el servicio RPC): sin pkexec/sudo
+            return None
         if ServiceManager._privilege_cmd is None:
             if shutil.which("pkexec"):
                 ServiceManager._privilege_cmd = "pkexec"
@@ -34,8 +40,8 @@ class ServiceManager:
     def _run_privileged(cmd: List[str], timeout: int = 10) -> subprocess.CompletedProcess:
         """Ejecuta un comando con privilegios"""
         priv_cmd = ServiceManager._get_privilege_command()
-        return subprocess.run(
-            [priv_cmd] + cmd,
+        return Instrumentation.run(
+            ([priv_cmd] if priv_cmd else []) + cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
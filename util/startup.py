@@ -0,0 +1,57 @@
+"""
+Startup
+-------
+Medición del arranque de la aplicación: main.py marca el inicio lo antes
+posible y cada fase (imports, ventana creada, primera ventana visible) deja
+su marca. Al mostrarse la primera ventana se registra el informe en el log
+y, con NFS_MANAGER_STARTUP_REPORT=1, también se escribe en stderr.
+"""
+
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+_start = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+_reported = False
+
+
+def begin(t0: Optional[float] = None) -> None:
+    """Fija el instante inicial (por defecto, la importación de este módulo)"""
+    global _start
+    if t0 is not None:
+        _start = t0
+    del _marks[:]
+
+
+def mark(name: str) -> None:
+    _marks.append((name, time.perf_counter()))
+
+
+def report() -> Dict:
+    """{"total_ms", "phases": [{"name", "ms", "at_ms"}]}"""
+    phases = []
+    previous = _start
+    for name, when in _marks:
+        phases.append({"name": name, "ms": round((when - previous) * 1000, 1),
+                       "at_ms": round((when - _start) * 1000, 1)})
+        previous = when
+    return {"total_ms": phases[-1]["at_ms"] if phases else 0.0, "phases": phases}
+
+
+def first_window() -> None:
+    """Llamar cuando la primera ventana ya es visible; informa una sola vez"""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    mark("first_window")
+    data = report()
+
+    from util.log import get_logger
+    get_logger(__name__).info("Primera ventana en %.0f ms", data["total_ms"], extra=data)
+    if os.environ.get("NFS_MANAGER_STARTUP_REPORT", "") not in ("", "0"):
+        for phase in data["phases"]:
+            sys.stderr.write(f"[startup] {phase['name']:<16} +{phase['ms']:8.1f} ms "
+                             f"({phase['at_ms']:.1f} ms)\n")
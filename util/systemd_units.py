@@ -0,0 +1,161 @@
+"""
+SystemdUnits
+------------
+Generación de pares de unidades systemd .mount + .automount para montajes
+NFS bajo demanda: el recurso se monta al primer acceso y se desmonta tras
+un tiempo de inactividad, sin bloquear el arranque si el servidor no responde.
+"""
+
+import os
+import string
+from typing import Dict, List, Optional
+
+UNIT_DIR = "/etc/systemd/system"
+MANAGED_MARKER = "# Managed by nfs-manager"
+
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_MOUNT_TIMEOUT = 30
+
+_SAFE_CHARS = set(string.ascii_letters + string.digits + ":_.")
+
+
+def escape_path(path: str) -> str:
+    """
+    Equivalente a 'systemd-escape --path': convierte una ruta absoluta en el
+    nombre base de unidad que systemd exige para .mount/.automount.
+    """
+    parts = [p for p in path.split("/") if p]
+    if not parts:
+        return "-"
+    escaped = []
+    for part in parts:
+        out = []
+        for i, ch in enumerate(part):
+            if ch in _SAFE_CHARS and not (i == 0 and ch == "."):
+                out.append(ch)
+            else:
+                out.extend("\\x%02x" % b for b in ch.encode("utf-8"))
+        escaped.append("".join(out))
+    return "-".join(escaped)
+
+
+def unit_names(mount_point: str) -> Dict[str, str]:
+    """Devuelve los nombres {'mount': ..., 'automount': ...} de un punto de montaje."""
+    base = escape_path(mount_point)
+    return {"mount": base + ".mount", "automount": base + ".automount"}
+
+
+class AutomountUnit:
+    """Describe un montaje NFS bajo demanda y genera sus dos unidades."""
+
+    def __init__(self, server: str, remote_path: str, mount_point: str,
+                 options: str = "", idle_timeout: int = DEFAULT_IDLE_TIMEOUT,
+                 mount_timeout: int = DEFAULT_MOUNT_TIMEOUT,
+                 after: Optional[List[str]] = None, fstype: str = "nfs"):
+        if not mount_point.startswith("/"):
+            raise ValueError(f"El punto de montaje debe ser absoluto: {mount_point}")
+        self.server = server
+        self.remote_path = remote_path
+        self.mount_point = os.path.normpath(mount_point)
+        self.options = options or "rw,sync"
+        self.idle_timeout = int(idle_timeout)
+        self.mount_timeout = int(mount_timeout)
+        self.after = list(after or [])
+        self.fstype = fstype
+
+    @property
+    def what(self) -> str:
+        return f"{self.server}:{self.remote_path}"
+
+    @property
+    def names(self) -> Dict[str, str]:
+        return unit_names(self.mount_point)
+
+    def _options(self) -> str:
+        """Opciones de montaje sin las claves que gestiona la propia unidad."""
+        opts = [o for o in self.options.split(",")
+                if o and not o.startswith("x-systemd.")
+                and o not in ("noauto", "auto", "_netdev")]
+        return ",".join(opts + ["_netdev"])
+
+    def _dependencies(self) -> List[str]:
+        lines = [
+            "After=network-online.target remote-fs-pre.target",
+            "Wants=network-online.target",
+        ]
+        if self.after:
+            lines.append("RequiresMountsFor=" + " ".join(self.after))
+        return lines
+
+    def render_mount(self) -> str:
+        lines = [
+            MANAGED_MARKER,
+            "[Unit]",
+            f"Description=NFS {self.what} en {self.mount_point}",
+        ] + self._dependencies() + [
+            "",
+            "[Mount]",
+            f"What={self.what}",
+            f"Where={self.mount_point}",
+            f"Type={self.fstype}",
+            f"Options={self._options()}",
+            # Equivalente a x-systemd.mount-timeout= en fstab
+            f"TimeoutSec={self.mount_timeout}",
+            "",
+        ]
+        return "\n".join(lines)
+
+    def render_automount(self) -> str:
+        lines = [
+            MANAGED_MARKER,
+            "[Unit]",
+            f"Description=Automontaje de {self.what} en {self.mount_point}",
+        ] + self._dependencies() + [
+            "Before=remote-fs.target",
+            "",
+            "[Automount]",
+            f"Where={self.mount_point}",
+            f"TimeoutIdleSec={self.idle_timeout}",
+            "",
+            "[Install]",
+            "WantedBy=remote-fs.target",
+            "",
+        ]
+        return "\n".join(lines)
+
+    def render(self) -> Dict[str, str]:
+        """Devuelve {nombre_de_unidad: contenido} para las dos unidades."""
+        names = self.names
+        return {
+            names["mount"]: self.render_mount(),
+            names["automount"]: self.render_automount(),
+        }
+
+    def fstab_options(self) -> str:
+        """Opciones equivalentes para una línea de fstab con x-systemd.automount."""
+        return ",".join([
+            self._options(), "noauto", "x-systemd.automount",
+            f"x-systemd.idle-timeout={self.idle_timeout}",
+            f"x-systemd.mount-timeout={self.mount_timeout}",
+        ])
+
+    @staticmethod
+    def parse_mount_unit(text: str) -> Optional[Dict]:
+        """Lee una unidad .mount gestionada y devuelve sus campos principales."""
+        if MANAGED_MARKER not in text:
+            return None
+        info = {}
+        for line in text.splitlines():
+            if "=" in line and not line.startswith("#"):
+                key, value = line.split("=", 1)
+                info[key.strip()] = value.strip()
+        what = info.get("What", "")
+        server, _, remote_path = what.partition(":")
+        return {
+            "server": server,
+            "remote_path": remote_path or "/",
+            "mount_point": info.get("Where", ""),
+            "type": info.get("Type", "nfs"),
+            "options": info.get("Options", ""),
+            "mount_timeout": info.get("TimeoutSec", ""),
+        }